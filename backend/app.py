@@ -2,17 +2,29 @@
 from flask import Flask
 from backend.routes.upload_routes import upload_bp
 from backend.routes.query_routes import query_bp
+from backend.routes.ops_routes import ops_bp
+from backend.routes.report_routes import report_bp
+from backend.services import embedder
+from backend.services.reranker import get_reranker
+from backend.config import EMBED_WARMUP, MAX_UPLOAD_BYTES
 from flask_cors import CORS
 import os
 
 def create_app():
     app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES  # bodies beyond this are rejected with 413
     CORS(app, resources={r"/*": {"origins": "*"}})
-    app.register_blueprint(upload_bp)   # /upload
-    app.register_blueprint(query_bp)    # /analyze, /query, /report/<doc_id>
+    app.register_blueprint(upload_bp)   # /upload, /uploads (resumable sessions)
+    app.register_blueprint(query_bp)    # /analyze, /jobs/<job_id>, /query, /query/stream, /query/batch, /search, /compare
+    app.register_blueprint(report_bp)   # /report/<doc_id>, /report/<doc_id>/{view,summary,flags,clauses}
+    app.register_blueprint(ops_bp)      # /healthz, /readyz, /metrics
     # Ensure data directories exist
     os.makedirs("data/uploads", exist_ok=True)
     os.makedirs("data/reports", exist_ok=True)
+    if EMBED_WARMUP:
+        embedder.warm_up(background=True)
+        if get_reranker():
+            get_reranker().warm_up(background=True)
     return app
 
 if __name__ == "__main__":
@@ -4,17 +4,131 @@ from pathlib import Path
 # Base paths
 BASE_DIR = Path(__file__).parent.parent.resolve()
 UPLOAD_DIR = BASE_DIR / "data" / "uploads"
+# Uploaded content is stored once per SHA-256 under BLOB_DIR; names in UPLOAD_DIR are hard links
+BLOB_DIR = UPLOAD_DIR / ".blobs"
+UPLOAD_TMP_DIR = UPLOAD_DIR / ".tmp"
 REPORTS_DIR = BASE_DIR / "data" / "reports"
 CHROMA_PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR", None)
+# Vector layout: "per_document" (one collection per doc_id) or "shared" (all documents in
+# SHARED_COLLECTION, split into COLLECTION_SHARDS collections by doc_id, filtered by metadata)
+VECTOR_LAYOUT = os.environ.get("VECTOR_LAYOUT", "per_document")
+SHARED_COLLECTION = os.environ.get("SHARED_COLLECTION", "clauses")
+COLLECTION_SHARDS = int(os.environ.get("COLLECTION_SHARDS", 1))
+DEFAULT_TENANT = os.environ.get("DEFAULT_TENANT", "default")
+# Vector store backend: "chroma" or "numpy" (exact in-process index, memory-mapped .npy files)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = Path(os.environ.get("NUMPY_INDEX_DIR", BASE_DIR / "data" / "vectors"))
+NUMPY_INDEX_DTYPE = os.environ.get("NUMPY_INDEX_DTYPE", "float32")  # or "float16" to halve memory
+# Document manifests live next to the vector data so the two stay in sync
+MANIFEST_DIR = Path(CHROMA_PERSIST_DIR) / "manifests" if CHROMA_PERSIST_DIR else BASE_DIR / "data" / "manifests"
+# Per-document BM25 indexes, also kept next to the vector data
+LEXICAL_INDEX_DIR = Path(CHROMA_PERSIST_DIR) / "lexical" if CHROMA_PERSIST_DIR else BASE_DIR / "data" / "lexical"
 
 # Model & API settings
 EMBED_MODEL = os.environ.get("EMBED_MODEL", "all-MiniLM-L6-v2")
+# Talk to a shared embedding server (python -m backend.services.embed_server) instead of loading the model
+EMBED_SERVER_SOCKET = os.environ.get("EMBED_SERVER_SOCKET", None)
+# Micro-batching of concurrent encode requests
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", 64))
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", 5))
+# In-process micro-batching of concurrent query encodes
+QUERY_ENCODE_MICROBATCH = os.environ.get("QUERY_ENCODE_MICROBATCH", "1") == "1"
+QUERY_ENCODE_MAX_BATCH = int(os.environ.get("QUERY_ENCODE_MAX_BATCH", 32))
+QUERY_ENCODE_MAX_WAIT_MS = float(os.environ.get("QUERY_ENCODE_MAX_WAIT_MS", 2))
+# Load the model in a background thread when the app starts (otherwise on first use)
+EMBED_WARMUP = os.environ.get("EMBED_WARMUP", "1") == "1"
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", None)
 GROQ_URL = os.environ.get("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "compound-beta")
 
+# LLM HTTP client: pooling, retries and circuit breaker
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 16))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+
+# LLM answer cache (temperature 0 requests only)
+ANSWER_CACHE_PATH = Path(os.environ.get("ANSWER_CACHE_PATH", BASE_DIR / "data" / "cache" / "answers.sqlite3"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get("ANSWER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Parsing: large PDFs are extracted by a process pool
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", 0)) or None  # None -> CPUs available to the process
+PARSE_PARALLEL_MIN_PAGES = int(os.environ.get("PARSE_PARALLEL_MIN_PAGES", 200))
+PARSE_PAGES_PER_TASK = int(os.environ.get("PARSE_PAGES_PER_TASK", 32))
+
+# Upper bound on `top_k` accepted by /query, /query/stream, /query/batch and /search
+TOP_K_MAX = int(os.environ.get("TOP_K_MAX", 100))
+
+# /query/batch limits
+QUERY_BATCH_MAX = int(os.environ.get("QUERY_BATCH_MAX", 200))
+QUERY_BATCH_CONCURRENCY = int(os.environ.get("QUERY_BATCH_CONCURRENCY", 4))
+
+# Retrieval: "vector" or "hybrid" (BM25 and vector rankings fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+HYBRID_LEXICAL_WEIGHT = float(os.environ.get("HYBRID_LEXICAL_WEIGHT", 0.5))  # 0 = vector only, 1 = BM25 only
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 20))  # per-ranker candidates fed into the fusion
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+LEXICAL_CACHE_MAX_DOCS = int(os.environ.get("LEXICAL_CACHE_MAX_DOCS", 64))
+
+# Optional cross-encoder rerank of retrieved evidence (disabled when RERANK_MODEL is empty)
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 20))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", 300))  # 0 disables the budget check
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", 32))
+RERANK_MAX_LENGTH = int(os.environ.get("RERANK_MAX_LENGTH", 512))
+RERANK_SKIP_DECAY = float(os.environ.get("RERANK_SKIP_DECAY", 0.9))  # cost estimate shrink per budget skip
+
+# Uploads
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1 << 20))
+UPLOAD_SESSION_TTL = float(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))  # idle resumable sessions expire
+UPLOAD_MAX_PARTS = int(os.environ.get("UPLOAD_MAX_PARTS", 10000))
+
+# Batches buffered between /analyze pipeline stages (parse, scan, embed, insert)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 4))
+
+# Bulk ingestion (python -m backend.ingest)
+INGEST_CHECKPOINT_DIR = BASE_DIR / "data" / "ingest"
+INGEST_EMBED_BATCH = int(os.environ.get("INGEST_EMBED_BATCH", 512))  # clauses per cross-file embedding call
+
+# Paginated report API (/report/<doc_id>/flags, /report/<doc_id>/clauses)
+REPORT_PAGE_SIZE = int(os.environ.get("REPORT_PAGE_SIZE", 100))
+REPORT_PAGE_MAX = int(os.environ.get("REPORT_PAGE_MAX", 1000))
+
+# /compare: minimum cosine similarity for two differing clauses to count as "modified"
+COMPARE_MATCH_THRESHOLD = float(os.environ.get("COMPARE_MATCH_THRESHOLD", 0.8))
+
+# Clauses are embedded and indexed in batches of this size
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+
+# Embedding cache
+EMBED_CACHE_PATH = Path(os.environ.get("EMBED_CACHE_PATH", BASE_DIR / "data" / "cache" / "embeddings.sqlite3"))
+EMBED_CACHE_MAX_BYTES = int(os.environ.get("EMBED_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 10000))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get("QUERY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Risk rule library (JSON)
+RISK_RULES_PATH = Path(os.environ.get("RISK_RULES_PATH", BASE_DIR / "backend" / "services" / "risk_rules.json"))
+
+# Background analysis jobs
+ANALYZE_WORKERS = int(os.environ.get("ANALYZE_WORKERS", 2))
+ANALYZE_QUEUE_SIZE = int(os.environ.get("ANALYZE_QUEUE_SIZE", 16))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", 3600))
+JOB_HISTORY_MAX = int(os.environ.get("JOB_HISTORY_MAX", 500))
+
 # Create folders
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+BLOB_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+LEXICAL_INDEX_DIR.mkdir(parents=True, exist_ok=True)
 if CHROMA_PERSIST_DIR:
     Path(CHROMA_PERSIST_DIR).mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,295 @@
+"""Bulk ingestion of a directory or archive of contracts.
+
+    python -m backend.ingest contracts/ [--workers 8] [--embed-batch 512] [--tenant acme]
+    python -m backend.ingest bundle.zip --checkpoint data/ingest/bundle.jsonl
+
+Each supported file (.pdf, .txt, .md) is stored through the upload store
+(content-addressed, so duplicates cost nothing), then:
+
+- parse, risk scan, BM25 index and report run in a process pool;
+- embeddings are computed in this process, batching clauses across files
+  (--embed-batch) through the clause embedding cache, and inserted into the
+  vector store;
+- the manifest is written, so /analyze, /query and /report treat the
+  document exactly as if it had been analyzed over HTTP.
+
+Every finished document is appended to a JSONL checkpoint. Re-running the
+same command skips documents already recorded with the same source size and
+mtime, so a crashed run resumes where it stopped. A throughput summary
+(docs/s, clauses/s, time per stage) is printed at the end.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from werkzeug.utils import secure_filename
+
+from backend.config import (
+    UPLOAD_DIR, EMBED_MODEL, DEFAULT_TENANT, INGEST_CHECKPOINT_DIR, INGEST_EMBED_BATCH, PARSE_WORKERS,
+)
+from backend.services.analysis import is_current, manifest_record
+from backend.services.embedder import encode
+from backend.services.embedding_cache import encode_cached
+from backend.services.lexical_index import build_lexical_index
+from backend.services.manifest import load_manifest, save_manifest
+from backend.services.parser import available_cpus, parse_document_simple
+from backend.services.retriever import add_clauses, indexed_ids
+from backend.services.risk_analysis import scan_clauses
+from backend.services.upload_store import store_stream
+from backend.services.vector_store import get_vector_store
+from backend.reports.report_generator import build_and_save_report
+
+SUPPORTED = {".pdf", ".txt", ".md"}
+
+
+# --- Sources ---
+
+def _doc_id(relpath: str) -> str:
+    """Flat, filesystem-safe doc id; when flattening renamed the path, a short hash
+    of it keeps e.g. "a/b.pdf" and "a_b.pdf" apart."""
+    relpath = relpath.replace("\\", "/")
+    flat = secure_filename(relpath.replace("/", "_"))
+    if flat == relpath:
+        return flat
+    stem, dot, ext = flat.rpartition(".")
+    tag = hashlib.sha1(relpath.encode("utf-8")).hexdigest()[:8]
+    return f"{stem}-{tag}.{ext}" if dot else f"{flat}-{tag}"
+
+
+def iter_sources(src: Path):
+    """Yield (doc_id, fingerprint, opener) for every supported file in a directory or archive."""
+    if src.is_dir():
+        for p in sorted(src.rglob("*")):
+            if p.is_file() and p.suffix.lower() in SUPPORTED:
+                st = p.stat()
+                yield _doc_id(str(p.relative_to(src))), [st.st_size, st.st_mtime_ns], (lambda p=p: p.open("rb"))
+    elif zipfile.is_zipfile(src):
+        with zipfile.ZipFile(src) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and Path(info.filename).suffix.lower() in SUPPORTED:
+                    yield (_doc_id(info.filename), [info.file_size, list(info.date_time)],
+                           (lambda info=info: zf.open(info)))
+    elif tarfile.is_tarfile(src):
+        with tarfile.open(src) as tf:
+            for member in tf:
+                if member.isfile() and Path(member.name).suffix.lower() in SUPPORTED:
+                    yield (_doc_id(member.name), [member.size, member.mtime],
+                           (lambda member=member: tf.extractfile(member)))
+    else:
+        raise ValueError(f"{src} is not a directory, zip or tar archive")
+
+
+# --- Checkpoint ---
+
+def load_checkpoint(path: Path):
+    """doc_id -> last successful record."""
+    done = {}
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                if rec.get("status") in ("ok", "cached"):
+                    done[rec["doc_id"]] = rec
+                else:
+                    done.pop(rec.get("doc_id"), None)
+    return done
+
+
+class Checkpoint:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = path.open("a", encoding="utf-8")
+
+    def write(self, rec: dict):
+        self._f.write(json.dumps(rec) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+
+# --- Worker (runs in the process pool; never loads the embedding model) ---
+
+def process_document(doc_id: str, path: str):
+    timings = {}
+    t = time.perf_counter()
+    clauses = parse_document_simple(Path(path), parallel=False)
+    timings["parse"], t = time.perf_counter() - t, time.perf_counter()
+    flags = scan_clauses(clauses)
+    timings["scan"], t = time.perf_counter() - t, time.perf_counter()
+    build_lexical_index(doc_id, clauses)
+    timings["lexical"], t = time.perf_counter() - t, time.perf_counter()
+    report_path = build_and_save_report(doc_id, clauses, flags)
+    timings["report"] = time.perf_counter() - t
+    return {"clauses": clauses, "flags": flags, "report_path": report_path, "timings": timings}
+
+
+# --- Driver ---
+
+class Ingestor:
+    def __init__(self, checkpoint: Checkpoint, tenant: str, embed_batch: int):
+        self.checkpoint = checkpoint
+        self.tenant = tenant
+        self.embed_batch = embed_batch
+        self.pending = []  # processed documents waiting for embeddings
+        self.pending_clauses = 0
+        self.stage_time = {}
+        self.counts = {"ok": 0, "cached": 0, "error": 0, "clauses": 0}
+
+    def add_time(self, stage: str, seconds: float):
+        self.stage_time[stage] = self.stage_time.get(stage, 0.0) + seconds
+
+    def record(self, doc: dict, status: str, **extra):
+        self.counts[status] += 1
+        self.checkpoint.write({"doc_id": doc["doc_id"], "status": status, "fingerprint": doc["fingerprint"],
+                               "content_hash": doc.get("content_hash"), **extra})
+
+    def add_processed(self, doc: dict, result: dict):
+        for stage, seconds in result["timings"].items():
+            self.add_time(stage, seconds)
+        doc.update(result)
+        self.pending.append(doc)
+        self.pending_clauses += len(result["clauses"])
+        if self.pending_clauses >= self.embed_batch:
+            self.flush()
+
+    def flush(self):
+        """Embed all pending documents' clauses in one call, then index and record each document."""
+        if not self.pending:
+            return
+        texts = [c["text"] for doc in self.pending for c in doc["clauses"]]
+        t = time.perf_counter()
+        embeddings = encode_cached(encode, EMBED_MODEL, texts) if texts else []
+        self.add_time("embed", time.perf_counter() - t)
+
+        store = get_vector_store()
+        offset = 0
+        for doc in self.pending:
+            clauses = doc["clauses"]
+            emb = embeddings[offset:offset + len(clauses)]
+            offset += len(clauses)
+            t = time.perf_counter()
+            # Only the vectors are replaced; the worker already wrote the BM25 index and report
+            store.delete_document(doc["doc_id"])
+            if clauses:
+                add_clauses(doc["doc_id"], clauses, emb, self.tenant, store)
+            self.add_time("insert", time.perf_counter() - t)
+            t = time.perf_counter()
+            save_manifest(doc["doc_id"], manifest_record(doc["content_hash"], Path(doc["path"]).stat(), clauses,
+                                                         doc["flags"], doc["report_path"]))
+            self.add_time("manifest", time.perf_counter() - t)
+            self.counts["clauses"] += len(clauses)
+            self.record(doc, "ok", clauses=len(clauses), flags=len(doc["flags"]))
+        t = time.perf_counter()
+        store.persist()
+        self.add_time("insert", time.perf_counter() - t)
+        self.pending, self.pending_clauses = [], 0
+
+
+def ingest(src: Path, checkpoint_path: Path, workers: int, embed_batch: int, tenant: str = DEFAULT_TENANT,
+           max_in_flight: int = None, log=print):
+    done = load_checkpoint(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    ing = Ingestor(checkpoint, tenant, embed_batch)
+    max_in_flight = max_in_flight or 2 * workers
+    skipped = 0
+    started = time.perf_counter()
+    last_log = started
+
+    def handle(fut):
+        doc = in_flight.pop(fut)
+        try:
+            result = fut.result()
+        except Exception as e:
+            ing.record(doc, "error", error=repr(e))
+            log(f"  ! {doc['doc_id']}: {e!r}")
+            return
+        ing.add_processed(doc, result)
+
+    in_flight = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for doc_id, fingerprint, opener in iter_sources(src):
+                prev = done.get(doc_id)
+                if prev and prev.get("fingerprint") == fingerprint:
+                    skipped += 1
+                    continue
+                doc = {"doc_id": doc_id, "fingerprint": fingerprint, "path": str(UPLOAD_DIR / doc_id)}
+                t = time.perf_counter()
+                try:
+                    with opener() as f:
+                        doc["content_hash"] = store_stream(f, doc_id)["content_hash"]
+                except Exception as e:
+                    ing.record(doc, "error", error=repr(e))
+                    log(f"  ! {doc_id}: {e!r}")
+                    continue
+                finally:
+                    ing.add_time("store", time.perf_counter() - t)
+
+                m = load_manifest(doc_id)
+                if (is_current(m, doc["content_hash"])
+                        and indexed_ids(doc_id) == {c["clause_id"] for c in m["clauses"]}):
+                    ing.record(doc, "cached", clauses=len(m["clauses"]), flags=len(m["flags"] or []))
+                    continue
+
+                in_flight[pool.submit(process_document, doc_id, doc["path"])] = doc
+                while len(in_flight) >= max_in_flight:
+                    for fut in wait(in_flight, return_when=FIRST_COMPLETED).done:
+                        handle(fut)
+                if time.perf_counter() - last_log > 10:
+                    last_log = time.perf_counter()
+                    n = ing.counts["ok"] + ing.counts["cached"]
+                    log(f"  {n} docs, {ing.counts['clauses']} clauses, {n / (last_log - started):.2f} docs/s")
+            while in_flight:
+                for fut in wait(in_flight, return_when=FIRST_COMPLETED).done:
+                    handle(fut)
+        ing.flush()
+    finally:
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "skipped": skipped, **ing.counts, "stage_time": ing.stage_time}
+
+
+def print_summary(s: dict, workers: int):
+    elapsed = s["elapsed"] or 1e-9
+    print(f"\nIngested {s['ok']} documents ({s['cached']} already current, {s['skipped']} skipped from checkpoint, "
+          f"{s['error']} failed) in {s['elapsed']:.1f}s")
+    print(f"  {s['ok'] / elapsed:.2f} docs/s, {s['clauses'] / elapsed:.1f} clauses/s")
+    print("  stage time (parse/scan/lexical/report are summed over "
+          f"{workers} workers):")
+    for stage, seconds in sorted(s["stage_time"].items(), key=lambda kv: -kv[1]):
+        print(f"    {stage:<9} {seconds:>9.2f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("src", type=Path, help="directory, .zip or .tar(.gz) of contracts")
+    ap.add_argument("--workers", type=int, default=PARSE_WORKERS or available_cpus())
+    ap.add_argument("--embed-batch", type=int, default=INGEST_EMBED_BATCH,
+                    help="clauses accumulated across files per embedding call")
+    ap.add_argument("--checkpoint", type=Path, help="JSONL checkpoint (default: INGEST_CHECKPOINT_DIR/<src>.jsonl)")
+    ap.add_argument("--tenant", default=DEFAULT_TENANT)
+    ap.add_argument("--max-in-flight", type=int, help="documents queued in the pool at once (default 2x workers)")
+    args = ap.parse_args()
+    if not args.src.exists():
+        ap.error(f"{args.src} does not exist")
+
+    checkpoint = args.checkpoint or INGEST_CHECKPOINT_DIR / f"{args.src.name}.jsonl"
+    print(f"Ingesting {args.src} with {args.workers} workers, checkpoint {checkpoint}")
+    summary = ingest(args.src, checkpoint, args.workers, args.embed_batch, args.tenant, args.max_in_flight)
+    print_summary(summary, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
-from jinja2 import Template
+import gzip
+import hashlib
+import os
+import shutil
+from jinja2 import DictLoader, Environment
 from backend.config import REPORTS_DIR
 from pathlib import Path
 
+try:
+    import brotli
+except ImportError:  # brotli is optional; reports are then precompressed with gzip only
+    brotli = None
+
 REPORT_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
@@ -131,10 +140,44 @@ REPORT_TEMPLATE = """
 </html>
 """
 
+# Bump _RENDER_REVISION when rendering changes without a template edit, so
+# reports from the manifest get rebuilt (2: reports list every clause)
+_RENDER_REVISION = "2"
+REPORT_VERSION = hashlib.sha256((_RENDER_REVISION + REPORT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+
+# Compiled on first use and cached by the environment for the life of the process
+_env = Environment(loader=DictLoader({"report.html": REPORT_TEMPLATE}), auto_reload=False)
+
+
+def render_report(fp, doc_id: str, clauses, flags, buffer_size: int = 64):
+    """Stream the report into the text file object `fp`, `buffer_size` template chunks per write."""
+    stream = _env.get_template("report.html").stream(doc_id=doc_id, clauses=clauses, flags=flags)
+    stream.enable_buffering(buffer_size)
+    stream.dump(fp)
+
+
+def precompress(path: Path, chunk_size: int = 1 << 20):
+    """Write <path>.gz (and <path>.br when brotli is installed) next to `path`, streaming."""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".gz.tmp")
+    with path.open("rb") as src, gzip.GzipFile(tmp, "wb", compresslevel=6, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, chunk_size)
+    os.replace(tmp, path.with_name(path.name + ".gz"))
+    if brotli is not None:
+        tmp = path.with_name(path.name + ".br.tmp")
+        comp = brotli.Compressor(quality=9)
+        with path.open("rb") as src, tmp.open("wb") as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                dst.write(comp.process(chunk))
+            dst.write(comp.finish())
+        os.replace(tmp, path.with_name(path.name + ".br"))
+
+
 def build_and_save_report(doc_id: str, clauses, flags):
-    tpl = Template(REPORT_TEMPLATE)
-    html = tpl.render(doc_id=doc_id, clauses=clauses[:30], flags=flags)
     out_path = REPORTS_DIR / f"{doc_id}.html"
-    with out_path.open("w", encoding="utf-8") as f:
-        f.write(html)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        render_report(f, doc_id, clauses, flags)
+    os.replace(tmp_path, out_path)
+    precompress(out_path)
     return str(out_path)
@@ -0,0 +1,169 @@
+"""Paginated report data and the lazy-loading report shell.
+
+The full static report grows with the document; the shell page instead
+fetches /report/<doc_id>/summary once and then /flags and /clauses in
+slices as the reader scrolls. Slices are cut from the document manifest,
+which is parsed once and kept in a small LRU until the file changes.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from jinja2 import DictLoader, Environment
+
+from backend.services.manifest import load_manifest, manifest_path
+
+_CACHE_MAX_DOCS = 16
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def report_data(doc_id: str):
+    """(manifest, version) for an analyzed document, or (None, None).
+
+    `version` changes whenever the manifest is rewritten and is used to
+    build ETags.
+    """
+    try:
+        st = manifest_path(doc_id).stat()
+    except OSError:
+        return None, None
+    version = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    with _cache_lock:
+        hit = _cache.get(doc_id)
+        if hit and hit[1] == version:
+            _cache.move_to_end(doc_id)
+            return hit
+    m = load_manifest(doc_id)
+    if m is None:
+        return None, None
+    with _cache_lock:
+        _cache[doc_id] = (m, version)
+        while len(_cache) > _CACHE_MAX_DOCS:
+            _cache.popitem(last=False)
+    return m, version
+
+
+def summary(doc_id: str, m: dict):
+    tags = {}
+    for f in m.get("flags") or []:
+        tags[f["tag"]] = tags.get(f["tag"], 0) + 1
+    return {
+        "doc_id": doc_id,
+        "num_clauses": len(m.get("clauses") or []),
+        "num_flags": len(m.get("flags") or []),
+        "flags_by_tag": tags,
+    }
+
+
+def page(items, offset: int, limit: int):
+    return {"offset": offset, "limit": limit, "total": len(items), "items": items[offset:offset + limit]}
+
+
+SHELL_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>AI Legal Analyzer Report - {{ doc_id }}</title>
+  <style>
+    body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 40px; background: #f9f9f9; color: #333; }
+    header { text-align: center; padding: 40px; background: #003366; color: white; border-radius: 12px; margin-bottom: 30px; }
+    h2 { color: #003366; margin-top: 30px; }
+    .flag { background: white; padding: 20px; border-radius: 12px; box-shadow: 0 2px 6px rgba(0,0,0,0.1); margin-bottom: 20px; }
+    .flag h3 { margin: 0 0 10px; color: #003366; }
+    pre { background: #f0f0f0; padding: 12px; border-radius: 8px; overflow-x: auto; font-size: 0.95em; white-space: pre-wrap; }
+    .more { padding: 12px; color: #666; text-align: center; }
+  </style>
+</head>
+<body>
+<header>
+  <h1>AI Legal Analyzer Report</h1>
+  <p><strong>Document:</strong> {{ doc_id }}</p>
+  <p id="summary"></p>
+  <p><a style="color: white" href="{{ base }}">Full report</a></p>
+</header>
+<h2>Risk Analysis</h2>
+<div id="flags"></div><div class="more" id="flags-more">Loading…</div>
+<h2>All Clauses</h2>
+<div id="clauses"></div><div class="more" id="clauses-more">Loading…</div>
+<script>
+(function () {
+  var base = {{ base|tojson }}, pageSize = {{ page_size }};
+
+  function el(tag, text, cls) {
+    var e = document.createElement(tag);
+    if (text !== undefined) e.textContent = text;
+    if (cls) e.className = cls;
+    return e;
+  }
+
+  function list(title, items) {
+    var frag = document.createDocumentFragment();
+    frag.appendChild(el("p", title));
+    var ul = el("ul");
+    (items || []).forEach(function (x) { ul.appendChild(el("li", x)); });
+    frag.appendChild(ul);
+    return frag;
+  }
+
+  var render = {
+    flags: function (f) {
+      var d = el("div", undefined, "flag");
+      d.appendChild(el("h3", f.tag + " (" + f.clause_id + ")"));
+      d.appendChild(el("pre", f.match || ""));
+      d.appendChild(el("p", "Impact: " + f.impact + " · Likelihood: " + f.likelihood));
+      d.appendChild(list("Contributing Factors:", f.factors));
+      d.appendChild(list("Mitigation Strategies:", f.mitigation));
+      return d;
+    },
+    clauses: function (c) {
+      var p = el("pre", c.clause_id + ": " + c.text);
+      p.id = c.clause_id;
+      return p;
+    }
+  };
+
+  function section(kind) {
+    var box = document.getElementById(kind), more = document.getElementById(kind + "-more");
+    var offset = 0, loading = false, done = false;
+    function load() {
+      if (loading || done) return;
+      loading = true;
+      fetch(base + "/" + kind + "?offset=" + offset + "&limit=" + pageSize)
+        .then(function (r) { return r.json(); })
+        .then(function (pg) {
+          var frag = document.createDocumentFragment();
+          pg.items.forEach(function (x) { frag.appendChild(render[kind](x)); });
+          box.appendChild(frag);
+          offset += pg.items.length;
+          done = offset >= pg.total || !pg.items.length;
+          more.textContent = done ? (pg.total ? "" : "None") : "Loading…";
+          loading = false;
+          if (done) observer.unobserve(more);
+        })
+        .catch(function () { more.textContent = "Failed to load"; loading = false; });
+    }
+    var observer = new IntersectionObserver(function (entries) {
+      if (entries[0].isIntersecting) load();
+    }, { rootMargin: "800px" });
+    observer.observe(more);
+  }
+
+  fetch(base + "/summary").then(function (r) { return r.json(); }).then(function (s) {
+    document.getElementById("summary").textContent = s.num_clauses + " clauses, " + s.num_flags + " risk flags";
+  });
+  section("flags");
+  section("clauses");
+})();
+</script>
+</body>
+</html>
+"""
+
+SHELL_VERSION = hashlib.sha256(SHELL_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+_env = Environment(loader=DictLoader({"shell.html": SHELL_TEMPLATE}), autoescape=True, auto_reload=False)
+
+
+def render_shell(doc_id: str, base: str, page_size: int) -> str:
+    return _env.get_template("shell.html").render(doc_id=doc_id, base=base, page_size=page_size)
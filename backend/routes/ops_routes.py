@@ -0,0 +1,42 @@
+# backend/routes/ops_routes.py
+from flask import Blueprint, jsonify
+from backend.services import embedder
+from backend.services.embedding_cache import query_cache, get_embedding_cache
+from backend.services.answer_cache import get_answer_cache
+from backend.services.jobs import job_manager
+from backend.services.llm_client import get_llm_client
+from backend.services.reranker import get_reranker
+from backend.services.pipeline import pipeline_stats
+
+ops_bp = Blueprint("ops", __name__)
+
+
+@ops_bp.route("/healthz", methods=["GET"])
+def health():
+    # Liveness: the process is up and serving requests
+    return jsonify({"status": "ok"})
+
+
+@ops_bp.route("/readyz", methods=["GET"])
+def ready():
+    # Readiness: the embedding model and vector store are loaded
+    if embedder.is_ready():
+        return jsonify({"status": "ready"}), 200
+    body = {"status": "warming_up"}
+    if embedder.warmup_error:
+        body = {"status": "error", "error": embedder.warmup_error}
+    return jsonify(body), 503
+
+
+@ops_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({
+        "query_embedding_cache": query_cache.stats(),
+        "clause_embedding_cache": get_embedding_cache().stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "jobs": job_manager.stats(),
+        "llm": get_llm_client().stats(),
+        "encode_batching": embedder.batching_stats(),
+        "rerank": get_reranker().stats() if get_reranker() else None,
+        "pipelines": pipeline_stats(),
+    }), 200
@@ -1,12 +1,17 @@
-from flask import Blueprint, request, jsonify, send_file
-from backend.config import UPLOAD_DIR, REPORTS_DIR
-from backend.services.parser import parse_document_simple
-from backend.services.retriever import index_clauses, retrieve
-from backend.services.risk_analysis import scan_clauses
-from backend.reports.report_generator import build_and_save_report
-from backend.services.embedder import sbert
-import requests
-from backend.config import GROQ_API_KEY, GROQ_URL, GROQ_MODEL
+import json
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from backend.config import UPLOAD_DIR
+from backend.services.analysis import analyze_document
+from backend.services.compare import compare_documents
+from backend.services.manifest import load_manifest
+from backend.services.jobs import job_manager, JobQueueFull
+from backend.services.retriever import retrieve, retrieve_batch, search_portfolio
+from backend.services.generation import generate_answer, stream_answer
+from backend.services.llm_client import LLMError
+from concurrent.futures import ThreadPoolExecutor
+from backend.config import (
+    QUERY_BATCH_MAX, QUERY_BATCH_CONCURRENCY, DEFAULT_TENANT, COMPARE_MATCH_THRESHOLD, TOP_K_MAX,
+)
 
 query_bp = Blueprint("query", __name__)
 
@@ -20,11 +25,23 @@ def analyze():
     if not path.exists():
         return jsonify({"error": "file not found"}), 404
 
-    clauses = parse_document_simple(path)
-    index_clauses(filename, clauses)
-    flags = scan_clauses(clauses)
-    report_path = build_and_save_report(filename, clauses, flags)
-    return jsonify({"doc_id": filename, "num_clauses": len(clauses), "flags": flags, "report_path": report_path}), 200
+    try:
+        job = job_manager.submit(analyze_document, filename, path, key=filename,
+                                 tenant=data.get("tenant", DEFAULT_TENANT))
+    except JobQueueFull as e:
+        resp = jsonify({"error": str(e)})
+        resp.headers["Retry-After"] = "5"
+        return resp, 429
+    return jsonify({"job_id": job.id, "doc_id": filename, "status": job.status,
+                    "status_url": f"/jobs/{job.id}"}), 202
+
+
+@query_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
 
 @query_bp.route("/query", methods=["POST"])
@@ -32,34 +49,135 @@ def query():
     body = request.get_json() or {}
     doc_id = body.get("doc_id")
     query_text = body.get("query")
-    top_k = int(body.get("top_k", 3))
+    try:
+        top_k = _top_k(body, 3)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not doc_id or not query_text:
+        return jsonify({"error": "doc_id and query are required"}), 400
+
+    hits = retrieve(doc_id, query_text, top_k=top_k, mode=body.get("mode"), rerank=_flag(body.get("rerank")))
+    return jsonify({"answer": generate_answer(query_text, hits), "evidence": hits}), 200
+
+
+def _top_k(body, default: int) -> int:
+    """The `top_k` request field as an integer in 1..TOP_K_MAX; ValueError otherwise."""
+    value = body.get("top_k", default)
+    try:
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        top_k = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("top_k must be an integer")
+    if not 1 <= top_k <= TOP_K_MAX:
+        raise ValueError(f"top_k must be between 1 and {TOP_K_MAX}")
+    return top_k
+
+
+def _flag(value):
+    """Optional boolean request field: None when absent, else true/false (JSON or query string)."""
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@query_bp.route("/query/stream", methods=["GET", "POST"])
+def query_stream():
+    """Server-Sent Events variant of /query.
+
+    Emits one `evidence` event, then `token` events with answer pieces, then
+    `done` with the full answer (or `error` if generation fails midway).
+    """
+    body = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    doc_id = body.get("doc_id")
+    query_text = body.get("query")
+    try:
+        top_k = _top_k(body, 3)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     if not doc_id or not query_text:
         return jsonify({"error": "doc_id and query are required"}), 400
 
-    hits = retrieve(doc_id, query_text, top_k=top_k)
-
-    if not GROQ_API_KEY:
-        return jsonify({"answer": "(No API Key) Evidence only", "evidence": hits})
-
-    payload = {
-        "model": GROQ_MODEL,
-        "messages": [
-            {"role": "system", "content": "You are a strict legal assistant. Use evidence only."},
-            {"role": "user", "content": f"QUESTION: {query_text}\n\nEVIDENCE:\n{hits}"}
-        ],
-        "max_tokens": 512,
-        "temperature": 0.0
-    }
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    r = requests.post(GROQ_URL, json=payload, headers=headers, timeout=60)
-    answer = r.json()["choices"][0]["message"]["content"]
-
-    return jsonify({"answer": answer, "evidence": hits}), 200
-
-
-@query_bp.route("/report/<doc_id>", methods=["GET"])
-def get_report(doc_id):
-    p = REPORTS_DIR / f"{doc_id}.html"
-    if not p.exists():
-        return jsonify({"error": "report not found"}), 404
-    return send_file(str(p), mimetype="text/html")
+    hits = retrieve(doc_id, query_text, top_k=top_k, mode=body.get("mode"), rerank=_flag(body.get("rerank")))
+
+    def events():
+        yield _sse("evidence", hits)
+        parts = []
+        try:
+            for piece in stream_answer(query_text, hits):
+                parts.append(piece)
+                yield _sse("token", {"text": piece})
+        except LLMError as e:
+            yield _sse("error", {"error": f"generation failed: {e}"})
+            return
+        yield _sse("done", {"answer": "".join(parts)})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@query_bp.route("/query/batch", methods=["POST"])
+def query_batch():
+    body = request.get_json() or {}
+    questions = body.get("questions") or []
+    doc_ids = body.get("doc_ids") or ([body["doc_id"]] if body.get("doc_id") else [])
+    try:
+        top_k = _top_k(body, 3)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not doc_ids or not questions:
+        return jsonify({"error": "doc_id (or doc_ids) and questions are required"}), 400
+    pairs = [(d, q) for d in doc_ids for q in questions]
+    if len(pairs) > QUERY_BATCH_MAX:
+        return jsonify({"error": f"at most {QUERY_BATCH_MAX} (doc_id, question) pairs per batch"}), 400
+
+    all_hits = retrieve_batch(pairs, top_k=top_k, mode=body.get("mode"), rerank=_flag(body.get("rerank")))
+    with ThreadPoolExecutor(max_workers=QUERY_BATCH_CONCURRENCY) as pool:
+        answers = list(pool.map(generate_answer, [q for _, q in pairs], all_hits))
+
+    results = [
+        {"doc_id": d, "query": q, "answer": a, "evidence": h}
+        for (d, q), a, h in zip(pairs, answers, all_hits)
+    ]
+    return jsonify({"results": results}), 200
+
+
+@query_bp.route("/search", methods=["POST"])
+def search():
+    body = request.get_json() or {}
+    query_text = body.get("query")
+    try:
+        top_k = _top_k(body, 10)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not query_text:
+        return jsonify({"error": "query is required"}), 400
+    try:
+        hits = search_portfolio(query_text, top_k=top_k, tenant=body.get("tenant"), doc_ids=body.get("doc_ids"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"query": query_text, "hits": hits}), 200
+
+
+@query_bp.route("/compare", methods=["POST"])
+def compare():
+    body = request.get_json() or {}
+    old_id, new_id = body.get("old_doc_id"), body.get("new_doc_id")
+    if not old_id or not new_id:
+        return jsonify({"error": "old_doc_id and new_doc_id are required"}), 400
+    try:
+        threshold = float(body.get("threshold", COMPARE_MATCH_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({"error": "threshold must be a number"}), 400
+    if not -1.0 <= threshold <= 1.0:  # also rejects NaN
+        return jsonify({"error": "threshold must be a cosine similarity between -1 and 1"}), 400
+    manifests = {}
+    for doc_id in (old_id, new_id):
+        manifests[doc_id] = load_manifest(doc_id)
+        if not manifests[doc_id]:
+            return jsonify({"error": f"{doc_id} has not been analyzed"}), 404
+    return jsonify(compare_documents(manifests[old_id], manifests[new_id], old_id, new_id, threshold)), 200
@@ -0,0 +1,76 @@
+# backend/routes/report_routes.py
+from flask import Blueprint, Response, request, jsonify, send_file, url_for
+from backend.config import REPORTS_DIR, REPORT_PAGE_SIZE, REPORT_PAGE_MAX
+from backend.reports.report_pages import report_data, summary, page, render_shell, SHELL_VERSION
+
+report_bp = Blueprint("report", __name__)
+
+# Precompressed variants written by build_and_save_report, best first
+_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _not_modified(etag: str):
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    return None
+
+
+def _cacheable(resp, etag: str):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate; a matching ETag costs a 304
+    return resp
+
+
+@report_bp.route("/report/<doc_id>", methods=["GET"])
+def get_report(doc_id):
+    p = REPORTS_DIR / f"{doc_id}.html"
+    if not p.exists():
+        return jsonify({"error": "report not found"}), 404
+    st = p.stat()
+    etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+    for encoding, suffix in _ENCODINGS:
+        variant = p.with_name(p.name + suffix)
+        if request.accept_encodings[encoding] and variant.exists() and variant.stat().st_mtime_ns >= st.st_mtime_ns:
+            resp = send_file(str(variant), mimetype="text/html", etag=f"{etag}-{encoding}")
+            resp.headers["Content-Encoding"] = encoding
+            break
+    else:
+        resp = send_file(str(p), mimetype="text/html", etag=etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp.make_conditional(request)
+
+
+@report_bp.route("/report/<doc_id>/view", methods=["GET"])
+def report_shell(doc_id):
+    m, version = report_data(doc_id)
+    if m is None:
+        return jsonify({"error": "report not found"}), 404
+    etag = f"shell-{SHELL_VERSION}-{doc_id}"
+    return _not_modified(etag) or _cacheable(
+        Response(render_shell(doc_id, url_for("report.get_report", doc_id=doc_id), REPORT_PAGE_SIZE), mimetype="text/html"), etag)
+
+
+@report_bp.route("/report/<doc_id>/summary", methods=["GET"])
+def report_summary(doc_id):
+    m, version = report_data(doc_id)
+    if m is None:
+        return jsonify({"error": "report not found"}), 404
+    etag = f"{version}-summary"
+    return _not_modified(etag) or _cacheable(jsonify(summary(doc_id, m)), etag)
+
+
+@report_bp.route("/report/<doc_id>/<any(flags, clauses):kind>", methods=["GET"])
+def report_page(doc_id, kind):
+    m, version = report_data(doc_id)
+    if m is None:
+        return jsonify({"error": "report not found"}), 404
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", REPORT_PAGE_SIZE)), 1), REPORT_PAGE_MAX)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    etag = f"{version}-{kind}-{offset}-{limit}"
+    return _not_modified(etag) or _cacheable(jsonify(page(m.get(kind) or [], offset, limit)), etag)
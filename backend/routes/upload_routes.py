@@ -1,18 +1,103 @@
 # backend/routes/upload_routes.py
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
-from backend.config import UPLOAD_DIR
+from backend.config import MAX_UPLOAD_BYTES
+from backend.services.upload_store import (
+    UploadTooLarge, UploadSessionError, UnknownUpload, MultipartFile, store_stream, create_session, session_info,
+    put_part, complete_session, abort_session,
+)
 
 upload_bp = Blueprint("upload", __name__)
 
+
+def _too_large(e):
+    return jsonify({"success": False, "error": str(e)}), 413
+
+
 @upload_bp.route("/upload", methods=["POST"])
 def upload():
-    f = request.files.get("file")
-    if not f:
-        return jsonify({"success": False, "error": "No file provided"}), 400
-    
-    fname = secure_filename(f.filename)
-    save_to = UPLOAD_DIR / fname
-    f.save(save_to)
-    
-    return jsonify({"success": True, "filename": fname}), 200
+    """Store one file: multipart form field "file", or the raw request body with ?filename=.
+
+    Both are streamed into the blob store; the multipart body is decoded as
+    it is read rather than through request.files, which would spool it first.
+    """
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return _too_large(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    if request.mimetype == "multipart/form-data":
+        try:
+            stream = MultipartFile(request.stream, request.mimetype_params.get("boundary"))
+        except ValueError:
+            return jsonify({"success": False, "error": "No file provided"}), 400
+        name = stream.filename
+    else:
+        name, stream = request.args.get("filename") or request.headers.get("X-Filename"), request.stream
+
+    fname = secure_filename(name or "")
+    if not fname:
+        return jsonify({"success": False, "error": "No filename provided"}), 400
+    try:
+        stored = store_stream(stream, fname)
+    except UploadTooLarge as e:
+        return _too_large(e)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, **stored}), 200
+
+
+# Resumable uploads: create a session, PUT numbered parts (retrying any that
+# fail, checking GET for what has arrived), then complete it.
+
+@upload_bp.route("/uploads", methods=["POST"])
+def start_upload():
+    body = request.get_json(silent=True) or {}
+    fname = secure_filename(body.get("filename") or "")
+    if not fname:
+        return jsonify({"success": False, "error": "No filename provided"}), 400
+    try:
+        size = int(body["size"]) if body.get("size") is not None else None
+        return jsonify(create_session(fname, size)), 201
+    except UploadTooLarge as e:
+        return _too_large(e)
+    except ValueError:
+        return jsonify({"success": False, "error": "size must be an integer"}), 400
+
+
+@upload_bp.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    try:
+        return jsonify(session_info(upload_id)), 200
+    except UploadSessionError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+
+
+@upload_bp.route("/uploads/<upload_id>/parts/<int:part>", methods=["PUT"])
+def upload_part(upload_id, part):
+    try:
+        return jsonify(put_part(upload_id, part, request.stream)), 200
+    except UploadTooLarge as e:
+        return _too_large(e)
+    except UnknownUpload as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except UploadSessionError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@upload_bp.route("/uploads/<upload_id>/complete", methods=["POST"])
+def finish_upload(upload_id):
+    try:
+        return jsonify({"success": True, **complete_session(upload_id)}), 200
+    except UploadTooLarge as e:
+        return _too_large(e)
+    except UnknownUpload as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except UploadSessionError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@upload_bp.route("/uploads/<upload_id>", methods=["DELETE"])
+def cancel_upload(upload_id):
+    try:
+        abort_session(upload_id)
+    except UploadSessionError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    return jsonify({"success": True}), 200
@@ -0,0 +1,187 @@
+"""The `/analyze` pipeline: parse -> (risk scan | embed -> insert) -> report.
+
+Parsing, the risk scan, embedding and vector inserts run concurrently as a
+staged pipeline (see pipeline.py) over the parser's clause batches.
+
+Each stage is skipped when the document manifest shows its inputs are
+unchanged since the last run. A revised upload under the same doc_id is
+re-indexed by diffing content-derived clause ids, so only added or edited
+clauses are embedded, and a file whose content was already analyzed under
+another name reuses that document's parse and risk scan.
+"""
+import time
+from pathlib import Path
+
+from backend.config import EMBED_MODEL, EMBED_BATCH_SIZE, DEFAULT_TENANT, PIPELINE_QUEUE_SIZE
+from backend.services.manifest import file_sha256, load_manifest, save_manifest, find_manifest_by_hash
+from backend.services.parser import iter_clause_batches, PARSER_VERSION
+from backend.services.lexical_index import build_lexical_index, get_lexical_index
+from backend.services.pipeline import Pipeline
+from backend.services.retriever import (
+    add_clauses, embed_clauses, indexed_ids, remove_clauses, reset_index,
+)
+from backend.services.risk_analysis import scan_clauses, RISK_RULES_VERSION
+from backend.reports.report_generator import build_and_save_report, REPORT_VERSION
+
+
+def manifest_record(content_hash: str, st, clauses, flags, report_path):
+    """Manifest contents for a document fully processed with the current versions."""
+    return {
+        "content_hash": content_hash,
+        "file_size": st.st_size,
+        "file_mtime_ns": st.st_mtime_ns,
+        "parser_version": PARSER_VERSION,
+        "embed_model": EMBED_MODEL,
+        "risk_rules_version": RISK_RULES_VERSION,
+        "report_version": REPORT_VERSION,
+        "clauses": clauses,
+        "flags": flags,
+        "report_path": report_path,
+    }
+
+
+def is_current(m: dict, content_hash: str) -> bool:
+    """True when manifest `m` is complete for this content under the current versions."""
+    return bool(
+        m and m.get("content_hash") == content_hash
+        and m.get("parser_version") == PARSER_VERSION
+        and m.get("embed_model") == EMBED_MODEL
+        and m.get("risk_rules_version") == RISK_RULES_VERSION
+        and m.get("report_version") == REPORT_VERSION
+        and m.get("report_path") and Path(m["report_path"]).exists()
+    )
+
+
+def _run_stages(doc_id: str, batches, tenant: str, index: bool, scan: bool, same_model: bool):
+    """Run clause batches through scan and/or embed -> insert concurrently.
+
+    Returns (clauses, flags, index_changes, pipeline stats). With `same_model`
+    the stored clause ids are diffed so only new clauses are embedded and
+    removed ones deleted; otherwise the document's vectors are rebuilt.
+    """
+    clauses, seen = [], set()
+
+    def parsed():
+        for batch in batches:
+            clauses.extend(batch)
+            yield batch
+
+    p = Pipeline("analyze", maxsize=PIPELINE_QUEUE_SIZE)
+    p.source("parse", parsed())
+    if scan:
+        p.stage("scan", scan_clauses, after="parse")
+    if index:
+        if same_model:
+            existing = indexed_ids(doc_id)
+        else:
+            reset_index(doc_id)
+            existing = set()
+
+        def embed(batch):
+            seen.update(c["clause_id"] for c in batch)
+            new = [c for c in batch if c["clause_id"] not in existing]
+            return new, embed_clauses(new) if new else None
+
+        def insert(item):
+            new, embeddings = item
+            if new:
+                add_clauses(doc_id, new, embeddings, tenant)
+            return len(new)
+
+        p.stage("embed", embed, after="parse")
+        p.stage("insert", insert, after="embed")
+    out = p.run()
+
+    flags = [f for batch_flags in out["scan"] for f in batch_flags] if scan else None
+    index_changes = None
+    if index:
+        removed = existing - seen
+        remove_clauses(doc_id, removed)
+        index_changes = {"added": sum(out["insert"]), "removed": len(removed), "unchanged": len(existing & seen)}
+    return clauses, flags, index_changes, p.stats()
+
+
+def analyze_document(doc_id: str, path: Path, progress=None, tenant: str = DEFAULT_TENANT):
+    """Run the analyze pipeline for one uploaded file.
+
+    `progress`, if given, is called as progress(stage, fraction) as stages start.
+    """
+    progress = progress or (lambda stage, fraction=None: None)
+    progress("hash", 0.0)
+    m = load_manifest(doc_id) or {}
+    st = path.stat()
+    # Trust the recorded hash while size and mtime are unchanged; rehash otherwise
+    if m.get("file_size") == st.st_size and m.get("file_mtime_ns") == st.st_mtime_ns:
+        content_hash = m.get("content_hash")
+    else:
+        content_hash = file_sha256(path)
+    stages_run = []
+    index_changes = None
+    reused_from = None
+    # Stored vectors can be reused by id only if they came from the same model
+    same_model = m.get("embed_model") == EMBED_MODEL
+    if m.get("content_hash") != content_hash:
+        # Identical content uploaded under another name: reuse its parse and scan
+        donor = find_manifest_by_hash(content_hash)
+        if donor and donor.get("doc_id") != doc_id and donor.get("parser_version") == PARSER_VERSION:
+            reused_from = donor["doc_id"]
+            m = {k: donor.get(k) for k in ("content_hash", "parser_version", "risk_rules_version", "clauses",
+                                          "flags")}
+
+    parse_ok = m.get("content_hash") == content_hash and m.get("parser_version") == PARSER_VERSION
+    scan_ok = parse_ok and m.get("risk_rules_version") == RISK_RULES_VERSION
+    timings = {}
+    if parse_ok:
+        clauses = m["clauses"]
+        flags = m["flags"] if scan_ok else None
+        # Compare ids, not counts: a donor's clauses can differ from the stored ones yet be as many
+        ids = {c["clause_id"] for c in clauses}
+        need_index = not (same_model and indexed_ids(doc_id) == ids)
+        if need_index or not scan_ok:
+            progress("index" if need_index else "scan", 0.3)
+            batches = (clauses[i:i + EMBED_BATCH_SIZE] for i in range(0, len(clauses), EMBED_BATCH_SIZE))
+            _, new_flags, index_changes, timings["pipeline"] = _run_stages(
+                doc_id, batches, tenant, index=need_index, scan=not scan_ok, same_model=same_model)
+            if need_index:
+                stages_run.append("index")
+            if not scan_ok:
+                flags = new_flags
+                stages_run.append("scan")
+    else:
+        # Parse, scan, embed and insert run concurrently over the parser's batches
+        progress("parse", 0.05)
+        clauses, flags, index_changes, timings["pipeline"] = _run_stages(
+            doc_id, iter_clause_batches(path, EMBED_BATCH_SIZE), tenant, index=True, scan=True,
+            same_model=same_model)
+        stages_run.extend(["parse", "index", "scan"])
+
+    lexical = get_lexical_index(doc_id)
+    if lexical is None or list(lexical.clause_ids) != [c["clause_id"] for c in clauses]:
+        t = time.perf_counter()
+        build_lexical_index(doc_id, clauses)
+        timings["lexical_s"] = round(time.perf_counter() - t, 4)
+
+    progress("report", 0.9)
+    report_path = m.get("report_path")
+    report_ok = (scan_ok and m.get("report_version") == REPORT_VERSION
+                 and report_path and Path(report_path).exists())
+    if not report_ok:
+        t = time.perf_counter()
+        report_path = build_and_save_report(doc_id, clauses, flags)
+        timings["report_s"] = round(time.perf_counter() - t, 4)
+        stages_run.append("report")
+
+    if stages_run:
+        save_manifest(doc_id, manifest_record(content_hash, st, clauses, flags, report_path))
+
+    return {
+        "doc_id": doc_id,
+        "num_clauses": len(clauses),
+        "flags": flags,
+        "report_path": report_path,
+        "cached": not stages_run,
+        "stages_run": stages_run,
+        "index_changes": index_changes,
+        "reused_from": reused_from,
+        "timings": timings,
+    }
@@ -0,0 +1,111 @@
+"""Persistent cache of LLM answers for deterministic (temperature 0) requests.
+
+Answers are keyed on the model, system prompt, question, generation
+parameters and the ids and text hashes of the evidence clauses, and stored
+in SQLite. Entries expire after a TTL; once the stored answers exceed the
+byte budget, the least recently used ones are evicted.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from backend.config import ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_BYTES
+
+
+def answer_key(model: str, system_prompt: str, question: str, hits, params=None) -> str:
+    evidence = [
+        [h["clause_id"], hashlib.sha256(h["text"].encode("utf-8")).hexdigest()]
+        for h in hits
+    ]
+    blob = json.dumps([model, system_prompt, question, evidence, params or {}],
+                      sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path, ttl: float, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY,"
+            " answer TEXT NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answer, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, answer: str):
+        now = time.time()
+        nbytes = len(answer.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, nbytes, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, answer, nbytes, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM answers").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        victims, freed = [], 0
+        for key, nbytes in self._conn.execute("SELECT key, nbytes FROM answers ORDER BY last_used ASC"):
+            victims.append((key,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM answers"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_BYTES)
+    return _cache
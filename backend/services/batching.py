@@ -0,0 +1,119 @@
+"""Dynamic micro-batching of concurrent encode requests.
+
+Callers submit lists of texts and get a Future back. A single worker thread
+waits for the first request, keeps collecting requests until either
+`max_batch_size` texts are gathered or `max_wait` seconds have passed, runs
+the batch function once over all of them, and splits the result back to
+each caller's future.
+
+The batcher records the distribution of batch sizes and of queue wait (time
+from submit until the batch containing the request starts running) so the
+size/wait knobs can be tuned against latency targets.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch_size: int, max_wait: float, name: str = "micro-batcher"):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.requests = 0
+        self._size_hist = {}
+        self._waits = deque(maxlen=2000)
+        self._run_times = deque(maxlen=2000)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts) -> Future:
+        fut = Future()
+        texts = list(texts)
+        if not texts:
+            fut.set_result(np.zeros((0, 0), dtype=np.float32))
+            return fut
+        self._queue.put((texts, fut, time.perf_counter()))
+        return fut
+
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for item_texts, _, _ in batch for t in item_texts]
+            started = time.perf_counter()
+            try:
+                out = np.asarray(self.fn(texts), dtype=np.float32)
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            finally:
+                self._record(batch, len(texts), started)
+            start = 0
+            for item_texts, fut, _ in batch:
+                fut.set_result(out[start:start + len(item_texts)])
+                start += len(item_texts)
+
+    def _record(self, batch, n_texts: int, started: float):
+        bucket = 1
+        while bucket < n_texts:
+            bucket *= 2
+        run_time = time.perf_counter() - started
+        with self._metrics_lock:
+            self.batches += 1
+            self.items += n_texts
+            self.requests += len(batch)
+            self._size_hist[bucket] = self._size_hist.get(bucket, 0) + 1
+            self._waits.extend(started - submitted for _, _, submitted in batch)
+            self._run_times.append(run_time)
+
+    def stats(self):
+        def summary(values):
+            if not values:
+                return None
+            v = sorted(values)
+            pick = lambda p: round(v[min(len(v) - 1, int(p * len(v)))] * 1000, 3)
+            return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+                    "mean": round(sum(v) / len(v) * 1000, 3)}
+
+        with self._metrics_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self.batches,
+                "requests": self.requests,
+                "items": self.items,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+                # texts per batch, bucketed to the next power of two
+                "batch_size_histogram": {f"<={k}": n for k, n in sorted(self._size_hist.items())},
+                "queue_wait_ms": summary(self._waits),
+                "batch_run_ms": summary(self._run_times),
+                "queue_depth": self._queue.qsize(),
+            }
@@ -0,0 +1,128 @@
+"""Clause-level comparison of two analyzed documents (e.g. successive redlines).
+
+Clauses with the same content-derived id are unchanged. The remaining clauses
+are aligned by cosine similarity of the embeddings already in the vector
+store: one similarity matrix for all pairs, then a one-to-one assignment
+(scipy's Hungarian solver when available, greedy best-first otherwise).
+Pairs scoring at least `threshold` are "modified"; everything else is
+"added" or "removed". Risk flags are carried across the alignment to find
+flags that appeared or disappeared.
+"""
+import numpy as np
+
+from backend.config import COMPARE_MATCH_THRESHOLD
+from backend.services.vector_store import get_vector_store
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional
+    linear_sum_assignment = None
+
+
+def _vectors(doc_id: str, ids):
+    """Stored unit vectors for `ids`, plus the ids that were found, in the same order."""
+    got = get_vector_store().get(doc_id, include_embeddings=True)
+    row = {cid: i for i, cid in enumerate(got["ids"])}
+    found = [cid for cid in ids if cid in row]
+    emb = got["embeddings"]
+    if not found or emb is None or not len(emb):
+        return found, np.zeros((0, 0), dtype=np.float32)
+    m = np.asarray(emb, dtype=np.float32)[[row[cid] for cid in found]]
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return found, m / norms
+
+
+def _greedy_assignment(sim, threshold: float):
+    """Greedy best-first matching, vectorized as rounds of mutual best matches.
+
+    A pair that is each side's best remaining candidate is exactly the pair
+    best-first greedy would take next, so each round can take all of them at
+    once instead of walking the sorted n*m pair list in Python.
+    """
+    sim = np.where(sim >= threshold, sim, -np.inf)
+    rows, cols = np.arange(sim.shape[0]), np.arange(sim.shape[1])
+    pairs = []
+    while len(rows) and len(cols):
+        sub = sim[np.ix_(rows, cols)]
+        best_c = sub.argmax(axis=1)
+        best_r = sub.argmax(axis=0)
+        idx = np.arange(len(rows))
+        r = np.nonzero((best_r[best_c] == idx) & np.isfinite(sub[idx, best_c]))[0]
+        if not len(r):
+            break
+        pairs.extend(zip(rows[r].tolist(), cols[best_c[r]].tolist()))
+        rows = np.delete(rows, r)
+        cols = np.delete(cols, best_c[r])
+    return pairs
+
+
+def align(sim, threshold: float):
+    """One-to-one (row, col) pairs with similarity >= threshold."""
+    if sim.size == 0:
+        return []
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-sim)
+        return [(int(r), int(c)) for r, c in zip(rows, cols) if sim[r, c] >= threshold]
+    return _greedy_assignment(sim, threshold)
+
+
+def _flag_diff(old_flags, new_flags, mapping):
+    """Flags of `new` whose (mapped clause, tag) had no counterpart in `old`, and vice versa."""
+    inverse = {n: o for o, n in mapping.items()}
+    old_keys = {(f["clause_id"], f["tag"]) for f in old_flags}
+    new_keys = {(f["clause_id"], f["tag"]) for f in new_flags}
+    appeared = [f for f in new_flags if (inverse.get(f["clause_id"]), f["tag"]) not in old_keys]
+    disappeared = [f for f in old_flags if (mapping.get(f["clause_id"]), f["tag"]) not in new_keys]
+    return appeared, disappeared
+
+
+def compare_documents(old_manifest: dict, new_manifest: dict, old_doc_id: str, new_doc_id: str,
+                      threshold: float = COMPARE_MATCH_THRESHOLD):
+    old_clauses = {c["clause_id"]: c for c in old_manifest["clauses"]}
+    new_clauses = {c["clause_id"]: c for c in new_manifest["clauses"]}
+
+    mapping = {cid: cid for cid in old_clauses if cid in new_clauses}
+    old_rest = [cid for cid in old_clauses if cid not in mapping]
+    new_rest = [cid for cid in new_clauses if cid not in mapping]
+
+    modified = []
+    if old_rest and new_rest:
+        old_ids, a = _vectors(old_doc_id, old_rest)
+        new_ids, b = _vectors(new_doc_id, new_rest)
+        sim = a @ b.T if a.size and b.size else np.zeros((0, 0), dtype=np.float32)
+        for r, c in sorted(align(sim, threshold), key=lambda rc: rc[1]):
+            o, n = old_clauses[old_ids[r]], new_clauses[new_ids[c]]
+            mapping[o["clause_id"]] = n["clause_id"]
+            modified.append({
+                "old_clause_id": o["clause_id"],
+                "new_clause_id": n["clause_id"],
+                "old_position": o.get("position"),
+                "new_position": n.get("position"),
+                "similarity": round(float(sim[r, c]), 4),
+                "old_text": o["text"],
+                "new_text": n["text"],
+            })
+
+    matched_new = set(mapping.values())
+    added = [new_clauses[cid] for cid in new_rest if cid not in matched_new]
+    removed = [old_clauses[cid] for cid in old_rest if cid not in mapping]
+    flags_added, flags_removed = _flag_diff(old_manifest.get("flags") or [], new_manifest.get("flags") or [],
+                                            mapping)
+    return {
+        "old_doc_id": old_doc_id,
+        "new_doc_id": new_doc_id,
+        "summary": {
+            "unchanged": len(old_clauses) - len(old_rest),
+            "modified": len(modified),
+            "added": len(added),
+            "removed": len(removed),
+            "flags_added": len(flags_added),
+            "flags_removed": len(flags_removed),
+        },
+        "modified": modified,
+        "added": added,
+        "removed": removed,
+        "flags_added": flags_added,
+        "flags_removed": flags_removed,
+    }
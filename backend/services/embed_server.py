@@ -0,0 +1,164 @@
+"""Shared embedding server for multi-worker deployments.
+
+One process owns the SentenceTransformer and serves encode requests from
+any number of HTTP worker processes over a Unix socket, so model memory no
+longer scales with the worker count. Concurrent requests are micro-batched
+into single forward passes.
+
+Run it with:
+
+    python -m backend.services.embed_server --socket /tmp/embed.sock
+
+and point the app at it with EMBED_SERVER_SOCKET=/tmp/embed.sock.
+
+Wire protocol: every message is a 4-byte big-endian length followed by the
+payload. A request is a JSON object ({"op": "encode", "texts": [...]},
+{"op": "ping"} or {"op": "stats"}); the reply is a JSON header, and for encode requests a
+second message with the raw float32 matrix described by the header.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+from backend.config import EMBED_MODEL, EMBED_SERVER_SOCKET, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS
+from backend.services.batching import MicroBatcher
+
+_LEN = struct.Struct(">I")
+
+
+class EmbedServerError(Exception):
+    pass
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("embedding server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_msg(sock) -> bytes:
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return _recv_exact(sock, n)
+
+
+def send_msg(sock, payload: bytes):
+    sock.sendall(_LEN.pack(len(payload)) + payload)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                req = json.loads(recv_msg(self.request))
+            except (ConnectionError, OSError):
+                return
+            try:
+                if req.get("op") == "ping":
+                    send_msg(self.request, json.dumps({"ok": True, "model": EMBED_MODEL}).encode())
+                    continue
+                if req.get("op") == "stats":
+                    send_msg(self.request, json.dumps({"ok": True, "batcher": self.server.batcher.stats()}).encode())
+                    continue
+                vecs = self.server.batcher.encode(req["texts"])
+                header = {"ok": True, "shape": list(vecs.shape), "dtype": "float32"}
+                send_msg(self.request, json.dumps(header).encode())
+                send_msg(self.request, np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+            except Exception as e:
+                send_msg(self.request, json.dumps({"ok": False, "error": repr(e)}).encode())
+
+
+class EmbedServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, encode, max_batch_size=EMBED_BATCH_MAX_SIZE,
+                 max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = MicroBatcher(encode, max_batch_size, max_wait_ms / 1000.0, name="embed-server-batcher")
+        super().__init__(socket_path, _Handler)
+
+
+class EmbedClient:
+    """Client for EmbedServer; keeps one connection per calling thread."""
+
+    def __init__(self, socket_path: str, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _drop(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _call(self, req: dict):
+        # One reconnect attempt covers a server restart between calls
+        for attempt in range(2):
+            try:
+                sock = self._conn()
+                send_msg(sock, json.dumps(req).encode("utf-8"))
+                header = json.loads(recv_msg(sock))
+                body = recv_msg(sock) if header.get("ok") and "shape" in header else None
+                break
+            except (ConnectionError, OSError):
+                self._drop()
+                if attempt:
+                    raise
+        if not header.get("ok"):
+            raise EmbedServerError(header.get("error", "embedding server error"))
+        return header, body
+
+    def ping(self) -> dict:
+        return self._call({"op": "ping"})[0]
+
+    def stats(self) -> dict:
+        return self._call({"op": "stats"})[0]["batcher"]
+
+    def encode(self, texts):
+        texts = list(texts)
+        header, body = self._call({"op": "encode", "texts": texts})
+        return np.frombuffer(body, dtype=np.float32).reshape(header["shape"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve batched embeddings over a Unix socket.")
+    ap.add_argument("--socket", default=EMBED_SERVER_SOCKET or "/tmp/ai-legal-embed.sock")
+    ap.add_argument("--max-batch", type=int, default=EMBED_BATCH_MAX_SIZE)
+    ap.add_argument("--max-wait-ms", type=float, default=EMBED_BATCH_MAX_WAIT_MS)
+    args = ap.parse_args()
+
+    from backend.services.embedder import get_model
+    model = get_model()
+    server = EmbedServer(args.socket, lambda texts: model.encode(texts, show_progress_bar=False),
+                         args.max_batch, args.max_wait_ms)
+    print(f"Embedding server ({EMBED_MODEL}) listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,155 @@
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-from backend.config import EMBED_MODEL, CHROMA_PERSIST_DIR
-
-print("Loading embedding model:", EMBED_MODEL)
-sbert = SentenceTransformer(EMBED_MODEL)
-
-# Init chroma client
-try:
-    if CHROMA_PERSIST_DIR:
-        client = chromadb.Client(
-            Settings(chroma_db_impl="duckdb+parquet", persist_directory=CHROMA_PERSIST_DIR)
-        )
-    else:
-        client = chromadb.Client()
-except Exception:
-    client = chromadb.Client()
+"""Embedding model and Chroma client, created lazily on first use.
+
+Nothing heavy happens at import time: the SentenceTransformer is loaded and
+the Chroma client is built the first time they are needed (or by
+`warm_up()`), each behind its own lock so concurrent first callers wait for
+a single initialization.
+
+When EMBED_SERVER_SOCKET is set, `encode()` is served by the shared
+embedding server process instead and the model is never loaded here.
+"""
+import threading
+from backend.config import (
+    EMBED_MODEL, CHROMA_PERSIST_DIR, EMBED_SERVER_SOCKET, VECTOR_BACKEND,
+    QUERY_ENCODE_MICROBATCH, QUERY_ENCODE_MAX_BATCH, QUERY_ENCODE_MAX_WAIT_MS,
+)
+
+_model = None
+_model_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+_embed_client = None
+_embed_client_lock = threading.Lock()
+_query_batcher = None
+_query_batcher_lock = threading.Lock()
+_warmup_thread = None
+warmup_error = None
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                print("Loading embedding model:", EMBED_MODEL)
+                _model = SentenceTransformer(EMBED_MODEL)
+    return _model
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _make_client()
+    return _client
+
+
+def _make_client():
+    import chromadb
+    from chromadb.config import Settings
+    try:
+        if CHROMA_PERSIST_DIR:
+            return chromadb.Client(
+                Settings(chroma_db_impl="duckdb+parquet", persist_directory=CHROMA_PERSIST_DIR)
+            )
+        return chromadb.Client()
+    except Exception:
+        return chromadb.Client()
+
+
+def get_embed_client():
+    global _embed_client
+    if _embed_client is None:
+        with _embed_client_lock:
+            if _embed_client is None:
+                from backend.services.embed_server import EmbedClient
+                _embed_client = EmbedClient(EMBED_SERVER_SOCKET)
+    return _embed_client
+
+
+def encode(texts):
+    """Encode a list of texts with the embedding model; returns a numpy array."""
+    if EMBED_SERVER_SOCKET:
+        return get_embed_client().encode(texts)
+    return get_model().encode(list(texts), show_progress_bar=False)
+
+
+def get_query_batcher():
+    global _query_batcher
+    if _query_batcher is None:
+        with _query_batcher_lock:
+            if _query_batcher is None:
+                from backend.services.batching import MicroBatcher
+                _query_batcher = MicroBatcher(encode, QUERY_ENCODE_MAX_BATCH, QUERY_ENCODE_MAX_WAIT_MS / 1000.0,
+                                              name="query-encode-batcher")
+    return _query_batcher
+
+
+def encode_query(texts):
+    """Encode query texts, merging concurrent callers into one forward pass."""
+    if QUERY_ENCODE_MICROBATCH:
+        return get_query_batcher().encode(texts)
+    return encode(texts)
+
+
+def batching_stats():
+    stats = {"query_encode": _query_batcher.stats() if _query_batcher is not None else None}
+    if EMBED_SERVER_SOCKET:
+        try:
+            stats["embed_server"] = get_embed_client().stats()
+        except Exception as e:
+            stats["embed_server"] = {"error": repr(e)}
+    return stats
+
+
+def is_ready() -> bool:
+    # The Chroma client only matters when Chroma is the vector store
+    if VECTOR_BACKEND == "chroma" and _client is None:
+        return False
+    if EMBED_SERVER_SOCKET:
+        try:
+            return bool(get_embed_client().ping().get("ok"))
+        except Exception:
+            return False
+    return _model is not None
+
+
+def warm_up(background: bool = True):
+    """Load the model (and the Chroma client, when that is the vector store) ahead of the first request."""
+    global _warmup_thread
+
+    def run():
+        global warmup_error
+        try:
+            if VECTOR_BACKEND == "chroma":
+                get_client()
+            encode(["warm-up"])  # loads the model, or checks the embedding server is up
+        except Exception as e:
+            warmup_error = repr(e)
+            raise
+
+    if not background:
+        run()
+        return None
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=run, name="embedder-warmup", daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def __getattr__(name):
+    # Backwards compatibility for `from backend.services.embedder import sbert, client`
+    if name == "sbert":
+        return get_model()
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_or_create_collection(name: str):
+    client = get_client()
     try:
         return client.get_or_create_collection(name=name)
     except AttributeError:
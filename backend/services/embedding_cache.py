@@ -0,0 +1,236 @@
+"""Embedding caches.
+
+Clause embeddings go to a persistent, content-addressed cache keyed on
+(embedding model, sha256 of whitespace-normalized text) and stored as raw
+float32 blobs in a small SQLite database. Query embeddings go to a bounded
+in-process LRU shared across all documents. Both evict least recently used
+entries once over budget.
+"""
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from backend.config import (
+    EMBED_CACHE_PATH, EMBED_CACHE_MAX_BYTES, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES,
+)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", text).strip()
+
+
+def text_key(model_name: str, text: str) -> str:
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_bytes: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache."""
+        found = {}
+        if not keys:
+            return found
+        uniq = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(uniq), 500):
+                chunk = uniq[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})", chunk
+                ).fetchall()
+                for key, dim, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32, count=dim)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, k) for k in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(uniq) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store an iterable of (key, vector) pairs, then enforce the byte budget."""
+        now = time.time()
+        rows = []
+        for key, vec in items:
+            arr = np.asarray(vec, dtype=np.float32).ravel()
+            blob = arr.tobytes()
+            rows.append((key, arr.shape[0], blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vec, nbytes, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        cur = self._conn.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used ASC")
+        victims, freed = [], 0
+        for key, nbytes in cur:
+            victims.append((key,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM embeddings"
+            ).fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_BYTES)
+    return _cache
+
+
+def encode_cached(encode, model_name: str, texts, cache: EmbeddingCache = None):
+    """Encode `texts` with `encode(list_of_texts)`, only for texts not seen before.
+
+    Returns a float32 array of shape (len(texts), dim) in input order.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    cache = cache or get_embedding_cache()
+    keys = [text_key(model_name, t) for t in texts]
+    found = cache.get_many(keys)
+
+    missing = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        fresh = np.asarray(encode(list(missing.values())), dtype=np.float32)
+        new_items = list(zip(missing.keys(), fresh))
+        cache.put_many(new_items)
+        found.update(new_items)
+
+    return np.stack([found[k] for k in keys])
+
+
+class LRUEmbeddingCache:
+    """Thread-safe in-process LRU of embeddings, bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        vec.setflags(write=False)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._data[key] = vec
+            self._bytes += vec.nbytes
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._data), "bytes": self._bytes,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / total, 4) if total else None}
+
+
+query_cache = LRUEmbeddingCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES)
+
+
+def encode_queries(encode, model_name: str, queries, cache: LRUEmbeddingCache = query_cache):
+    """Encode query strings through the in-process LRU.
+
+    Queries are normalized before encoding so that whitespace variants share
+    one entry. Returns a float32 array of shape (len(queries), dim).
+    """
+    normalized = [normalize_text(q) for q in queries]
+    vecs = {}
+    missing = []
+    for q in normalized:
+        if q in vecs:
+            continue
+        vec = cache.get((model_name, q))
+        if vec is None:
+            missing.append(q)
+            vecs[q] = None
+        else:
+            vecs[q] = vec
+    if missing:
+        fresh = np.asarray(encode(missing), dtype=np.float32)
+        for q, vec in zip(missing, fresh):
+            cache.put((model_name, q), vec)
+            vecs[q] = vec
+    return np.stack([vecs[q] for q in normalized])
@@ -0,0 +1,90 @@
+"""Answer generation against the Groq (OpenAI-compatible) chat endpoint."""
+from backend.config import GROQ_API_KEY, GROQ_MODEL
+from backend.services.answer_cache import answer_key, get_answer_cache
+from backend.services.llm_client import get_llm_client, LLMError
+
+SYSTEM_PROMPT = (
+    "You are a strict legal assistant. Answer using ONLY the provided evidence. "
+    "Cite clause ids in square brackets. If insufficient, reply 'INSUFFICIENT_CONTEXT'."
+)
+MAX_TOKENS = 512
+TEMPERATURE = 0.0
+
+
+def format_evidence(hits, max_chars: int = 1000) -> str:
+    lines = []
+    for h in hits:
+        snippet = h["text"][:max_chars].replace("\n", " ")
+        lines.append(f"[{h['clause_id']}]: {snippet}")
+    return "\n\n".join(lines)
+
+
+def evidence_only_answer(hits) -> str:
+    return f"(LLM unavailable) Evidence returned:\n\n{format_evidence(hits, max_chars=400)}"
+
+
+def build_payload(query: str, hits):
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"QUESTION: {query}\n\nEVIDENCE:\n{format_evidence(hits)}"},
+        ],
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+
+
+def generate_answer(query: str, hits):
+    if not GROQ_API_KEY:
+        return "(No API Key) Evidence only"
+
+    cacheable = TEMPERATURE == 0.0
+    if cacheable:
+        cache = get_answer_cache()
+        key = answer_key(GROQ_MODEL, SYSTEM_PROMPT, query, hits,
+                         {"max_tokens": MAX_TOKENS, "temperature": TEMPERATURE})
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    try:
+        answer = get_llm_client().chat(build_payload(query, hits))
+    except LLMError:
+        # Backend down, rate limited past our retries, or circuit open
+        return evidence_only_answer(hits)
+    if cacheable:
+        cache.put(key, answer)
+    return answer
+
+
+def stream_answer(query: str, hits):
+    """Yield the answer in pieces as the LLM produces them.
+
+    Cached and fallback answers are yielded whole. If the stream breaks after
+    some text was already sent, LLMError is raised so the caller can report it.
+    """
+    if not GROQ_API_KEY:
+        yield "(No API Key) Evidence only"
+        return
+
+    cache = get_answer_cache()
+    key = answer_key(GROQ_MODEL, SYSTEM_PROMPT, query, hits,
+                     {"max_tokens": MAX_TOKENS, "temperature": TEMPERATURE})
+    cached = cache.get(key) if TEMPERATURE == 0.0 else None
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        for delta in get_llm_client().stream_chat(build_payload(query, hits)):
+            parts.append(delta)
+            yield delta
+    except LLMError:
+        if parts:
+            raise
+        yield evidence_only_answer(hits)
+        return
+    if TEMPERATURE == 0.0:
+        cache.put(key, "".join(parts))
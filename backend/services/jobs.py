@@ -0,0 +1,143 @@
+"""Background job queue for long-running analysis work.
+
+Jobs are executed by a fixed pool of worker threads fed from a bounded
+queue. When the queue is full, `submit` raises `JobQueueFull` so callers
+can apply backpressure instead of buffering without limit. Finished jobs
+are kept for a while so clients can poll their result, then pruned.
+"""
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from backend.config import ANALYZE_WORKERS, ANALYZE_QUEUE_SIZE, JOB_RESULT_TTL, JOB_HISTORY_MAX
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int, max_queue: int, result_ttl: float, history_max: int):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.history_max = history_max
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._active = {}  # key -> job id of a queued/running job
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        """Queue `fn(*args, progress=..., **kwargs)` and return its Job.
+
+        If a job with the same `key` is still queued or running, that job is
+        returned instead of queueing a duplicate.
+        """
+        with self._lock:
+            self._ensure_workers()
+            self._prune()
+            if key is not None and key in self._active:
+                return self._jobs[self._active[key]]
+            job = Job(key)
+            try:
+                self._queue.put_nowait((job, fn, args, kwargs))
+            except queue.Full:
+                raise JobQueueFull(f"job queue is full ({self._queue.maxsize} pending)")
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active[key] = job.id
+            return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queue_size": self._queue.qsize(),
+                "queue_max": self._queue.maxsize, "jobs": counts}
+
+    def _worker(self):
+        while True:
+            job, fn, args, kwargs = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+
+            def progress(stage, fraction=None):
+                job.stage = stage
+                if fraction is not None:
+                    job.progress = max(job.progress, min(float(fraction), 1.0))
+
+            # finished_at is set before status: once a job reads as finished, _prune may look at it
+            try:
+                job.result = fn(*args, progress=progress, **kwargs)
+                job.progress = 1.0
+                job.finished_at = time.time()
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.finished_at = time.time()
+                job.status = "failed"
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    if job.key is not None and self._active.get(job.key) == job.id:
+                        del self._active[job.key]
+                self._queue.task_done()
+
+    def _prune(self):
+        now = time.time()
+        finished = [j for j in self._jobs.values() if j.finished and j.finished_at is not None]
+        for j in finished:
+            if now - j.finished_at > self.result_ttl:
+                del self._jobs[j.id]
+        finished = sorted((j for j in finished if j.id in self._jobs), key=lambda j: j.finished_at)
+        for j in finished[:max(0, len(finished) - self.history_max)]:
+            del self._jobs[j.id]
+
+
+job_manager = JobManager(ANALYZE_WORKERS, ANALYZE_QUEUE_SIZE, JOB_RESULT_TTL, JOB_HISTORY_MAX)
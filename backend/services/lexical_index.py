@@ -0,0 +1,168 @@
+"""Per-document BM25 inverted index for exact-term retrieval.
+
+Postings are flat arrays: for term t, clause rows and term frequencies live
+in docs[offsets[t]:offsets[t+1]] and tfs[offsets[t]:offsets[t+1]]. An index
+is saved as .npy files plus vocab.json / clauses.json under
+LEXICAL_INDEX_DIR/<doc_id>/ and loaded with mmap_mode="r", so opening one
+is a handful of mmaps rather than a rebuild.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+
+from backend.config import LEXICAL_INDEX_DIR, BM25_K1, BM25_B, LEXICAL_CACHE_MAX_DOCS
+
+# Words, numbers and dotted section numbers ("14.2") are single tokens
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+_ARRAYS = ("offsets", "docs", "tfs", "idf", "doc_len")
+
+
+def tokenize(text: str):
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, terms, clause_ids, texts, offsets, docs, tfs, idf, doc_len):
+        self.term_id = {t: i for i, t in enumerate(terms)}
+        self.terms = terms
+        self.clause_ids = clause_ids
+        self.texts = texts
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.idf = idf
+        self.doc_len = doc_len
+        self.avgdl = float(np.mean(doc_len)) if len(doc_len) else 0.0
+
+    @classmethod
+    def build(cls, clause_ids, texts):
+        clause_ids, texts = list(clause_ids), list(texts)
+        counts = [Counter(tokenize(t)) for t in texts]
+        terms = sorted(set().union(*counts)) if counts else []
+        term_id = {t: i for i, t in enumerate(terms)}
+        postings = [[] for _ in terms]
+        for row, c in enumerate(counts):
+            for term, tf in c.items():
+                postings[term_id[term]].append((row, tf))
+        df = np.array([len(p) for p in postings], dtype=np.int64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=offsets[1:])
+        flat = [x for p in postings for x in p]
+        docs = np.array([r for r, _ in flat], dtype=np.int32)
+        tfs = np.array([tf for _, tf in flat], dtype=np.float32)
+        n = len(texts)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        doc_len = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        return cls(terms, clause_ids, texts, offsets, docs, tfs, idf, doc_len)
+
+    def scores(self, query: str, k1: float = BM25_K1, b: float = BM25_B):
+        scores = np.zeros(len(self.clause_ids), dtype=np.float32)
+        if not len(scores):
+            return scores
+        norm = k1 * (1 - b + b * np.asarray(self.doc_len) / (self.avgdl or 1.0))
+        for term in set(tokenize(query)):
+            t = self.term_id.get(term)
+            if t is None:
+                continue
+            s, e = int(self.offsets[t]), int(self.offsets[t + 1])
+            rows, tf = self.docs[s:e], self.tfs[s:e]
+            scores[rows] += self.idf[t] * tf * (k1 + 1) / (tf + norm[rows])
+        return scores
+
+    def search(self, query: str, top_k: int):
+        """Return [(clause_id, text, score)] for the best-scoring clauses, best first."""
+        if top_k <= 0:
+            return []
+        scores = self.scores(query)
+        hit = np.nonzero(scores > 0)[0]
+        if len(hit) > top_k:
+            hit = hit[np.argpartition(-scores[hit], top_k - 1)[:top_k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return [(self.clause_ids[i], self.texts[i], float(scores[i])) for i in hit]
+
+    def save(self, path: Path):
+        """Write the index to a sibling temp dir, then swap it in.
+
+        A directory can't be os.replace()d over a non-empty one, so the old
+        index is renamed aside first and removed only once the new one is in
+        place; `path` is missing for just the two renames, never half-written.
+        """
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.mkdir(parents=True)
+        for name in _ARRAYS:
+            np.save(tmp / f"{name}.npy", np.asarray(getattr(self, name)))
+        with (tmp / "vocab.json").open("w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+        with (tmp / "clauses.json").open("w", encoding="utf-8") as f:
+            json.dump({"ids": self.clause_ids, "texts": self.texts}, f, ensure_ascii=False)
+        old = path.with_name(f"{path.name}.{uuid.uuid4().hex}.old")
+        try:
+            os.replace(path, old)
+        except FileNotFoundError:
+            old = None
+        os.replace(tmp, path)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: Path):
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in _ARRAYS}
+        with (path / "vocab.json").open("r", encoding="utf-8") as f:
+            terms = json.load(f)
+        with (path / "clauses.json").open("r", encoding="utf-8") as f:
+            clauses = json.load(f)
+        return cls(terms, clauses["ids"], clauses["texts"], **arrays)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def index_path(doc_id: str) -> Path:
+    return LEXICAL_INDEX_DIR / quote(doc_id, safe="")
+
+
+def build_lexical_index(doc_id: str, clauses):
+    idx = BM25Index.build([c["clause_id"] for c in clauses], [c["text"] for c in clauses])
+    idx.save(index_path(doc_id))
+    with _cache_lock:
+        _cache.pop(doc_id, None)
+    return idx
+
+
+def delete_lexical_index(doc_id: str):
+    shutil.rmtree(index_path(doc_id), ignore_errors=True)
+    with _cache_lock:
+        _cache.pop(doc_id, None)
+
+
+def has_lexical_index(doc_id: str) -> bool:
+    return (index_path(doc_id) / "clauses.json").exists()
+
+
+def get_lexical_index(doc_id: str):
+    """Loaded index for a document (None if it was never built), kept in a small LRU."""
+    with _cache_lock:
+        if doc_id in _cache:
+            _cache.move_to_end(doc_id)
+            return _cache[doc_id]
+    if not has_lexical_index(doc_id):
+        return None
+    try:
+        idx = BM25Index.load(index_path(doc_id))
+    except FileNotFoundError:
+        # Raced with a rebuild swapping the directory; the new one is in place now.
+        idx = BM25Index.load(index_path(doc_id))
+    with _cache_lock:
+        _cache[doc_id] = idx
+        while len(_cache) > LEXICAL_CACHE_MAX_DOCS:
+            _cache.popitem(last=False)
+    return idx
@@ -0,0 +1,260 @@
+"""HTTP client for the OpenAI-compatible LLM backend.
+
+One pooled keep-alive `requests.Session` is shared by all callers. The
+number of in-flight requests is capped, 429/5xx responses and connection
+errors are retried with full-jitter exponential backoff (honouring
+Retry-After), and a circuit breaker stops calling the backend for a
+cooldown period after repeated failures so callers can fall back at once.
+Only signs of an unhealthy backend (5xx, timeouts, connection errors) count
+towards the breaker; 4xx responses are the caller's problem.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import (
+    GROQ_API_KEY, GROQ_URL, LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+    LLM_MAX_CONCURRENCY, LLM_POOL_SIZE, LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN,
+)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Request failures that point at the backend or the network: retried, and counted by the breaker
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class LLMError(Exception):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                raise CircuitOpenError("LLM backend circuit is open")
+            if state == "half_open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """End a call that says nothing about backend health, freeing the half-open trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class LLMClient:
+    def __init__(self, url: str, api_key: str, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 pool_size: int = LLM_POOL_SIZE, breaker_threshold: int = LLM_BREAKER_THRESHOLD,
+                 breaker_cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.short_circuited = 0
+
+    def _backoff(self, attempt: int, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, **counts):
+        with self._metrics_lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def post(self, payload: dict, stream: bool = False):
+        """POST `payload` with retries; returns the successful `requests.Response`.
+
+        With stream=True the body is still to be read, so the concurrency slot
+        stays taken and the breaker gets no verdict yet: the caller must hand
+        the response to _end_stream() once it is done with it.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._record(short_circuited=1)
+            raise
+        self._record(calls=1)
+        last_error = None
+        unhealthy = False  # whether the final failure points at the backend rather than the request
+        settled = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self._record(retries=1)
+                retry_after = None
+                t0 = time.perf_counter()
+                r = None
+                self._slots.acquire()
+                try:
+                    r = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+                except requests.RequestException as e:
+                    last_error = e
+                    unhealthy = isinstance(e, TRANSIENT_ERRORS)
+                    if not unhealthy:
+                        break  # e.g. an invalid URL: retrying won't help
+                finally:
+                    if not (stream and r is not None and r.status_code < 400):
+                        self._slots.release()
+                if r is not None:
+                    with self._metrics_lock:
+                        self._latencies.append(time.perf_counter() - t0)
+                    if r.status_code < 400:
+                        settled = True
+                        if not stream:
+                            self.breaker.record_success()
+                            self._record(successes=1)
+                        return r
+                    last_error = LLMError(f"LLM backend returned HTTP {r.status_code}")
+                    unhealthy = r.status_code >= 500
+                    retry_after = r.headers.get("Retry-After")
+                    r.close()
+                    if r.status_code not in RETRYABLE_STATUS:
+                        break
+                if attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt, retry_after))
+
+            if unhealthy:
+                self.breaker.record_failure()
+                settled = True
+        finally:
+            if not settled:
+                self.breaker.release()
+        self._record(failures=1)
+        raise LLMError(str(last_error)) from last_error
+
+    def chat(self, payload: dict) -> str:
+        """Run a non-streaming chat completion and return the assistant message."""
+        r = self.post(payload)
+        try:
+            resp = r.json()
+        except ValueError as e:
+            raise LLMError(f"LLM backend returned invalid JSON: {r.text!r:.200}") from e
+        try:
+            return resp["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"unexpected LLM response: {resp!r:.200}") from e
+
+    def stream_chat(self, payload: dict):
+        """Run a streaming chat completion, yielding content deltas as they arrive.
+
+        Retries only happen before the response starts; an error mid-stream
+        is raised as LLMError. The concurrency slot (and a half-open breaker's
+        trial) is held until the stream is finished or the generator closed.
+        """
+        r = self.post({**payload, "stream": True}, stream=True)
+        interrupted = False
+        try:
+            for line in r.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    raise LLMError(f"unexpected LLM stream chunk: {data:.200}") from e
+                if delta:
+                    yield delta
+        except requests.RequestException as e:
+            interrupted = True
+            raise LLMError(f"LLM stream interrupted: {e}") from e
+        finally:
+            self._end_stream(r, interrupted)
+
+    def _end_stream(self, r, interrupted: bool):
+        """Close a streamed response from post(), free its slot and settle the breaker."""
+        try:
+            r.close()
+        finally:
+            self._slots.release()
+            if interrupted:
+                self.breaker.record_failure()
+                self._record(failures=1)
+            else:
+                self.breaker.record_success()
+                self._record(successes=1)
+
+    def stats(self):
+        with self._metrics_lock:
+            lat = sorted(self._latencies)
+            counts = {"calls": self.calls, "successes": self.successes, "failures": self.failures,
+                      "retries": self.retries, "short_circuited": self.short_circuited}
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 1) if lat else None
+
+        return {**counts, "circuit": self.breaker.state,
+                "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99),
+                               "mean": round(sum(lat) / len(lat) * 1000, 1) if lat else None}}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(GROQ_URL, GROQ_API_KEY)
+    return _client
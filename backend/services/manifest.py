@@ -0,0 +1,60 @@
+"""Per-document manifests recording what `/analyze` last produced and from which inputs.
+
+A manifest stores the content hash of the uploaded file together with the
+parser version, embedding model, risk rule version and report template
+version that were used, plus the resulting clauses, flags and report path.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from backend.config import MANIFEST_DIR
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def manifest_path(doc_id: str) -> Path:
+    return MANIFEST_DIR / f"{doc_id}.json"
+
+
+def load_manifest(doc_id: str):
+    p = manifest_path(doc_id)
+    if not p.exists():
+        return None
+    try:
+        with p.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(doc_id: str, manifest: dict):
+    manifest = {**manifest, "doc_id": doc_id, "updated_at": time.time()}
+    p = manifest_path(doc_id)
+    tmp = p.with_name(p.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, p)
+    if manifest.get("content_hash"):
+        h = MANIFEST_DIR / "by_hash" / manifest["content_hash"]
+        h.parent.mkdir(exist_ok=True)
+        h.write_text(doc_id, encoding="utf-8")
+    return manifest
+
+
+def find_manifest_by_hash(content_hash: str):
+    """The manifest of the document last analyzed with this exact content, if still current."""
+    try:
+        doc_id = (MANIFEST_DIR / "by_hash" / content_hash).read_text(encoding="utf-8")
+    except OSError:
+        return None
+    m = load_manifest(doc_id)
+    return m if m and m.get("content_hash") == content_hash else None
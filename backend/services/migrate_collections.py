@@ -0,0 +1,73 @@
+"""Move clauses from the per-document Chroma layout into the shared collection(s).
+
+Stored embeddings, documents and metadata are copied as-is (nothing is
+re-encoded), with ids rewritten to "<doc_id>::<clause_id>" and doc_id,
+clause_id and tenant metadata added. Run before switching to
+VECTOR_LAYOUT=shared:
+
+    python -m backend.services.migrate_collections [--tenant acme] [--delete-old]
+"""
+import argparse
+
+from backend.config import SHARED_COLLECTION, DEFAULT_TENANT
+from backend.services.embedder import get_client, get_or_create_collection
+from backend.services.vector_store import shard_name, shard_names
+
+
+def _collection_names(client):
+    names = []
+    for c in client.list_collections():
+        names.append(c if isinstance(c, str) else c.name)
+    return names
+
+
+def migrate(tenant: str = DEFAULT_TENANT, delete_old: bool = False, page_size: int = 500):
+    client = get_client()
+    shared = set(shard_names()) | {SHARED_COLLECTION}
+    migrated = {}
+    for name in _collection_names(client):
+        if name in shared:
+            continue
+        src = client.get_collection(name=name)
+        dst = get_or_create_collection(shard_name(name))
+        offset, count = 0, 0
+        while True:
+            page = src.get(include=["documents", "metadatas", "embeddings"], limit=page_size, offset=offset)
+            ids = page["ids"]
+            if not len(ids):
+                break
+            metadatas = [
+                {**(m or {}), "doc_id": name, "clause_id": cid, "tenant": (m or {}).get("tenant", tenant)}
+                for cid, m in zip(ids, page["metadatas"])
+            ]
+            dst.upsert(
+                ids=[f"{name}::{cid}" for cid in ids],
+                documents=page["documents"],
+                metadatas=metadatas,
+                embeddings=[list(map(float, e)) for e in page["embeddings"]],
+            )
+            count += len(ids)
+            offset += len(ids)
+        migrated[name] = count
+        if delete_old:
+            client.delete_collection(name=name)
+    try:
+        client.persist()
+    except Exception:
+        pass
+    return migrated
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migrate per-document collections into the shared layout.")
+    ap.add_argument("--tenant", default=DEFAULT_TENANT, help="tenant to record for migrated clauses")
+    ap.add_argument("--delete-old", action="store_true", help="drop each per-document collection once copied")
+    args = ap.parse_args()
+    migrated = migrate(args.tenant, args.delete_old)
+    for doc_id, n in migrated.items():
+        print(f"{doc_id}: {n} clauses")
+    print(f"Migrated {len(migrated)} documents, {sum(migrated.values())} clauses")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,151 @@
+import hashlib
+import multiprocessing
+import os
 import re
 import fitz
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from backend.config import PARSE_WORKERS, PARSE_PARALLEL_MIN_PAGES, PARSE_PAGES_PER_TASK
 
-def parse_document_simple(path: Path, max_clause_chars: int = 2000):
+# Bump whenever a change alters the clauses produced for the same input file
+PARSER_VERSION = "2"
+
+
+def clause_id(text: str) -> str:
+    """Content-derived clause id: stable when text is inserted or removed elsewhere."""
+    return "c" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (affinity/cgroup-aware where the platform supports it)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _extract_page_range(args):
+    # Runs in a worker process: each worker opens its own fitz document
+    path, start, stop = args
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def extract_pages(path: Path, parallel=None, workers=None, pages_per_task=None):
+    """Yield the text of each page of a fitz-readable document, in page order.
+
+    With `parallel=None` the page ranges are fanned out to a process pool only
+    when the document has at least PARSE_PARALLEL_MIN_PAGES pages.
+    """
+    workers = workers or PARSE_WORKERS or available_cpus()
+    pages_per_task = pages_per_task or PARSE_PAGES_PER_TASK
+    with fitz.open(str(path)) as doc:
+        n_pages = doc.page_count
+        if parallel is None:
+            parallel = n_pages >= PARSE_PARALLEL_MIN_PAGES
+        if not parallel or workers < 2 or n_pages <= pages_per_task:
+            for p in doc:
+                yield p.get_text()
+            return
+
+    ranges = [(str(path), s, min(s + pages_per_task, n_pages)) for s in range(0, n_pages, pages_per_task)]
+    # Spawned, not forked: this runs in analyze worker threads of a process that may hold
+    # torch and HTTP threads, and forking a multi-threaded process can deadlock the child
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        # map() hands results back in submission order as soon as each range is ready
+        for texts in pool.map(_extract_page_range, ranges):
+            yield from texts
+
+
+_PARA_SPLIT = re.compile(r"\n{2,}|\r\n{2,}")
+
+
+def _pdf_segments(path: Path, parallel=None, workers=None):
+    for i, page_text in enumerate(extract_pages(path, parallel=parallel, workers=workers)):
+        yield page_text if i == 0 else "\n" + page_text
+
+
+def _text_segments(path: Path, block_size: int = 1 << 20):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            yield block
+
+
+def _segments(path: Path, parallel=None, workers=None):
     ext = path.suffix.lower()
-    text = ""
     if ext == ".pdf":
-        doc = fitz.open(str(path))
-        pages = [p.get_text() for p in doc]
-        text = "\n".join(pages)
-    elif ext in [".txt", ".md"]:
-        text = path.read_text(encoding="utf-8", errors="ignore")
-    else:
-        try:
-            doc = fitz.open(str(path))
-            pages = [p.get_text() for p in doc]
-            text = "\n".join(pages)
-        except Exception:
-            text = path.read_text(encoding="utf-8", errors="ignore")
-
-    parts = [p.strip() for p in re.split(r"\n{2,}|\r\n{2,}", text) if p.strip()]
-    clauses, idx = [], 1
-    for part in parts:
-        if len(part) <= max_clause_chars:
-            clauses.append({"clause_id": f"c{idx}", "text": part})
-            idx += 1
-        else:
-            start = 0
-            while start < len(part):
-                chunk = part[start:start + max_clause_chars]
-                clauses.append({"clause_id": f"c{idx}", "text": chunk})
+        return _pdf_segments(path, parallel, workers)
+    if ext in [".txt", ".md"]:
+        return _text_segments(path)
+    try:
+        fitz.open(str(path)).close()
+    except Exception:
+        return _text_segments(path)
+    return _pdf_segments(path, parallel, workers)
+
+
+def iter_clauses(path: Path, max_clause_chars: int = 2000, parallel=None, workers=None):
+    """Yield {'clause_id','text','position'} dicts page by page without materializing the document.
+
+    Paragraphs are split on blank lines and chunked to `max_clause_chars`,
+    exactly as if the whole text had been joined first; a paragraph that runs
+    across a page boundary is carried over to the next page. Only the
+    unfinished tail paragraph (at most about one page) is held in memory.
+    """
+    idx = 1
+    buf = ""
+    started = False  # True once chunks of the paragraph in `buf` have been emitted
+    seen = {}  # base id -> occurrences so far; repeats of identical text get a "-n" suffix
+
+    def clause(text):
+        cid = clause_id(text)
+        n = seen[cid] = seen.get(cid, 0) + 1
+        return {"clause_id": cid if n == 1 else f"{cid}-{n}", "text": text, "position": idx}
+
+    def chunks(text):
+        for start in range(0, len(text), max_clause_chars):
+            yield text[start:start + max_clause_chars]
+
+    for segment in _segments(path, parallel, workers):
+        buf += segment
+        pieces = _PARA_SPLIT.split(buf)
+        for i, piece in enumerate(pieces[:-1]):
+            part = piece.rstrip() if (started and i == 0) else piece.strip()
+            for chunk in chunks(part):
+                yield clause(chunk)
                 idx += 1
-                start += max_clause_chars
-    return clauses
+        if len(pieces) > 1:
+            started = False
+        buf = pieces[-1]
+
+        # Emit full-size chunks of a long unfinished paragraph early; the
+        # remainder still holds non-whitespace, so stripping can't move them.
+        if not started:
+            buf = buf.lstrip()
+        while len(buf) > max_clause_chars and buf[max_clause_chars:].strip():
+            yield clause(buf[:max_clause_chars])
+            idx += 1
+            buf = buf[max_clause_chars:]
+            started = True
+
+    tail = buf.rstrip() if started else buf.strip()
+    for chunk in chunks(tail):
+        yield clause(chunk)
+        idx += 1
+
+
+def iter_clause_batches(path: Path, batch_size: int, **kwargs):
+    """Group iter_clauses() output into lists of at most `batch_size` clauses."""
+    batch = []
+    for clause in iter_clauses(path, **kwargs):
+        batch.append(clause)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_document_simple(path: Path, max_clause_chars: int = 2000, parallel=None, workers=None):
+    return list(iter_clauses(path, max_clause_chars, parallel=parallel, workers=workers))
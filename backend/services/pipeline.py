@@ -0,0 +1,189 @@
+"""A small staged pipeline: threads connected by bounded queues.
+
+    p = Pipeline("analyze", maxsize=4)
+    p.source("parse", iter_clause_batches(path, 64))
+    p.stage("scan", scan_clauses, after="parse")
+    p.stage("embed", embed, after="parse")
+    p.stage("insert", insert, after="embed")
+    outputs = p.run()          # {"scan": [...], "insert": [...]} for stages nobody consumes
+
+Every stage runs in its own thread and sees items in source order. A stage
+with several consumers hands each of them every item, so e.g. the risk scan
+never waits for embeddings. Bounded queues keep memory flat and apply
+back-pressure to faster upstream stages. The first exception in any stage
+stops the pipeline and is re-raised by run(); the source iterator is closed
+either way.
+
+stats() reports, per stage, items processed, busy time in the stage
+function and time blocked waiting for input or for room downstream. Busy
+time shows the bottleneck; wall time approaches the slowest stage rather
+than the sum of all of them.
+"""
+import queue
+import threading
+import time
+
+_DONE = object()
+_POLL = 0.1
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _Stage:
+    def __init__(self, name, fn=None, iterable=None, after=None):
+        self.name = name
+        self.fn = fn
+        self.iterable = iterable
+        self.after = after
+        self.inbox = None
+        self.consumers = []
+        self.outputs = []
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+
+    def stats(self):
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 4),
+            "wait_input_s": round(self.wait_in, 4),
+            "wait_output_s": round(self.wait_out, 4),
+        }
+
+
+class Pipeline:
+    def __init__(self, name: str = "pipeline", maxsize: int = 4):
+        self.name = name
+        self.maxsize = maxsize
+        self._stages = {}
+        self._abort = threading.Event()
+        self._error = None
+        self.wall = 0.0
+
+    def source(self, name: str, iterable):
+        self._stages[name] = _Stage(name, iterable=iterable)
+        return self
+
+    def stage(self, name: str, fn, after: str):
+        if after not in self._stages:
+            raise ValueError(f"unknown upstream stage {after!r}")
+        st = _Stage(name, fn=fn, after=after)
+        st.inbox = queue.Queue(self.maxsize)
+        self._stages[after].consumers.append(st)
+        self._stages[name] = st
+        return self
+
+    def _put(self, st: _Stage, item):
+        t = time.perf_counter()
+        for c in st.consumers:
+            while True:
+                if self._abort.is_set():
+                    raise _Aborted()
+                try:
+                    c.inbox.put(item, timeout=_POLL)
+                    break
+                except queue.Full:
+                    pass
+        st.wait_out += time.perf_counter() - t
+
+    def _get(self, st: _Stage):
+        t = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                item = st.inbox.get(timeout=_POLL)
+                break
+            except queue.Empty:
+                pass
+        st.wait_in += time.perf_counter() - t
+        return item
+
+    def _emit(self, st: _Stage, result):
+        if st.consumers:
+            self._put(st, result)
+        else:
+            st.outputs.append(result)
+
+    def _run_stage(self, st: _Stage):
+        try:
+            if st.iterable is not None:
+                it = iter(st.iterable)
+                try:
+                    while True:
+                        t = time.perf_counter()
+                        item = next(it, _DONE)
+                        st.busy += time.perf_counter() - t
+                        if item is _DONE:
+                            break
+                        st.items += 1
+                        self._emit(st, item)
+                finally:
+                    # On abort the source is left mid-iteration; closing a
+                    # generator runs its cleanup (e.g. shutting down a pool).
+                    close = getattr(it, "close", None)
+                    if close is not None:
+                        close()
+            else:
+                while True:
+                    item = self._get(st)
+                    if item is _DONE:
+                        break
+                    t = time.perf_counter()
+                    result = st.fn(item)
+                    st.busy += time.perf_counter() - t
+                    st.items += 1
+                    self._emit(st, result)
+            if st.consumers:
+                self._put(st, _DONE)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = (st.name, e)
+            self._abort.set()
+
+    def run(self):
+        """Run to completion; returns {stage: [outputs]} for stages without consumers."""
+        t = time.perf_counter()
+        threads = [threading.Thread(target=self._run_stage, args=(st,), name=f"{self.name}-{st.name}", daemon=True)
+                   for st in self._stages.values()]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        self.wall = time.perf_counter() - t
+        _record(self)
+        if self._error is not None:
+            raise self._error[1]
+        return {name: st.outputs for name, st in self._stages.items() if not st.consumers}
+
+    def stats(self):
+        return {"wall_s": round(self.wall, 4), "stages": {name: st.stats() for name, st in self._stages.items()}}
+
+
+# Cumulative per-stage totals by pipeline name, for /metrics
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def _record(p: Pipeline):
+    with _totals_lock:
+        tot = _totals.setdefault(p.name, {"runs": 0, "failed": 0, "wall_s": 0.0, "stages": {}})
+        tot["runs"] += 1
+        tot["failed"] += p._error is not None
+        tot["wall_s"] += p.wall
+        for name, st in p._stages.items():
+            s = tot["stages"].setdefault(name, {"items": 0, "busy_s": 0.0})
+            s["items"] += st.items
+            s["busy_s"] += st.busy
+
+
+def pipeline_stats():
+    with _totals_lock:
+        return {name: {**tot, "wall_s": round(tot["wall_s"], 3),
+                       "stages": {k: {**v, "busy_s": round(v["busy_s"], 3)} for k, v in tot["stages"].items()}}
+                for name, tot in _totals.items()}
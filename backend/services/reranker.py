@@ -0,0 +1,131 @@
+"""Optional cross-encoder rerank stage for retrieved evidence.
+
+Enabled by setting RERANK_MODEL (e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2").
+The retriever fetches RERANK_CANDIDATES clauses per query and the cross-encoder
+scores every (query, clause) pair of a request in one batched predict call.
+
+RERANK_BUDGET_MS bounds the whole retrieval: reranking is skipped, and the
+first-stage order kept, when the time already spent plus the predicted cost
+(a moving average of seconds per pair) would exceed it. Each such skip
+shrinks the estimate by RERANK_SKIP_DECAY, so one slow batch can't disable
+reranking for good: the next rerank that fits re-measures the real cost. It
+is also skipped while the model is still loading in the background.
+"""
+import threading
+import time
+
+from backend.config import (
+    RERANK_MODEL, RERANK_BUDGET_MS, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH, RERANK_SKIP_DECAY,
+)
+
+
+class Reranker:
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.budget = budget_ms / 1000.0
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._loader = None
+        self.load_error = None
+        self._lock = threading.Lock()
+        self._sec_per_pair = None  # EWMA of observed cost
+        self._stats = {"reranked": 0, "pairs": 0, "skipped_budget": 0, "skipped_loading": 0}
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                print("Loading rerank model:", self.model_name)
+                model = CrossEncoder(self.model_name, max_length=RERANK_MAX_LENGTH)
+                # The first predict pays for lazy init and kernel selection; keep
+                # it out of the per-pair cost estimate.
+                model.predict([("warm up", "warm up")], show_progress_bar=False)
+                self._model = model
+        return self._model
+
+    def warm_up(self, background: bool = True):
+        def run():
+            try:
+                self._load()
+            except Exception as e:
+                self.load_error = repr(e)
+                raise
+
+        if not background:
+            run()
+            return None
+        with self._lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=run, name="reranker-warmup", daemon=True)
+                self._loader.start()
+        return self._loader
+
+    def _predicted(self, n_pairs: int) -> float:
+        return (self._sec_per_pair or 0.0) * n_pairs
+
+    def rerank_many(self, items, top_k: int, started: float = None):
+        """Rerank [(query, hits)] together; returns one top_k hit list per item.
+
+        `started` is the time.perf_counter() at which the request began, so
+        first-stage retrieval counts against the budget.
+        """
+        items = list(items)
+        pairs = [(q, h["text"]) for q, hits in items for h in hits]
+        fallback = [hits[:top_k] for _, hits in items]
+        if not pairs:
+            return fallback
+        if self._model is None:
+            self.warm_up(background=True)
+            with self._lock:
+                self._stats["skipped_loading"] += 1
+            return fallback
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        if self.budget > 0 and elapsed + self._predicted(len(pairs)) > self.budget:
+            with self._lock:
+                self._stats["skipped_budget"] += 1
+                if elapsed <= self.budget:
+                    self._sec_per_pair *= RERANK_SKIP_DECAY
+            return fallback
+
+        t0 = time.perf_counter()
+        scores = self._model.predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+        cost = (time.perf_counter() - t0) / len(pairs)
+        with self._lock:
+            self._sec_per_pair = cost if self._sec_per_pair is None else 0.8 * self._sec_per_pair + 0.2 * cost
+            self._stats["reranked"] += 1
+            self._stats["pairs"] += len(pairs)
+
+        results, i = [], 0
+        for _, hits in items:
+            scored = [{**h, "rerank_score": round(float(s), 4)} for h, s in zip(hits, scores[i:i + len(hits)])]
+            i += len(hits)
+            scored.sort(key=lambda h: h["rerank_score"], reverse=True)
+            results.append(scored[:top_k])
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "loaded": self._model is not None,
+                "load_error": self.load_error,
+                "budget_ms": self.budget * 1000,
+                "ms_per_pair": round(self._sec_per_pair * 1000, 3) if self._sec_per_pair is not None else None,
+                **self._stats,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """The shared Reranker, or None when RERANK_MODEL is not set."""
+    global _reranker
+    if not RERANK_MODEL:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
@@ -1,39 +1,136 @@
-from backend.services.embedder import sbert, get_or_create_collection, client
-from backend.config import CHROMA_PERSIST_DIR
-
-def index_clauses(doc_id: str, clauses):
-    col = get_or_create_collection(doc_id)
-    ids = [c["clause_id"] for c in clauses]
-    docs = [c["text"] for c in clauses]
-    embeddings = sbert.encode(docs, show_progress_bar=False).tolist()
-    metadatas = [{"doc_id": doc_id} for _ in clauses]
-
-    try:
-        col.delete(where={"id": {"$in": ids}})
-    except Exception:
-        try:
-            col.delete(ids=ids)
-        except Exception:
-            pass
-
-    col.add(documents=docs, metadatas=metadatas, ids=ids, embeddings=embeddings)
-    if CHROMA_PERSIST_DIR:
-        try:
-            client.persist()
-        except Exception:
-            pass
-
-
-def retrieve(doc_id: str, query: str, top_k: int = 3):
-    col = get_or_create_collection(doc_id)
-    q_emb = sbert.encode([query])[0].tolist()
-    res = col.query(query_embeddings=[q_emb], n_results=top_k)
-    hits = []
-    for i, cid in enumerate(res.get("ids", [[]])[0]):
-        hits.append({
-            "clause_id": cid,
-            "text": res["documents"][0][i],
-            "metadata": res.get("metadatas", [[]])[0][i],
-            "distance": res.get("distances", [[]])[0][i]
-        })
-    return hits
+import time
+
+from backend.services.embedder import encode, encode_query
+from backend.services.embedding_cache import encode_cached, encode_queries
+from backend.services.vector_store import get_vector_store
+from backend.services.lexical_index import get_lexical_index, delete_lexical_index
+from backend.services.reranker import get_reranker
+from backend.config import (
+    EMBED_MODEL, DEFAULT_TENANT, RETRIEVAL_MODE, HYBRID_LEXICAL_WEIGHT, HYBRID_RRF_K,
+    HYBRID_CANDIDATES, RERANK_CANDIDATES,
+)
+
+# Storage layout and backend (Chroma or the NumPy index) live in vector_store.py.
+
+
+def embed_clauses(clauses):
+    """Embeddings for a batch of clauses, through the clause embedding cache."""
+    return encode_cached(encode, EMBED_MODEL, [c["text"] for c in clauses])
+
+
+def add_clauses(doc_id: str, clauses, embeddings, tenant: str = DEFAULT_TENANT, store=None):
+    metadatas = [{"doc_id": doc_id, "clause_id": c["clause_id"], "tenant": tenant} for c in clauses]
+    (store or get_vector_store()).add(doc_id, [c["clause_id"] for c in clauses], [c["text"] for c in clauses],
+                                      embeddings, metadatas)
+
+
+def indexed_ids(doc_id: str) -> set:
+    """Clause ids stored for a document; they are content hashes, so equal ids mean equal text."""
+    return set(get_vector_store().ids(doc_id))
+
+
+def remove_clauses(doc_id: str, ids):
+    """Delete clause ids from a document and persist the store."""
+    store = get_vector_store()
+    if ids:
+        store.delete(doc_id, list(ids))
+    store.persist()
+
+
+def reset_index(doc_id: str):
+    """Drop every stored clause of a document before it is re-indexed."""
+    get_vector_store().delete_document(doc_id)
+    delete_lexical_index(doc_id)
+
+
+def fuse(vector_hits, lexical_hits, top_k: int, weight: float = HYBRID_LEXICAL_WEIGHT, k: int = HYBRID_RRF_K):
+    """Reciprocal rank fusion of a vector ranking and a BM25 ranking.
+
+    score = (1 - weight) / (k + vector_rank) + weight / (k + bm25_rank), with
+    1-based ranks; a clause missing from one ranking gets nothing from it.
+    """
+    hits, score = {}, {}
+    for rank, h in enumerate(vector_hits, 1):
+        hits[h["clause_id"]] = dict(h)
+        score[h["clause_id"]] = (1 - weight) / (k + rank)
+    for rank, h in enumerate(lexical_hits, 1):
+        cid = h["clause_id"]
+        hits.setdefault(cid, dict(h))["bm25"] = h["bm25"]
+        score[cid] = score.get(cid, 0.0) + weight / (k + rank)
+    best = sorted(score, key=score.get, reverse=True)[:max(top_k, 0)]
+    return [{**hits[cid], "score": round(score[cid], 6)} for cid in best]
+
+
+def _lexical_hits(doc_id: str, query: str, top_k: int):
+    idx = get_lexical_index(doc_id)
+    if idx is None:
+        return []
+    return [{"clause_id": cid, "text": text, "metadata": {"doc_id": doc_id, "clause_id": cid},
+             "distance": None, "bm25": round(score, 4)}
+            for cid, text, score in idx.search(query, top_k)]
+
+
+def _use_hybrid(mode):
+    return (mode or RETRIEVAL_MODE) == "hybrid"
+
+
+def retrieve(doc_id: str, query: str, top_k: int = 3, mode: str = None, rerank: bool = None):
+    """Top-k clauses of a document for `query`; see retrieve_batch for `mode` and `rerank`."""
+    return retrieve_batch([(doc_id, query)], top_k, mode=mode, rerank=rerank)[0]
+
+
+def retrieve_batch(pairs, top_k: int = 3, mode: str = None, rerank: bool = None):
+    """Retrieve evidence for many (doc_id, query) pairs at once.
+
+    All distinct queries are encoded in a single forward pass and each
+    document is queried once with all of its query embeddings. Returns one
+    hit list per pair, in input order.
+
+    `mode` is "vector" or "hybrid" (default RETRIEVAL_MODE). When a rerank
+    model is configured (and `rerank` is not False), RERANK_CANDIDATES
+    clauses per pair are rescored by the cross-encoder in one batch.
+    """
+    started = time.perf_counter()
+    pairs = list(pairs)
+    if top_k <= 0:
+        return [[] for _ in pairs]
+    queries = list(dict.fromkeys(q for _, q in pairs))
+    if not queries:
+        return []
+    embs = encode_queries(encode_query, EMBED_MODEL, queries)
+    emb_of = dict(zip(queries, embs))
+
+    by_doc = {}
+    for i, (doc_id, q) in enumerate(pairs):
+        by_doc.setdefault(doc_id, []).append(i)
+
+    reranker = get_reranker() if rerank is not False else None
+    pool = max(top_k, RERANK_CANDIDATES) if reranker else top_k
+    hybrid = _use_hybrid(mode)
+    n = max(pool, HYBRID_CANDIDATES) if hybrid else pool
+    store = get_vector_store()
+    results = [None] * len(pairs)
+    for doc_id, idxs in by_doc.items():
+        rows = store.query(doc_id, [emb_of[pairs[i][1]] for i in idxs], n)
+        for row, i in enumerate(idxs):
+            if hybrid:
+                results[i] = fuse(rows[row], _lexical_hits(doc_id, pairs[i][1], n), pool)
+            else:
+                results[i] = rows[row]
+    if reranker:
+        results = reranker.rerank_many([(q, hits) for (_, q), hits in zip(pairs, results)], top_k, started)
+    return results
+
+
+def search_portfolio(query: str, top_k: int = 10, tenant: str = None, doc_ids=None):
+    """Search clauses across many documents, best matches first.
+
+    With the shared Chroma layout every shard is queried once with a
+    metadata filter on tenant and/or doc_ids; the NumPy backend scans each
+    document's matrix. The per-document Chroma layout can only fan out over
+    an explicit list of doc_ids.
+    """
+    if top_k <= 0:
+        return []
+    q_emb = encode_queries(encode_query, EMBED_MODEL, [query])[0]
+    return get_vector_store().search(q_emb, top_k, tenant=tenant, doc_ids=doc_ids)
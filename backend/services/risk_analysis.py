@@ -1,78 +1,74 @@
+import hashlib
+import json
 import re
+from pathlib import Path
 
-RISK_LIBRARY = {
-    "Unlimited Liability": {
-        "impact": "High — exposes party to unbounded financial risk",
-        "likelihood": "High — often enforceable if signed",
-        "factors": [
-            "No liability cap",
-            "Covers all damages including indirect/consequential"
-        ],
-        "mitigation": [
-            "Negotiate a liability cap",
-            "Exclude indirect or consequential damages"
-        ]
-    },
-    "Auto Renewal": {
-        "impact": "Medium — contract may continue without review",
-        "likelihood": "High — auto-renew is typically enforceable",
-        "factors": [
-            "Renewal happens automatically unless notice given",
-            "Counterparty benefits from inertia"
-        ],
-        "mitigation": [
-            "Add requirement for explicit renewal",
-            "Set reminders before renewal deadlines"
-        ]
-    },
-    "Indemnity Mention": {
-        "impact": "High — may shift legal/financial burdens",
-        "likelihood": "Medium — scope depends on wording",
-        "factors": [
-            "Indemnity obligations may be one-sided",
-            "Unclear scope of covered damages"
-        ],
-        "mitigation": [
-            "Limit indemnity to direct damages caused by breach",
-            "Require mutual indemnity obligations"
-        ]
-    }
-}
+from backend.config import RISK_RULES_PATH
 
 
-def scan_clauses(clauses):
-    flags = []
-    for c in clauses:
-        t = c["text"].lower()
+def load_rules(path: Path = RISK_RULES_PATH):
+    """Read the risk rule library from a JSON file.
+
+    Each rule has a `tag`, a case-insensitive regex `pattern` and the
+    `impact`, `likelihood`, `factors` and `mitigation` copied into its flags.
+    Patterns must not use backreferences or named groups, since all rules
+    are compiled into a single combined pattern.
+    """
+    raw = Path(path).read_bytes()
+    rules = json.loads(raw.decode("utf-8"))["rules"]
+    return rules, hashlib.sha256(raw).hexdigest()[:12]
+
 
-        if re.search(r"unlimited liability|no cap on liability|no limit", t):
-            tag = "Unlimited Liability"
-            flags.append({
-                "clause_id": c["clause_id"],
-                "tag": tag,
-                "match": c["text"],
-                **RISK_LIBRARY[tag]
-            })
+class RiskScanner:
+    """Finds every matching rule for a text in one scan of the text.
 
-        if re.search(r"automatic(ally)? renew|renew unless", t):
-            tag = "Auto Renewal"
-            flags.append({
-                "clause_id": c["clause_id"],
-                "tag": tag,
-                "match": c["text"],
-                **RISK_LIBRARY[tag]
-            })
+    All rule patterns are joined into one alternation of named groups inside
+    a lookahead, so the scan visits each position once and records the first
+    rule matching there. Rules later in the list are then tried only at those
+    (rare) positions, so a rule overlapping an earlier one is still found.
+    """
 
-        if re.search(r"indemnif", t):
-            tag = "Indemnity Mention"
-            flags.append({
-                "clause_id": c["clause_id"],
-                "tag": tag,
-                "match": c["text"],
-                **RISK_LIBRARY[tag]
-            })
+    def __init__(self, rules):
+        self.rules = rules
+        self.details = [{k: v for k, v in r.items() if k not in ("tag", "pattern")} for r in rules]
+        self._patterns = [re.compile(r["pattern"], re.IGNORECASE) for r in rules]
+        combined = "|".join(f"(?P<r{i}>{r['pattern']})" for i, r in enumerate(rules))
+        self._combined = re.compile(f"(?=(?:{combined}))", re.IGNORECASE) if rules else None
 
-    return flags
+    def match_rules(self, text: str):
+        """Return the sorted indices of the rules matching `text`."""
+        if self._combined is None:
+            return []
+        found = set()
+        n = len(self._patterns)
+        for m in self._combined.finditer(text):
+            i = int(m.lastgroup[1:])
+            found.add(i)
+            if len(found) == n:
+                break
+            pos = m.start()
+            for j in range(i + 1, n):
+                if j not in found and self._patterns[j].match(text, pos):
+                    found.add(j)
+        return sorted(found)
 
+    def scan(self, clauses):
+        flags = []
+        for c in clauses:
+            for i in self.match_rules(c["text"]):
+                flags.append({
+                    "clause_id": c["clause_id"],
+                    "tag": self.rules[i]["tag"],
+                    "match": c["text"],
+                    **self.details[i]
+                })
+        return flags
 
 
+_rules, RISK_RULES_VERSION = load_rules()
+scanner = RiskScanner(_rules)
+RISK_LIBRARY = dict(zip((r["tag"] for r in _rules), scanner.details))
+
+
+def scan_clauses(clauses):
+    return scanner.scan(clauses)
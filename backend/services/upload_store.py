@@ -0,0 +1,269 @@
+"""Streaming, content-addressed upload storage.
+
+Uploads are read in UPLOAD_CHUNK_SIZE chunks into a temp file while being
+hashed, so nothing is buffered in memory and no second pass is needed. The
+finished file is renamed into BLOB_DIR/<sha[:2]>/<sha256>, and the upload
+name in UPLOAD_DIR is a hard link to that blob. Re-uploading identical
+content under another name therefore costs only a directory entry. Blobs are
+made read-only: anything replacing an upload must write a new file and
+rename it over the name, never rewrite it in place, or every name sharing
+the blob would change with it.
+
+multipart/form-data bodies are decoded incrementally (MultipartFile), so a
+form upload is streamed exactly like a raw body instead of being spooled by
+the form parser first.
+
+Large files can also be sent as a resumable session: parts are uploaded
+(and retried) independently under UPLOAD_TMP_DIR/<upload_id>/ and
+concatenated, again hashing as they are copied, on completion.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from werkzeug.sansio.multipart import MultipartDecoder, NEED_DATA, Data, Epilogue, File
+
+from backend.config import (
+    UPLOAD_DIR, BLOB_DIR, UPLOAD_TMP_DIR, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_BYTES, UPLOAD_SESSION_TTL,
+    UPLOAD_MAX_PARTS,
+)
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+# Limit for non-file form fields that precede the file in a multipart body
+_FORM_FIELD_MAX = 500_000
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+class UnknownUpload(UploadSessionError):
+    pass
+
+
+def _copy_hashed(src, dst, h, limit: int, already: int = 0) -> int:
+    """Copy file-like `src` into `dst` in chunks, updating hash `h`; returns bytes copied."""
+    n = 0
+    while True:
+        chunk = src.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return n
+        n += len(chunk)
+        if already + n > limit:
+            raise UploadTooLarge(f"upload exceeds {limit} bytes")
+        h.update(chunk)
+        dst.write(chunk)
+
+
+def _tmp_path() -> Path:
+    return UPLOAD_TMP_DIR / f"{uuid.uuid4().hex}.tmp"
+
+
+def blob_path(sha: str) -> Path:
+    return BLOB_DIR / sha[:2] / sha
+
+
+def _commit_blob(tmp: Path, sha: str):
+    """Move `tmp` into the blob store; returns (blob path, True if it already existed)."""
+    dest = blob_path(sha)
+    if dest.exists():
+        tmp.unlink()
+        return dest, True
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.chmod(tmp, 0o444)
+    os.replace(tmp, dest)
+    return dest, False
+
+
+def _link_name(blob: Path, filename: str) -> Path:
+    """Atomically point UPLOAD_DIR/<filename> at `blob` (hard link, copy as a fallback)."""
+    dest = UPLOAD_DIR / filename
+    tmp = _tmp_path()
+    try:
+        os.link(blob, tmp)
+    except OSError:
+        shutil.copyfile(blob, tmp)
+    os.replace(tmp, dest)
+    return dest
+
+
+def _store(tmp: Path, sha: str, size: int, filename: str):
+    blob, existed = _commit_blob(tmp, sha)
+    _link_name(blob, filename)
+    return {"filename": filename, "content_hash": sha, "size": size, "deduplicated": existed}
+
+
+class MultipartFile:
+    """Read-only file-like view of one file field of a multipart/form-data body.
+
+    The body is pulled from `stream` and decoded only as `read()` is called;
+    parts before the file are skipped. Raises ValueError for a malformed or
+    truncated body, or when no file field named `field` is present.
+    """
+
+    def __init__(self, stream, boundary: str, field: str = "file"):
+        if not boundary:
+            raise ValueError("multipart body without a boundary")
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"), _FORM_FIELD_MAX)
+        self._pending = bytearray()
+        self._more = True  # the file part has data not yet decoded
+        while True:
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                raise ValueError(f"no file field {field!r} in the form")
+            if isinstance(event, File) and event.name == field:
+                self.filename = event.filename
+                break
+
+    def _next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if event is not NEED_DATA:
+                return event
+            self._decoder.receive_data(self._stream.read(UPLOAD_CHUNK_SIZE) or None)
+
+    def read(self, size: int = -1) -> bytes:
+        while self._more and (size < 0 or len(self._pending) < size):
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise ValueError("malformed multipart body")
+            self._pending += event.data
+            self._more = event.more_data
+        n = len(self._pending) if size < 0 else min(size, len(self._pending))
+        out = bytes(self._pending[:n])
+        del self._pending[:n]
+        return out
+
+
+def store_stream(stream, filename: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Write a file-like stream to the blob store and link it as `filename`.
+
+    Raises UploadTooLarge past `max_bytes` and ValueError for an empty stream.
+    """
+    tmp = _tmp_path()
+    h = hashlib.sha256()
+    try:
+        with tmp.open("wb") as f:
+            size = _copy_hashed(stream, f, h, max_bytes)
+        if not size:
+            raise ValueError("empty upload")
+        return _store(tmp, h.hexdigest(), size, filename)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+# --- Resumable sessions ---
+
+def _session_dir(upload_id: str) -> Path:
+    if not _UPLOAD_ID.match(upload_id or ""):
+        raise UnknownUpload(f"unknown upload_id {upload_id!r}")
+    return UPLOAD_TMP_DIR / upload_id
+
+
+def _load_session(upload_id: str):
+    d = _session_dir(upload_id)
+    try:
+        with (d / "session.json").open("r", encoding="utf-8") as f:
+            return d, json.load(f)
+    except (OSError, ValueError):
+        raise UnknownUpload(f"unknown upload_id {upload_id!r}")
+
+
+def _parts(d: Path):
+    parts = {}
+    for p in d.glob("*.part"):
+        parts[int(p.stem)] = p.stat().st_size
+    return dict(sorted(parts.items()))
+
+
+def prune_sessions(ttl: float = UPLOAD_SESSION_TTL):
+    """Drop sessions and stray temp files not touched for `ttl` seconds."""
+    cutoff = time.time() - ttl
+    for p in UPLOAD_TMP_DIR.iterdir():
+        try:
+            if p.stat().st_mtime < cutoff:
+                shutil.rmtree(p) if p.is_dir() else p.unlink()
+        except OSError:
+            pass
+
+
+def create_session(filename: str, size: int = None):
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise UploadTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    prune_sessions()
+    upload_id = uuid.uuid4().hex
+    d = UPLOAD_TMP_DIR / upload_id
+    d.mkdir(parents=True)
+    with (d / "session.json").open("w", encoding="utf-8") as f:
+        json.dump({"filename": filename, "size": size, "created_at": time.time()}, f)
+    return session_info(upload_id)
+
+
+def session_info(upload_id: str):
+    d, meta = _load_session(upload_id)
+    parts = _parts(d)
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta.get("size"),
+        "parts": [{"part": n, "size": s} for n, s in parts.items()],
+        "received_bytes": sum(parts.values()),
+    }
+
+
+def put_part(upload_id: str, part: int, stream):
+    """Store part `part` (1-based) of a session; re-sending a part replaces it."""
+    if not 1 <= part <= UPLOAD_MAX_PARTS:
+        raise UploadSessionError(f"part must be between 1 and {UPLOAD_MAX_PARTS}")
+    d, _ = _load_session(upload_id)
+    others = sum(s for n, s in _parts(d).items() if n != part)
+    tmp = d / f"{part}.{uuid.uuid4().hex}.tmp"  # concurrent retries of a part each get their own
+    h = hashlib.sha256()
+    try:
+        with tmp.open("wb") as f:
+            size = _copy_hashed(stream, f, h, MAX_UPLOAD_BYTES, already=others)
+        os.replace(tmp, d / f"{part}.part")
+    finally:
+        tmp.unlink(missing_ok=True)
+    os.utime(d)
+    return {"upload_id": upload_id, "part": part, "size": size, "sha256": h.hexdigest()}
+
+
+def complete_session(upload_id: str):
+    """Concatenate the parts in order, store the result and end the session."""
+    d, meta = _load_session(upload_id)
+    parts = _parts(d)
+    if not parts:
+        raise UploadSessionError("no parts uploaded")
+    if list(parts) != list(range(1, len(parts) + 1)):
+        raise UploadSessionError(f"parts must be numbered 1..n without gaps, got {list(parts)}")
+    total = sum(parts.values())
+    if meta.get("size") is not None and total != meta["size"]:
+        raise UploadSessionError(f"expected {meta['size']} bytes, received {total}")
+    tmp = _tmp_path()
+    h = hashlib.sha256()
+    try:
+        with tmp.open("wb") as out:
+            for n in parts:
+                with (d / f"{n}.part").open("rb") as src:
+                    _copy_hashed(src, out, h, MAX_UPLOAD_BYTES)
+        result = _store(tmp, h.hexdigest(), total, meta["filename"])
+    finally:
+        tmp.unlink(missing_ok=True)
+    shutil.rmtree(d, ignore_errors=True)
+    return result
+
+
+def abort_session(upload_id: str):
+    d, _ = _load_session(upload_id)
+    shutil.rmtree(d, ignore_errors=True)
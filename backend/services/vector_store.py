@@ -0,0 +1,443 @@
+"""Pluggable vector stores for clause embeddings.
+
+`get_vector_store()` returns the backend selected by VECTOR_BACKEND:
+
+- "chroma": the Chroma client from embedder.py, in either the per-document
+  or the shared collection layout (VECTOR_LAYOUT).
+- "numpy": an in-process exact index holding each document's normalized
+  embeddings in one contiguous float32 (or float16) matrix, persisted as
+  .npy files under NUMPY_INDEX_DIR and memory-mapped back on load.
+
+All backends return hits as {'clause_id','text','metadata','distance'},
+where distance is squared L2 between unit vectors (Chroma's default).
+"""
+import abc
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from backend.config import (
+    CHROMA_PERSIST_DIR, VECTOR_BACKEND, VECTOR_LAYOUT, SHARED_COLLECTION, COLLECTION_SHARDS, NUMPY_INDEX_DIR, NUMPY_INDEX_DTYPE,
+)
+
+
+class VectorStore(abc.ABC):
+    """Interface implemented by every vector store backend."""
+
+    @abc.abstractmethod
+    def add(self, doc_id: str, ids, texts, embeddings, metadatas):
+        """Insert or replace clauses of a document."""
+
+    @abc.abstractmethod
+    def delete(self, doc_id: str, ids):
+        """Remove the given clause ids of a document."""
+
+    @abc.abstractmethod
+    def delete_document(self, doc_id: str):
+        """Remove every clause of a document."""
+
+    @abc.abstractmethod
+    def ids(self, doc_id: str):
+        """Return the clause ids stored for a document."""
+
+    @abc.abstractmethod
+    def count(self, doc_id: str) -> int:
+        """Return the number of clauses stored for a document."""
+
+    @abc.abstractmethod
+    def query(self, doc_id: str, embeddings, top_k: int):
+        """Return one hit list per query embedding, nearest first."""
+
+    @abc.abstractmethod
+    def search(self, embedding, top_k: int, tenant: str = None, doc_ids=None):
+        """Return the nearest clauses across documents."""
+
+    @abc.abstractmethod
+    def get(self, doc_id: str, include_embeddings: bool = False):
+        """Return {'ids','texts','metadatas','embeddings'} for every clause of a document."""
+
+    def persist(self):
+        """Flush pending writes to disk (a no-op for backends that write through)."""
+
+
+# --- Chroma ---
+
+def shard_name(doc_id: str) -> str:
+    if COLLECTION_SHARDS <= 1:
+        return SHARED_COLLECTION
+    return f"{SHARED_COLLECTION}_{zlib.crc32(doc_id.encode('utf-8')) % COLLECTION_SHARDS}"
+
+
+def shard_names():
+    if COLLECTION_SHARDS <= 1:
+        return [SHARED_COLLECTION]
+    return [f"{SHARED_COLLECTION}_{i}" for i in range(COLLECTION_SHARDS)]
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma-backed store.
+
+    layout="per_document": one collection per doc_id, ids are clause ids.
+    layout="shared": all clauses in SHARED_COLLECTION (optionally sharded by
+    doc_id), ids are "<doc_id>::<clause_id>" and reads filter on doc_id.
+    """
+
+    def __init__(self, layout: str = VECTOR_LAYOUT):
+        self.shared = layout == "shared"
+
+    def _collection(self, doc_id: str):
+        from backend.services.embedder import get_or_create_collection
+        return get_or_create_collection(shard_name(doc_id) if self.shared else doc_id)
+
+    def _vector_id(self, doc_id: str, clause_id: str) -> str:
+        return f"{doc_id}::{clause_id}" if self.shared else clause_id
+
+    def _where(self, doc_id: str):
+        return {"doc_id": doc_id} if self.shared else None
+
+    @staticmethod
+    def _hits(res, row: int = 0):
+        hits = []
+        metadatas = res.get("metadatas") or [[]]
+        for i, cid in enumerate(res.get("ids", [[]])[row]):
+            meta = metadatas[row][i] if metadatas[row] else {}
+            hits.append({
+                "clause_id": (meta or {}).get("clause_id", cid),
+                "text": res["documents"][row][i],
+                "metadata": meta,
+                "distance": res.get("distances", [[]])[row][i]
+            })
+        return hits
+
+    def add(self, doc_id, ids, texts, embeddings, metadatas):
+        col = self._collection(doc_id)
+        vids = [self._vector_id(doc_id, cid) for cid in ids]
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        col.upsert(documents=list(texts), metadatas=list(metadatas), ids=vids, embeddings=embeddings)
+
+    def delete(self, doc_id, ids):
+        if ids:
+            self._collection(doc_id).delete(ids=[self._vector_id(doc_id, cid) for cid in ids])
+
+    def delete_document(self, doc_id):
+        from backend.services.embedder import get_client
+        try:
+            if self.shared:
+                self._collection(doc_id).delete(where=self._where(doc_id))
+            else:
+                get_client().delete_collection(name=doc_id)
+        except Exception:
+            pass
+
+    def ids(self, doc_id):
+        kwargs = {"where": self._where(doc_id)} if self.shared else {}
+        try:
+            res = self._collection(doc_id).get(include=["metadatas"], **kwargs)
+        except Exception:
+            return []
+        metas = res.get("metadatas") or [{} for _ in res["ids"]]
+        return [(m or {}).get("clause_id", vid) for vid, m in zip(res["ids"], metas)]
+
+    def count(self, doc_id):
+        try:
+            if self.shared:
+                return len(self._collection(doc_id).get(where=self._where(doc_id), include=[])["ids"])
+            return self._collection(doc_id).count()
+        except Exception:
+            return 0
+
+    def query(self, doc_id, embeddings, top_k):
+        kwargs = {"where": self._where(doc_id)} if self.shared else {}
+        embeddings = np.asarray(embeddings, dtype=np.float32).tolist()
+        res = self._collection(doc_id).query(query_embeddings=embeddings, n_results=top_k, **kwargs)
+        return [self._hits(res, row) for row in range(len(embeddings))]
+
+    def search(self, embedding, top_k, tenant=None, doc_ids=None):
+        from backend.services.embedder import get_or_create_collection
+        q = [np.asarray(embedding, dtype=np.float32).tolist()]
+        hits = []
+        if self.shared:
+            conds = []
+            if tenant:
+                conds.append({"tenant": tenant})
+            if doc_ids:
+                conds.append({"doc_id": {"$in": list(doc_ids)}})
+            kwargs = {}
+            if conds:
+                kwargs["where"] = conds[0] if len(conds) == 1 else {"$and": conds}
+            names = shard_names() if not doc_ids else sorted({shard_name(d) for d in doc_ids})
+            for name in names:
+                col = get_or_create_collection(name)
+                hits.extend(self._hits(col.query(query_embeddings=q, n_results=top_k, **kwargs)))
+        else:
+            if not doc_ids:
+                raise ValueError("cross-document search without doc_ids requires VECTOR_LAYOUT=shared")
+            for doc_id in doc_ids:
+                hits.extend(self.query(doc_id, q, top_k)[0])
+        hits.sort(key=lambda h: h["distance"])
+        return hits[:top_k]
+
+    def get(self, doc_id, include_embeddings=False):
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        kwargs = {"where": self._where(doc_id)} if self.shared else {}
+        res = self._collection(doc_id).get(include=include, **kwargs)
+        metas = res.get("metadatas") or [{} for _ in res["ids"]]
+        out = {
+            "ids": [(m or {}).get("clause_id", vid) for vid, m in zip(res["ids"], metas)],
+            "texts": list(res.get("documents") or []),
+            "metadatas": metas,
+            "embeddings": None,
+        }
+        if include_embeddings:
+            embs = res.get("embeddings")
+            out["embeddings"] = np.asarray(embs if embs is not None else [], dtype=np.float32)
+        return out
+
+    def persist(self):
+        from backend.services.embedder import get_client
+        if not CHROMA_PERSIST_DIR:
+            return
+        try:
+            get_client().persist()
+        except Exception:
+            pass
+
+
+# --- NumPy ---
+
+def _normalize(m):
+    m = np.asarray(m, dtype=np.float32)
+    if m.ndim == 1:
+        m = m[None, :]
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _scores(matrix, q, chunk_rows: int = 8192):
+    """Cosine scores of q (m, d) against matrix (n, d) as float32 (m, n).
+
+    float16 matrices are upcast a block of rows at a time: numpy has no fast
+    half-precision GEMM, and upcasting the whole matrix would undo the memory
+    saving.
+    """
+    if matrix.dtype == np.float32:
+        return q @ np.asarray(matrix).T
+    out = np.empty((len(q), len(matrix)), dtype=np.float32)
+    for s in range(0, len(matrix), chunk_rows):
+        out[:, s:s + chunk_rows] = q @ np.asarray(matrix[s:s + chunk_rows], dtype=np.float32).T
+    return out
+
+
+class _DocIndex:
+    """Immutable snapshot of one document's index.
+
+    Writers never modify a snapshot; they build a new one and swap it into
+    the store under the lock, so a reader holding a snapshot always sees ids,
+    texts and matrix rows that line up.
+    """
+    __slots__ = ("ids", "texts", "metadatas", "matrix")
+
+    def __init__(self, ids, texts, metadatas, matrix):
+        self.ids = tuple(ids)
+        self.texts = tuple(texts)
+        self.metadatas = tuple(metadatas)
+        self.matrix = matrix
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact in-memory index: one contiguous normalized matrix per document.
+
+    Top-k is a single matrix-vector product followed by `argpartition`.
+    `persist()` writes each changed document to <root>/<doc>/embeddings.npy
+    plus meta.json; documents are loaded lazily with np.load(mmap_mode="r"),
+    so a cold document costs one mmap rather than a full read.
+
+    Queries run without the lock on the document snapshot they started with;
+    writes publish a new snapshot (see _DocIndex).
+    """
+
+    def __init__(self, root=NUMPY_INDEX_DIR, dtype=NUMPY_INDEX_DTYPE):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self._docs = {}
+        self._dirty = set()  # doc_ids changed since the last persist()
+        self._lock = threading.RLock()
+
+    def _dir(self, doc_id: str) -> Path:
+        return self.root / quote(doc_id, safe="")
+
+    def _load(self, doc_id: str):
+        with self._lock:
+            idx = self._docs.get(doc_id)
+            if idx is not None:
+                return idx
+            d = self._dir(doc_id)
+            if not (d / "meta.json").exists():
+                return None
+            with (d / "meta.json").open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(d / "embeddings.npy", mmap_mode="r")
+            idx = _DocIndex(meta["ids"], meta["texts"], meta["metadatas"], matrix)
+            self._docs[doc_id] = idx
+            return idx
+
+    def add(self, doc_id, ids, texts, embeddings, metadatas):
+        ids, texts, metadatas = list(ids), list(texts), list(metadatas)
+        new = _normalize(embeddings).astype(self.dtype)
+        with self._lock:
+            idx = self._load(doc_id)
+            if idx is None:
+                idx = _DocIndex([], [], [], np.zeros((0, new.shape[1]), dtype=self.dtype))
+            idx = self._without(idx, set(ids))
+            self._docs[doc_id] = _DocIndex(
+                idx.ids + tuple(ids), idx.texts + tuple(texts), idx.metadatas + tuple(metadatas),
+                np.ascontiguousarray(np.concatenate([np.asarray(idx.matrix), new])),
+            )
+            self._dirty.add(doc_id)
+
+    @staticmethod
+    def _without(idx: _DocIndex, ids: set) -> _DocIndex:
+        """Return a snapshot of `idx` without the given clause ids (`idx` itself if none are present)."""
+        if not ids & set(idx.ids):
+            return idx
+        return NumpyVectorStore._rows(idx, [i for i, cid in enumerate(idx.ids) if cid not in ids])
+
+    @staticmethod
+    def _rows(idx: _DocIndex, keep) -> _DocIndex:
+        return _DocIndex([idx.ids[i] for i in keep], [idx.texts[i] for i in keep],
+                         [idx.metadatas[i] for i in keep], np.asarray(idx.matrix)[keep])
+
+    def delete(self, doc_id, ids):
+        with self._lock:
+            idx = self._load(doc_id)
+            if idx is None:
+                return
+            new = self._without(idx, set(ids))
+            if new is not idx:
+                self._docs[doc_id] = new
+                self._dirty.add(doc_id)
+
+    def delete_document(self, doc_id):
+        with self._lock:
+            self._docs.pop(doc_id, None)
+            self._dirty.discard(doc_id)
+            d = self._dir(doc_id)
+            for name in ("embeddings.npy", "meta.json"):
+                try:
+                    (d / name).unlink()
+                except FileNotFoundError:
+                    pass
+            try:
+                d.rmdir()
+            except OSError:
+                pass
+
+    def ids(self, doc_id):
+        idx = self._load(doc_id)
+        return list(idx.ids) if idx is not None else []
+
+    def count(self, doc_id):
+        idx = self._load(doc_id)
+        return len(idx.ids) if idx is not None else 0
+
+    def _topk(self, idx: _DocIndex, q, top_k: int):
+        n = len(idx.ids)
+        if n == 0 or top_k <= 0:
+            return [[] for _ in range(len(q))]
+        k = min(top_k, n)
+        scores = _scores(idx.matrix, q)
+        if k < n:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n), (len(q), 1))
+        results = []
+        for row, cand in enumerate(part):
+            order = cand[np.argsort(-scores[row, cand], kind="stable")]
+            results.append([{
+                "clause_id": idx.ids[i],
+                "text": idx.texts[i],
+                "metadata": idx.metadatas[i],
+                "distance": float(2.0 - 2.0 * scores[row, i]),
+            } for i in order])
+        return results
+
+    def query(self, doc_id, embeddings, top_k):
+        q = _normalize(embeddings)
+        idx = self._load(doc_id)
+        if idx is None:
+            return [[] for _ in range(len(q))]
+        return self._topk(idx, q, top_k)
+
+    def _doc_ids(self):
+        on_disk = {unquote(p.name) for p in self.root.iterdir() if (p / "meta.json").exists()}
+        return sorted(on_disk | set(self._docs))
+
+    def search(self, embedding, top_k, tenant=None, doc_ids=None):
+        q = _normalize(embedding)
+        hits = []
+        for doc_id in (doc_ids or self._doc_ids()):
+            idx = self._load(doc_id)
+            if idx is None:
+                continue
+            if tenant:
+                keep = [i for i, m in enumerate(idx.metadatas) if (m or {}).get("tenant") == tenant]
+                if not keep:
+                    continue
+                if len(keep) < len(idx.ids):
+                    idx = self._rows(idx, keep)
+            hits.extend(self._topk(idx, q, top_k)[0])
+        hits.sort(key=lambda h: h["distance"])
+        return hits[:top_k]
+
+    def get(self, doc_id, include_embeddings=False):
+        idx = self._load(doc_id)
+        if idx is None:
+            return {"ids": [], "texts": [], "metadatas": [], "embeddings": None}
+        return {
+            "ids": list(idx.ids),
+            "texts": list(idx.texts),
+            "metadatas": list(idx.metadatas),
+            "embeddings": np.asarray(idx.matrix, dtype=np.float32) if include_embeddings else None,
+        }
+
+    def persist(self):
+        with self._lock:
+            for doc_id in sorted(self._dirty):
+                idx = self._docs[doc_id]
+                d = self._dir(doc_id)
+                d.mkdir(parents=True, exist_ok=True)
+                np.save(d / "embeddings.tmp.npy", np.asarray(idx.matrix))
+                os.replace(d / "embeddings.tmp.npy", d / "embeddings.npy")
+                tmp = d / "meta.json.tmp"
+                with tmp.open("w", encoding="utf-8") as f:
+                    json.dump({"ids": idx.ids, "texts": idx.texts, "metadatas": idx.metadatas}, f,
+                              ensure_ascii=False)
+                os.replace(tmp, d / "meta.json")
+                self._docs[doc_id] = _DocIndex(idx.ids, idx.texts, idx.metadatas,
+                                               np.load(d / "embeddings.npy", mmap_mode="r"))
+            self._dirty.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VECTOR_BACKEND == "numpy":
+                    _store = NumpyVectorStore()
+                elif VECTOR_BACKEND == "chroma":
+                    _store = ChromaVectorStore()
+                else:
+                    raise ValueError(f"unknown VECTOR_BACKEND {VECTOR_BACKEND!r}")
+    return _store
@@ -0,0 +1,59 @@
+"""Compare serial and parallel page extraction in parse_document_simple.
+
+The bundled SampleContract-Shuttle.pdf is replicated up to the requested
+page counts in a temporary directory, then both modes are timed.
+
+    python -m benchmarks.bench_parser --pages 100 500 2000 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+
+from backend.config import BASE_DIR
+from backend.services.parser import parse_document_simple
+
+SAMPLE_PDF = BASE_DIR / "data" / "uploads" / "SampleContract-Shuttle.pdf"
+
+
+def build_pdf(n_pages: int, out: Path) -> Path:
+    with fitz.open(str(SAMPLE_PDF)) as src, fitz.open() as dst:
+        while dst.page_count < n_pages:
+            take = min(src.page_count, n_pages - dst.page_count)
+            dst.insert_pdf(src, from_page=0, to_page=take - 1)
+        dst.save(str(out))
+    return out
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, nargs="+", default=[100, 500, 2000])
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'pages':>7} {'serial s':>10} {'parallel s':>11} {'speedup':>8} {'clauses':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.pages:
+            pdf = build_pdf(n, Path(tmp) / f"bench_{n}.pdf")
+            t_serial, serial = timed(lambda: parse_document_simple(pdf, parallel=False), args.repeat)
+            t_par, par = timed(lambda: parse_document_simple(pdf, parallel=True, workers=args.workers), args.repeat)
+            assert serial == par, "parallel extraction changed the parsed clauses"
+            print(f"{n:>7} {t_serial:>10.3f} {t_par:>11.3f} {t_serial / t_par:>7.2f}x {len(serial):>8}")
+
+
+if __name__ == "__main__":
+    main()
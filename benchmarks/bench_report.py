@@ -0,0 +1,71 @@
+"""Time and peak memory of report rendering for large documents.
+
+Compares the old approach (compile the template string, render the whole
+HTML into one string, write it) with the streamed render_report() used by
+build_and_save_report. Clause texts are synthetic, about 1 KB each.
+
+    python -m benchmarks.bench_report --clauses 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from jinja2 import Template
+
+from backend.reports.report_generator import REPORT_TEMPLATE, render_report
+
+TEXT = ("The Consultant shall indemnify and hold harmless the Commission against all claims arising "
+        "from the performance of this Agreement, including reasonable attorneys' fees. ") * 6
+
+
+def make_document(n: int):
+    clauses = [{"clause_id": f"c{i:016x}", "text": f"{i}. {TEXT}", "position": i + 1} for i in range(n)]
+    flags = [{"clause_id": c["clause_id"], "tag": "Indemnity Mention", "match": "indemnify", "impact": 4,
+              "likelihood": 3, "factors": ["Broad scope"], "mitigation": ["Cap liability"]}
+             for c in clauses[::10]]
+    return clauses, flags
+
+
+def render_string(path, clauses, flags):
+    html = Template(REPORT_TEMPLATE).render(doc_id="bench", clauses=clauses, flags=flags)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def render_streamed(path, clauses, flags):
+    with open(path, "w", encoding="utf-8") as f:
+        render_report(f, "bench", clauses, flags)
+
+
+def measure(fn, path, clauses, flags, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(path, clauses, flags)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(path, clauses, flags)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, os.path.getsize(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clauses", type=int, nargs="+", default=[500, 5000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'clauses':>8} {'mode':>9} {'time s':>8} {'peak MB':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.clauses:
+            clauses, flags = make_document(n)
+            for name, fn in (("string", render_string), ("streamed", render_streamed)):
+                t, peak, size = measure(fn, os.path.join(tmp, f"{name}.html"), clauses, flags, args.repeat)
+                print(f"{n:>8} {name:>9} {t:>8.3f} {peak / 2**20:>8.1f} {size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
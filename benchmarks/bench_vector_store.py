@@ -0,0 +1,87 @@
+"""Compare query latency, recall and memory of the Chroma and NumPy vector stores.
+
+Random unit vectors stand in for clause embeddings so the model is never
+loaded. Each store indexes one document of N clauses and answers the same
+queries; recall@k is measured against exact brute-force search. Memory is
+the embedding matrix size for the NumPy stores and the process RSS growth
+while indexing for Chroma (its index lives outside the Python heap).
+
+    python -m benchmarks.bench_vector_store --clauses 1000 10000 50000 --dim 384
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from backend.services.vector_store import ChromaVectorStore, NumpyVectorStore
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def unit(rng, n, dim):
+    m = rng.standard_normal((n, dim)).astype(np.float32)
+    return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+
+def run(store, doc_id, data, queries, top_k, batch):
+    ids = [f"c{i}" for i in range(len(data))]
+    rss0 = rss_bytes()
+    t0 = time.perf_counter()
+    for s in range(0, len(data), batch):
+        e = slice(s, s + batch)
+        store.add(doc_id, ids[e], ids[e], data[e], [{"doc_id": doc_id, "clause_id": c} for c in ids[e]])
+    store.persist()
+    build = time.perf_counter() - t0
+    mem = rss_bytes() - rss0
+    if isinstance(store, NumpyVectorStore):
+        mem = store._docs[doc_id].matrix.nbytes
+
+    lat, found = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = store.query(doc_id, q[None, :], top_k)[0]
+        lat.append(time.perf_counter() - t0)
+        found.append({int(h["clause_id"][1:]) for h in hits})
+    store.delete_document(doc_id)
+    return build, np.array(lat) * 1000, found, mem
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clauses", type=int, nargs="+", default=[1000, 10000, 50000])
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=5)
+    ap.add_argument("--batch", type=int, default=1000)
+    ap.add_argument("--skip-chroma", action="store_true")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'clauses':>8} {'backend':>14} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'mem MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [("numpy-f32", NumpyVectorStore(f"{tmp}/f32", "float32")),
+                  ("numpy-f16", NumpyVectorStore(f"{tmp}/f16", "float16"))]
+        if not args.skip_chroma:
+            stores.append(("chroma", ChromaVectorStore(layout="per_document")))
+        for n in args.clauses:
+            data = unit(rng, n, args.dim)
+            queries = unit(rng, args.queries, args.dim)
+            exact = np.argsort(-(queries @ data.T), axis=1)[:, :args.top_k]
+            truth = [set(map(int, row)) for row in exact]
+            for name, store in stores:
+                build, lat, found, mem = run(store, f"bench_{n}", data, queries, args.top_k, args.batch)
+                recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+                print(f"{n:>8} {name:>14} {build:>8.2f} {np.percentile(lat, 50):>8.3f} "
+                      f"{np.percentile(lat, 95):>8.3f} {recall:>7.3f} {mem / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,22 +33,47 @@ export default function ChatBox({ API_BASE, docId }) {
     ]);
 
     try {
-      const res = await fetch(`${API_BASE}/query`, {
+      const res = await fetch(`${API_BASE}/query/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ doc_id: docId, query: userQuery, top_k: 4 }),
       });
-      const data = await res.json();
-      
-      setChatHistory((prev) => [
-        ...prev,
-        { 
-          role: "ai", 
-          text: data.answer, 
-          evidence: data.evidence, 
-          timestamp: new Date() 
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+      // Evidence arrives first, then answer tokens as the model produces them
+      const messageId = Date.now();
+      const updateAnswer = (update) =>
+        setChatHistory((prev) =>
+          prev.map((m) => (m.id === messageId ? { ...m, ...update(m) } : m))
+        );
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = (raw.match(/^event: (.*)$/m) || [])[1];
+          const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || "null");
+          if (event === "evidence") {
+            setLoading(false);
+            setChatHistory((prev) => [
+              ...prev,
+              { id: messageId, role: "ai", text: "", evidence: data, timestamp: new Date() }
+            ]);
+          } else if (event === "token") {
+            updateAnswer((m) => ({ text: m.text + data.text }));
+          } else if (event === "done") {
+            updateAnswer(() => ({ text: data.answer }));
+          } else if (event === "error") {
+            throw new Error(data.error);
+          }
         }
-      ]);
+      }
     } catch (error) {
       setChatHistory((prev) => [
         ...prev,
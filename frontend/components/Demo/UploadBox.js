@@ -12,15 +12,13 @@ export default function UploadBox({ API_BASE, onAnalyzed }) {
 
     setLoading(true);
     setUploadProgress(0);
-    const formData = new FormData();
-    formData.append("file", file);
-
     try {
-      // Step 1: Upload the file
+      // Step 1: Upload the file as the raw request body, which the server streams to disk
       setUploadProgress(25);
-      const uploadRes = await fetch(`${API_BASE}/upload`, {
+      const uploadRes = await fetch(`${API_BASE}/upload?filename=${encodeURIComponent(file.name)}`, {
         method: "POST",
-        body: formData,
+        headers: { "Content-Type": "application/octet-stream" },
+        body: file,
       });
       const uploadData = await uploadRes.json();
       if (!uploadRes.ok) throw uploadData;
@@ -36,8 +34,20 @@ export default function UploadBox({ API_BASE, onAnalyzed }) {
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ filename }),
       });
-      const analyzeData = await analyzeRes.json();
-      if (!analyzeRes.ok) throw analyzeData;
+      const analyzeJob = await analyzeRes.json();
+      if (!analyzeRes.ok) throw analyzeJob;
+
+      // Step 3: Poll the background job until the analysis finishes
+      let job = analyzeJob;
+      while (job.status !== "done") {
+        if (job.status === "failed") throw new Error(job.error || "Analysis failed");
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobRes = await fetch(`${API_BASE}/jobs/${job.job_id}`);
+        job = await jobRes.json();
+        if (!jobRes.ok) throw job;
+        setUploadProgress(50 + Math.round((job.progress || 0) * 50));
+      }
+      const analyzeData = job.result;
 
       setUploadProgress(100);
 
@@ -46,7 +56,7 @@ export default function UploadBox({ API_BASE, onAnalyzed }) {
         docId: analyzeData.doc_id || filename,
         results: {
           ...analyzeData,
-          report: `${API_BASE}/report/${encodeURIComponent(filename)}`
+          report: `${API_BASE}/report/${encodeURIComponent(filename)}/view`
         }
       });
     } catch (err) {
@@ -10,6 +10,8 @@ run_app.py - single-file runnable AI Legal Analyzer MVP
 import os
 import re
 import json
+import threading
+import importlib.util
 from pathlib import Path
 from flask_cors import CORS
 from flask import Flask, request, jsonify, send_file
@@ -21,10 +23,9 @@ try:
 except Exception as e:
     raise RuntimeError("Missing dependency 'pymupdf' (fitz). pip install pymupdf") from e
 
-try:
-    from sentence_transformers import SentenceTransformer
-except Exception as e:
-    raise RuntimeError("Missing 'sentence-transformers'. pip install sentence-transformers (and torch)") from e
+# sentence-transformers (and torch) are only checked here; they are imported on first use
+if importlib.util.find_spec("sentence_transformers") is None:
+    raise RuntimeError("Missing 'sentence-transformers'. pip install sentence-transformers (and torch)")
 
 try:
     import chromadb
@@ -43,16 +44,21 @@ except Exception:
     raise RuntimeError("Missing 'requests'. pip install requests")
 
 try:
-    from jinja2 import Template
+    from jinja2 import DictLoader, Environment
 except Exception:
     raise RuntimeError("Missing 'jinja2'. pip install jinja2")
 
+from backend.services.embedding_cache import encode_cached
+from backend.services.answer_cache import answer_key, get_answer_cache
+from backend.services.llm_client import get_llm_client, LLMError
+
 # --- Configuration ---
 BASE_DIR = Path(__file__).parent.resolve()
 UPLOAD_DIR = BASE_DIR / "data" / "uploads"
 REPORTS_DIR = BASE_DIR / "data" / "reports"
 CHROMA_PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR", None)  # optional
 EMBED_MODEL = os.environ.get("EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_SERVER_SOCKET = os.environ.get("EMBED_SERVER_SOCKET", None)  # optional shared embedding server
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", None)
 GROQ_URL = os.environ.get("GROQ_URL", "https://api.groq.com/openai/v1/chat/completions")
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "compound-beta")
@@ -63,22 +69,75 @@ REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 if CHROMA_PERSIST_DIR:
     Path(CHROMA_PERSIST_DIR).mkdir(parents=True, exist_ok=True)
 
-# --- Init embedding model ---
-print("Loading embedding model:", EMBED_MODEL)
-sbert = SentenceTransformer(EMBED_MODEL)
+# --- Embedding model & chromadb client (created lazily on first use) ---
+_sbert = None
+_client = None
+_sbert_lock = threading.Lock()
+_client_lock = threading.Lock()
+
+def get_sbert():
+    global _sbert
+    if _sbert is None:
+        with _sbert_lock:
+            if _sbert is None:
+                from sentence_transformers import SentenceTransformer
+                print("Loading embedding model:", EMBED_MODEL)
+                _sbert = SentenceTransformer(EMBED_MODEL)
+    return _sbert
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # best-effort across versions
+                try:
+                    if CHROMA_PERSIST_DIR:
+                        _client = chromadb.Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=CHROMA_PERSIST_DIR))
+                    else:
+                        _client = chromadb.Client()
+                except Exception:
+                    # fallback
+                    _client = chromadb.Client()
+    return _client
+
+_embed_client = None
+_embed_client_lock = threading.Lock()
+
+def get_embed_client():
+    # model lives in the shared server process (python -m backend.services.embed_server)
+    global _embed_client
+    if _embed_client is None:
+        with _embed_client_lock:
+            if _embed_client is None:
+                from backend.services.embed_server import EmbedClient
+                _embed_client = EmbedClient(EMBED_SERVER_SOCKET)
+    return _embed_client
+
+def embed(texts):
+    if EMBED_SERVER_SOCKET:
+        return get_embed_client().encode(texts)
+    return get_sbert().encode(list(texts), show_progress_bar=False)
+
+def embedder_ready():
+    # with an embedding server, ask it: a client object existing says nothing about the server
+    if EMBED_SERVER_SOCKET:
+        try:
+            return bool(get_embed_client().ping().get("ok"))
+        except Exception:
+            return False
+    return _sbert is not None
 
-# --- Init chromadb client (best-effort across versions) ---
-try:
-    if CHROMA_PERSIST_DIR:
-        client = chromadb.Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=CHROMA_PERSIST_DIR))
-    else:
-        client = chromadb.Client()
-except Exception:
-    # fallback
-    client = chromadb.Client()
+def warm_up():
+    """Load model and client in the background so the first request doesn't pay for it."""
+    def run():
+        get_client()
+        embed(["warm-up"])
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
 
 def get_or_create_collection(name: str):
     # Cover multiple chroma versions
+    client = get_client()
     try:
         return client.get_or_create_collection(name=name)
     except AttributeError:
@@ -140,7 +199,7 @@ def index_clauses(doc_id: str, clauses):
     col = get_or_create_collection(doc_id)
     ids = [c["clause_id"] for c in clauses]
     docs = [c["text"] for c in clauses]
-    embeddings = sbert.encode(docs, show_progress_bar=False).tolist()
+    embeddings = encode_cached(embed, EMBED_MODEL, docs).tolist()
     metadatas = [{"doc_id": doc_id} for _ in clauses]
 
     # attempt to delete existing docs with same ids (best-effort)
@@ -157,7 +216,7 @@ def index_clauses(doc_id: str, clauses):
     col.add(documents=docs, metadatas=metadatas, ids=ids, embeddings=embeddings)
     if CHROMA_PERSIST_DIR:
         try:
-            client.persist()
+            get_client().persist()
         except Exception:
             pass
 
@@ -166,7 +225,7 @@ def retrieve(doc_id: str, query: str, top_k: int = 3):
     Return list of hits: {'clause_id','text','metadata','distance'}
     """
     col = get_or_create_collection(doc_id)
-    q_emb = sbert.encode([query])[0].tolist()
+    q_emb = embed([query])[0].tolist()
     res = col.query(query_embeddings=[q_emb], n_results=top_k)
     hits = []
     ids = res.get("ids", [[]])[0]
@@ -182,6 +241,16 @@ def retrieve(doc_id: str, query: str, top_k: int = 3):
         })
     return hits
 
+def evidence_only_answer(hits, reason: str):
+    ev_parts = []
+    for h in hits:
+        cleaned_text = h['text'][:400].replace("\n", " ")  # replace newline safely
+        ev_parts.append(f"[{h['clause_id']}]: {cleaned_text}")
+
+    ev = "\n\n".join(ev_parts)
+
+    return f"({reason}) Evidence returned:\n\n{ev}"
+
 def generate_with_groq(query: str, hits):
     """
     If GROQ_API_KEY is set, call Groq OpenAI-compatible endpoint.
@@ -189,14 +258,7 @@ def generate_with_groq(query: str, hits):
     """
     if not GROQ_API_KEY:
         # return stub - useful for testing pipeline without Groq
-        ev_parts = []
-        for h in hits:
-            cleaned_text = h['text'][:400].replace("\n", " ")  # replace newline safely
-            ev_parts.append(f"[{h['clause_id']}]: {cleaned_text}")
-
-        ev = "\n\n".join(ev_parts)
-
-        return f"(GROQ_API_KEY not set) Evidence returned:\n\n{ev}"
+        return evidence_only_answer(hits, "GROQ_API_KEY not set")
 
     evidence_lines = []
     for h in hits:
@@ -219,15 +281,21 @@ def generate_with_groq(query: str, hits):
         "max_tokens": 512,
         "temperature": 0.0
     }
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    r = requests.post(GROQ_URL, json=payload, headers=headers, timeout=60)
-    r.raise_for_status()
-    resp = r.json()
-    # extract assistant content using OpenAI-like format
+    # deterministic request - serve repeats from the answer cache
+    cache = get_answer_cache()
+    key = answer_key(GROQ_MODEL, system_msg["content"], query, hits,
+                     {"max_tokens": payload["max_tokens"], "temperature": payload["temperature"]})
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    # pooled session with retries; falls back to evidence when the backend is unavailable
     try:
-        return resp["choices"][0]["message"]["content"]
-    except Exception:
-        return resp
+        answer = get_llm_client().chat(payload)
+    except LLMError:
+        return evidence_only_answer(hits, "LLM unavailable")
+    cache.put(key, answer)
+    return answer
 
 def scan_clauses(clauses):
     flags = []
@@ -617,12 +685,18 @@ REPORT_TEMPLATE = """
 """
 
 
+_report_env = Environment(loader=DictLoader({"report.html": REPORT_TEMPLATE}), auto_reload=False)
+
+
 def build_and_save_report(doc_id: str, clauses, flags):
-    tpl = Template(REPORT_TEMPLATE)
-    html = tpl.render(doc_id=doc_id, clauses=clauses[:30], flags=flags)
+    # Stream every clause straight to disk; the template is compiled once per process
     out_path = REPORTS_DIR / f"{doc_id}.html"
-    with out_path.open("w", encoding="utf-8") as f:
-        f.write(html)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    stream = _report_env.get_template("report.html").stream(doc_id=doc_id, clauses=clauses, flags=flags)
+    stream.enable_buffering(64)
+    with tmp_path.open("w", encoding="utf-8") as f:
+        stream.dump(f)
+    os.replace(tmp_path, out_path)
     return str(out_path)
 
 # --- Flask app & routes ---
@@ -633,6 +707,13 @@ CORS(app)
 def health():
     return jsonify({"status": "ok"})
 
+@app.route("/readyz", methods=["GET"])
+def ready():
+    # ready once the embedding model and vector store are loaded
+    if embedder_ready() and _client is not None:
+        return jsonify({"status": "ready"})
+    return jsonify({"status": "warming_up"}), 503
+
 @app.route("/upload", methods=["POST"])
 def upload():
     print("Upload route hit!")
@@ -642,7 +723,13 @@ def upload():
     
     fname = secure_filename(f.filename)
     save_to = UPLOAD_DIR / fname
-    f.save(save_to)
+    # Names in UPLOAD_DIR may be hard links into the backend's blob store: never write them in place
+    tmp = save_to.with_name(f".{fname}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        f.save(tmp)
+        os.replace(tmp, save_to)
+    finally:
+        tmp.unlink(missing_ok=True)
     
     return jsonify({"success": True, "filename": fname}), 200
 
@@ -719,4 +806,5 @@ def handle_exception(e):
 
 if __name__ == "__main__":
     # run
+    warm_up()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,1544 @@
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+import zlib
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+np = pytest.importorskip("numpy")
+
+from backend.services import (
+    analysis, compare, embedder, embedding_cache, generation, jobs, lexical_index, manifest, parser, pipeline,
+    reranker, retriever, risk_analysis, vector_store,
+)
+from backend.services.answer_cache import AnswerCache
+from backend.services.llm_client import LLMClient, LLMError, CircuitOpenError
+
+HITS = [
+    {"clause_id": "c1", "text": "Either party may terminate with 60 days notice."},
+    {"clause_id": "c2", "text": "Fees are payable within 30 days of invoice."},
+]
+
+
+@pytest.fixture
+def llm_server():
+    """Local stand-in for the Groq OpenAI-compatible chat completions endpoint.
+
+    Append HTTP status codes to `server.script` to make the next requests fail,
+    or "invalid-json" to answer 200 with a body that is not JSON.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        requests_seen = []
+        client_ports = []
+        script = []
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            Handler.requests_seen.append(body)
+            Handler.client_ports.append(self.client_address[1])
+            status = Handler.script.pop(0) if Handler.script else 200
+            content = f"answer #{len(Handler.requests_seen)}"
+            content_type = "application/json"
+            if status == "invalid-json":
+                status, out = 200, "<html>bad gateway</html>"
+            elif status != 200:
+                out = json.dumps({"error": "unavailable"})
+            elif body.get("stream"):
+                chunks = [{"choices": [{"delta": {"content": piece}}]} for piece in content.split(" ")]
+                chunks[1]["choices"][0]["delta"]["content"] = " " + chunks[1]["choices"][0]["delta"]["content"]
+                out = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+                content_type = "text/event-stream"
+            else:
+                out = json.dumps({"choices": [{"message": {"content": content}}]})
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.requests_seen = Handler.requests_seen
+    server.client_ports = Handler.client_ports
+    server.script = Handler.script
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    yield server
+    server.shutdown()
+
+
+def make_client(server, **kwargs):
+    kwargs = {"backoff_base": 0.01, "backoff_max": 0.05, **kwargs}
+    return LLMClient(server.url, "test-key", **kwargs)
+
+
+@pytest.fixture
+def groq_stub(llm_server, tmp_path, monkeypatch):
+    cache = AnswerCache(tmp_path / "answers.sqlite3", ttl=60, max_bytes=1 << 20)
+    client = make_client(llm_server, breaker_threshold=2, breaker_cooldown=60)
+    monkeypatch.setattr(generation, "GROQ_API_KEY", "test-key")
+    monkeypatch.setattr(generation, "get_llm_client", lambda: client)
+    monkeypatch.setattr(generation, "get_answer_cache", lambda: cache)
+    return llm_server, cache
+
+
+def test_repeated_question_is_served_from_answer_cache(groq_stub):
+    server, cache = groq_stub
+    first = generation.generate_answer("What is the notice period?", HITS)
+    second = generation.generate_answer("What is the notice period?", HITS)
+    assert first == second == "answer #1"
+    assert len(server.requests_seen) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_changed_evidence_misses_answer_cache(groq_stub):
+    server, _ = groq_stub
+    generation.generate_answer("What is the notice period?", HITS)
+    edited = [dict(HITS[0], text="Either party may terminate with 90 days notice."), HITS[1]]
+    assert generation.generate_answer("What is the notice period?", edited) == "answer #2"
+    assert len(server.requests_seen) == 2
+
+
+def test_expired_answers_are_not_served(tmp_path):
+    cache = AnswerCache(tmp_path / "answers.sqlite3", ttl=-1, max_bytes=1 << 20)
+    cache.put("k", "stale")
+    assert cache.get("k") is None
+
+
+def test_llm_client_retries_transient_errors(llm_server):
+    llm_server.script.extend([503, 429])
+    client = make_client(llm_server)
+    assert client.chat({"messages": []}) == "answer #3"
+    stats = client.stats()
+    assert stats["retries"] == 2 and stats["successes"] == 1 and stats["failures"] == 0
+
+
+def test_llm_client_reuses_pooled_connection(llm_server):
+    client = make_client(llm_server)
+    for _ in range(3):
+        client.chat({"messages": []})
+    assert len(set(llm_server.client_ports)) == 1
+
+
+def test_llm_client_does_not_retry_client_errors(llm_server):
+    llm_server.script.append(400)
+    client = make_client(llm_server)
+    with pytest.raises(LLMError):
+        client.chat({"messages": []})
+    assert len(llm_server.requests_seen) == 1
+
+
+def test_malformed_json_body_falls_back_to_evidence(groq_stub):
+    server, _ = groq_stub
+    server.script.append("invalid-json")
+    answer = generation.generate_answer("What is the notice period?", HITS)
+    assert answer.startswith("(LLM unavailable)") and "[c1]" in answer
+    assert generation.generate_answer("What is the notice period?", HITS) == "answer #2"
+
+
+def test_client_errors_do_not_trip_the_circuit(llm_server):
+    client = make_client(llm_server, breaker_threshold=2, breaker_cooldown=60, max_retries=0)
+    llm_server.script.extend([400, 404, 422, 429])
+    for _ in range(4):
+        with pytest.raises(LLMError):
+            client.chat({"messages": []})
+    assert client.breaker.state == "closed" and client.breaker.failures == 0
+    assert client.chat({"messages": []}).startswith("answer")
+
+
+def test_timeouts_count_towards_the_circuit(llm_server, monkeypatch):
+    client = make_client(llm_server, breaker_threshold=2, breaker_cooldown=60, max_retries=0)
+
+    def timeout(*args, **kwargs):
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(client.session, "post", timeout)
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.chat({"messages": []})
+    assert client.breaker.state == "open"
+
+
+def test_unexpected_error_in_half_open_trial_frees_the_breaker(llm_server, monkeypatch):
+    client = make_client(llm_server, breaker_threshold=1, breaker_cooldown=0, max_retries=0)
+    llm_server.script.append(500)
+    with pytest.raises(LLMError):
+        client.chat({"messages": []})
+    assert client.breaker.state == "half_open"
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(client.session, "post", broken)
+    with pytest.raises(RuntimeError):
+        client.chat({"messages": []})
+    monkeypatch.undo()
+    assert client.chat({"messages": []}).startswith("answer")
+    assert client.breaker.state == "closed"
+
+
+def test_open_circuit_falls_back_to_evidence(groq_stub):
+    server, _ = groq_stub
+    server.script.extend([500] * 8)
+    for _ in range(2):
+        answer = generation.generate_answer("What is the notice period?", HITS)
+        assert answer.startswith("(LLM unavailable)") and "[c1]" in answer
+    seen = len(server.requests_seen)
+    assert generation.generate_answer("Who pays fees?", HITS).startswith("(LLM unavailable)")
+    assert len(server.requests_seen) == seen
+    with pytest.raises(CircuitOpenError):
+        generation.get_llm_client().chat({"messages": []})
+
+
+def test_stream_answer_yields_pieces_and_caches_result(groq_stub):
+    server, cache = groq_stub
+    pieces = list(generation.stream_answer("What is the notice period?", HITS))
+    assert pieces == ["answer", " #1"]
+    assert server.requests_seen[0]["stream"] is True
+    assert list(generation.stream_answer("What is the notice period?", HITS)) == ["answer #1"]
+    assert generation.generate_answer("What is the notice period?", HITS) == "answer #1"
+    assert len(server.requests_seen) == 1
+
+
+def test_stream_holds_its_slot_and_breaker_trial_until_consumed(llm_server):
+    client = make_client(llm_server, max_concurrency=1, breaker_threshold=1, breaker_cooldown=0, max_retries=0)
+    llm_server.script.append(503)
+    with pytest.raises(LLMError):
+        client.chat({"messages": []})
+    assert client.breaker.state == "half_open"
+
+    stream = client.stream_chat({"messages": []})
+    assert next(stream) == "answer"
+    assert not client._slots.acquire(blocking=False)
+    with pytest.raises(CircuitOpenError):  # the stream is the half-open trial
+        client.chat({"messages": []})
+    assert list(stream) == [" #2"]
+    assert client.breaker.state == "closed"
+    assert client._slots.acquire(blocking=False)
+    client._slots.release()
+
+    stream = client.stream_chat({"messages": []})
+    next(stream)
+    stream.close()  # consumer gave up early
+    assert client._slots.acquire(blocking=False)
+    client._slots.release()
+    assert client.stats()["successes"] == 2 and client.stats()["failures"] == 1
+
+
+def test_request_exceptions_are_wrapped_in_llm_error(llm_server, monkeypatch):
+    client = make_client(llm_server, breaker_threshold=1, breaker_cooldown=60, max_retries=1)
+
+    def cut_off(self, *args, **kwargs):
+        yield 'data: {"choices": [{"delta": {"content": "answer"}}]}'
+        raise requests.exceptions.ChunkedEncodingError("connection broken mid-chunk")
+
+    with monkeypatch.context() as m:
+        m.setattr(requests.Response, "iter_lines", cut_off)
+        stream = client.stream_chat({"messages": []})
+        assert next(stream) == "answer"
+        with pytest.raises(LLMError, match="interrupted"):
+            next(stream)
+    assert client.breaker.state == "open"
+    assert client._slots.acquire(blocking=False)
+    client._slots.release()
+
+    client = make_client(llm_server, max_retries=2)
+    calls = []
+
+    def broken(*args, **kwargs):
+        calls.append(1)
+        raise requests.exceptions.InvalidURL("no host")
+
+    monkeypatch.setattr(client.session, "post", broken)
+    with pytest.raises(LLMError):
+        client.chat({"messages": []})
+    assert len(calls) == 1 and client.breaker.failures == 0
+
+
+def test_submit_right_after_a_failed_job_does_not_break_pruning(monkeypatch):
+    manager = jobs.JobManager(workers=1, max_queue=4, result_ttl=60, history_max=10)
+    submitted = []
+
+    def submit_in_the_gap():
+        # Runs in the worker between the job turning "failed" and the worker finishing up
+        try:
+            submitted.append(manager.submit(lambda progress: "ok"))
+        except Exception as e:
+            submitted.append(e)
+
+    monkeypatch.setattr(jobs.traceback, "print_exc", submit_in_the_gap)
+
+    def fail(progress):
+        raise RuntimeError("boom")
+
+    failed = manager.submit(fail)
+    manager._queue.join()
+    assert failed.status == "failed" and failed.finished_at is not None
+    assert len(submitted) == 1 and isinstance(submitted[0], jobs.Job)
+    assert submitted[0].status == "done" and submitted[0].result == "ok"
+
+
+def _join_then_split(text, max_clause_chars):
+    """The list-based parser iter_clauses replaced: join every page, then split and chunk."""
+    parts = [p.strip() for p in re.split(r"\n{2,}|\r\n{2,}", text) if p.strip()]
+    return [part[start:start + max_clause_chars] for part in parts for start in range(0, len(part), max_clause_chars)]
+
+
+def _random_contract(rng):
+    words = ["party", "shall", "terminate", "notice", "fees", "liability", "indemnify", "term"]
+    out = []
+    for _ in range(rng.randint(5, 40)):
+        out.append(" ".join(rng.choice(words) for _ in range(rng.randint(0, 40))))
+        out.append(rng.choice(["\n\n", "\n\n\n", "\n", " \n\n ", "\r\n\r\n", "\n \n"]))
+    return "".join(out)
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_streaming_parser_matches_list_parser_across_block_boundaries(seed, tmp_path, monkeypatch):
+    rng = random.Random(seed)
+    text = _random_contract(rng)
+    path = tmp_path / "contract.txt"
+    path.write_text(text, encoding="utf-8", newline="")
+    block = rng.randint(1, 64)
+    monkeypatch.setattr(parser, "_text_segments", lambda p: (text[i:i + block] for i in range(0, len(text), block)))
+    max_chars = rng.choice([7, 30, 2000])
+
+    clauses = list(parser.iter_clauses(path, max_clause_chars=max_chars))
+    assert [c["text"] for c in clauses] == _join_then_split(text, max_chars)
+    assert [c["position"] for c in clauses] == list(range(1, len(clauses) + 1))
+    assert len({c["clause_id"] for c in clauses}) == len(clauses)
+
+
+def test_streaming_parser_matches_list_parser_on_pdf_pages(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    rng = random.Random(7)
+    path = tmp_path / "contract.pdf"
+    with fitz.open() as doc:
+        for _ in range(6):
+            page = doc.new_page()
+            lines = [" ".join(rng.choice(["fees", "notice", "term"]) for _ in range(8)) if rng.random() < 0.7 else ""
+                     for _ in range(20)]
+            page.insert_text((72, 72), "\n".join(lines))
+        doc.save(str(path))
+
+    joined = "\n".join(parser.extract_pages(path, parallel=False))
+    streamed = [c["text"] for c in parser.iter_clauses(path, max_clause_chars=40, parallel=False)]
+    assert streamed == _join_then_split(joined, 40)
+    assert [c["text"] for c in parser.parse_document_simple(path, 40, parallel=False)] == streamed
+
+
+def _scan_rule_by_rule(rules, clauses):
+    """The per-rule loop the combined scanner replaced: one re.search per rule per clause."""
+    flags = []
+    for c in clauses:
+        for r in rules:
+            if re.search(r["pattern"], c["text"], re.IGNORECASE):
+                details = {k: v for k, v in r.items() if k not in ("tag", "pattern")}
+                flags.append({"clause_id": c["clause_id"], "tag": r["tag"], "match": c["text"], **details})
+    return flags
+
+
+def _random_clauses(rng, fragments, n=300):
+    filler = ["the", "party", "shall", "pay", "fees", "within", "days", "no", "limit", "renew"]
+    clauses = []
+    for i in range(n):
+        words = [rng.choice(filler) for _ in range(rng.randint(0, 12))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randint(0, len(words)), rng.choice(fragments))
+        text = " ".join(words)
+        clauses.append({"clause_id": f"c{i}", "text": text.upper() if rng.random() < 0.2 else text})
+    return clauses
+
+
+def test_combined_risk_scanner_matches_rule_by_rule_scan():
+    rules, _ = risk_analysis.load_rules()
+    fragments = ["unlimited liability", "no cap on liability", "no limit", "automatically renew",
+                 "automatic renew", "renew unless", "indemnify", "indemnification", "no limits apply"]
+    clauses = _random_clauses(random.Random(3), fragments)
+    expected = _scan_rule_by_rule(rules, clauses)
+    assert risk_analysis.scan_clauses(clauses) == expected
+    assert {f["tag"] for f in expected} == {r["tag"] for r in rules}
+
+
+def test_combined_risk_scanner_finds_rules_overlapping_at_the_same_position():
+    rules = [{"tag": t, "pattern": p, "impact": t} for t, p in
+             [("a", "no limit"), ("b", "no lim"), ("c", "limit(ed)?"), ("d", "no"), ("e", "zzz")]]
+    scanner = risk_analysis.RiskScanner(rules)
+    clauses = _random_clauses(random.Random(4), ["no limit", "no limited", "NO LIM", "zzz"])
+    assert scanner.scan(clauses) == _scan_rule_by_rule(rules, clauses)
+    assert scanner.match_rules("there is no limit") == [0, 1, 2, 3]
+    assert risk_analysis.RiskScanner([]).scan(clauses) == []
+
+
+def test_vector_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        vector_store.VectorStore()
+
+
+def test_numpy_store_queries_stay_consistent_under_concurrent_writes(tmp_path):
+    store = vector_store.NumpyVectorStore(tmp_path)
+    rng = np.random.default_rng(0)
+    n, dim = 200, 16
+    ids = [f"c{i}" for i in range(n)]
+    emb = rng.normal(size=(n, dim)).astype(np.float32)
+    store.add("doc", ids, [f"text of {cid}" for cid in ids], emb, [{"clause_id": cid} for cid in ids])
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            drop = [f"c{i}" for i in rng.choice(n, 20, replace=False)]
+            store.delete("doc", drop)
+            rows = [int(cid[1:]) for cid in drop]
+            store.add("doc", drop, [f"text of {cid}" for cid in drop], emb[rows], [{"clause_id": cid} for cid in drop])
+            if rng.random() < 0.1:
+                store.persist()
+
+    def reader():
+        q = np.random.default_rng().normal(size=(4, dim))
+        while not stop.is_set():
+            try:
+                for hits in store.query("doc", q, 10):
+                    assert all(h["text"] == f"text of {h['clause_id']}" for h in hits)
+                store.search(q[0], 5, doc_ids=["doc"])
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(1.0)
+    stop.set()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sorted(store.ids("doc")) == sorted(ids)
+
+
+class _FakeCollection:
+    """Just enough of a Chroma collection: ids, where filters and L2 queries."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = {}  # id -> (document, metadata, embedding)
+
+    @staticmethod
+    def _match(meta, where):
+        if not where:
+            return True
+        if "$and" in where:
+            return all(_FakeCollection._match(meta, w) for w in where["$and"])
+        (key, cond), = where.items()
+        if isinstance(cond, dict):
+            return meta.get(key) in cond["$in"]
+        return meta.get(key) == cond
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        for vid, doc, meta, emb in zip(ids, documents, metadatas, embeddings):
+            self.rows[vid] = (doc, dict(meta), np.asarray(emb, dtype=np.float32))
+
+    def add(self, ids, **kwargs):
+        assert not set(ids) & set(self.rows), "Chroma ignores add() for existing ids"
+        self.upsert(ids, **kwargs)
+
+    def delete(self, ids=None, where=None):
+        for vid in [v for v, (_, m, _) in self.rows.items() if (ids is None or v in ids) and self._match(m, where)]:
+            del self.rows[vid]
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, include=(), where=None, limit=None, offset=0):
+        ids = [v for v, (_, m, _) in self.rows.items() if self._match(m, where)][offset:]
+        ids = ids[:limit] if limit else ids
+        return {"ids": ids, "documents": [self.rows[v][0] for v in ids],
+                "metadatas": [self.rows[v][1] for v in ids], "embeddings": [self.rows[v][2] for v in ids]}
+
+    def query(self, query_embeddings, n_results, where=None):
+        ids = [v for v, (_, m, _) in self.rows.items() if self._match(m, where)]
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in np.asarray(query_embeddings, dtype=np.float32):
+            dist = {v: float(np.sum((self.rows[v][2] - q) ** 2)) for v in ids}
+            best = sorted(ids, key=dist.get)[:n_results]
+            out["ids"].append(best)
+            out["documents"].append([self.rows[v][0] for v in best])
+            out["metadatas"].append([self.rows[v][1] for v in best])
+            out["distances"].append([dist[v] for v in best])
+        return out
+
+
+class _FakeChroma:
+    def __init__(self):
+        self.collections = {}
+
+    def get_or_create_collection(self, name):
+        return self.collections.setdefault(name, _FakeCollection(name))
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def list_collections(self):
+        return list(self.collections)
+
+    def delete_collection(self, name):
+        del self.collections[name]
+
+
+@pytest.fixture
+def fake_chroma(monkeypatch):
+    from backend.services import migrate_collections
+
+    client = _FakeChroma()
+    for module in (embedder, migrate_collections):
+        monkeypatch.setattr(module, "get_client", lambda: client)
+        monkeypatch.setattr(module, "get_or_create_collection", client.get_or_create_collection)
+    monkeypatch.setattr(vector_store, "COLLECTION_SHARDS", 3)
+    return client
+
+
+def _index(store, doc_id, texts, tenant="default"):
+    clauses = [{"clause_id": f"c{i}", "text": t} for i, t in enumerate(texts)]
+    retriever.add_clauses(doc_id, clauses, fake_encode(texts), tenant=tenant, store=store)
+
+
+def test_chroma_shared_layout_round_trip(fake_chroma):
+    store = vector_store.ChromaVectorStore("shared")
+    _index(store, "a.pdf", ["alpha one", "alpha two", "alpha three"])
+    _index(store, "b.pdf", ["beta one", "beta two"])
+    for name, col in fake_chroma.collections.items():
+        assert all(vector_store.shard_name(m["doc_id"]) == name for _, m, _ in col.rows.values())
+    assert sum(len(c.rows) for c in fake_chroma.collections.values()) == 5
+    assert sorted(store.ids("a.pdf")) == ["c0", "c1", "c2"] and store.count("b.pdf") == 2
+
+    # re-adding a clause replaces its row instead of leaving the stale one behind
+    _index(store, "a.pdf", ["alpha one, edited"])
+    assert store.count("a.pdf") == 3
+    assert dict(zip(store.get("a.pdf")["ids"], store.get("a.pdf")["texts"]))["c0"] == "alpha one, edited"
+
+    hits = store.query("a.pdf", fake_encode(["alpha two", "beta one"]), 10)
+    assert hits[0][0]["clause_id"] == "c1" and hits[0][0]["distance"] == pytest.approx(0, abs=1e-6)
+    assert all(h["metadata"]["doc_id"] == "a.pdf" for row in hits for h in row)
+
+    store.delete("a.pdf", ["c1"])
+    assert sorted(store.ids("a.pdf")) == ["c0", "c2"]
+    store.delete_document("a.pdf")
+    assert store.ids("a.pdf") == [] and store.count("b.pdf") == 2
+
+
+def test_migrate_collections_copies_per_document_clauses_into_shards(fake_chroma):
+    from backend.services import migrate_collections
+
+    per_doc = vector_store.ChromaVectorStore("per_document")
+    per_doc.add("a.pdf", ["c0", "c1"], ["alpha one", "alpha two"], fake_encode(["alpha one", "alpha two"]), [{}, {}])
+    per_doc.add("b.pdf", ["c0"], ["beta one"], fake_encode(["beta one"]), [{"tenant": "globex"}])
+
+    assert migrate_collections.migrate(tenant="acme", delete_old=True, page_size=1) == {"a.pdf": 2, "b.pdf": 1}
+    assert set(fake_chroma.collections) <= set(vector_store.shard_names())
+    shared = vector_store.ChromaVectorStore("shared")
+    assert sorted(shared.ids("a.pdf")) == ["c0", "c1"] and shared.ids("b.pdf") == ["c0"]
+    assert [m["tenant"] for m in shared.get("a.pdf")["metadatas"]] == ["acme", "acme"]
+    assert shared.get("b.pdf")["metadatas"][0]["tenant"] == "globex"
+    assert migrate_collections.migrate() == {}
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_search_is_filtered_by_tenant(api, fake_chroma, tmp_path, monkeypatch, backend):
+    store = vector_store.ChromaVectorStore("shared") if backend == "chroma" else vector_store.NumpyVectorStore(tmp_path)
+    monkeypatch.setattr(vector_store, "_store", store)
+    monkeypatch.setattr(retriever, "encode_queries", lambda fn, model, texts: fake_encode(texts))
+    _index(store, "a.pdf", ["termination notice"], tenant="acme")
+    _index(store, "b.pdf", ["termination notice"], tenant="globex")
+    # one document holding clauses of both tenants: the filter applies per clause
+    store.add("mixed.pdf", ["m0", "m1"], ["termination notice", "payment terms"],
+              fake_encode(["termination notice", "payment terms"]),
+              [{"doc_id": "mixed.pdf", "clause_id": "m0", "tenant": "globex"},
+               {"doc_id": "mixed.pdf", "clause_id": "m1", "tenant": "acme"}])
+
+    r = api.post("/search", json={"query": "termination notice", "tenant": "acme", "top_k": 5})
+    assert r.status_code == 200
+    assert sorted((h["metadata"]["doc_id"], h["clause_id"]) for h in r.get_json()["hits"]) == \
+        [("a.pdf", "c0"), ("mixed.pdf", "m1")]
+    r = api.post("/search", json={"query": "termination notice", "tenant": "globex", "doc_ids": ["mixed.pdf"]})
+    assert [h["clause_id"] for h in r.get_json()["hits"]] == ["m0"]
+    r = api.post("/search", json={"query": "termination notice", "top_k": 5})
+    assert len(r.get_json()["hits"]) == 4
+
+
+def test_readiness_does_not_need_chroma_with_numpy_backend(monkeypatch):
+    def no_chroma():
+        raise AssertionError("Chroma client requested with VECTOR_BACKEND=numpy")
+
+    monkeypatch.setattr(embedder, "VECTOR_BACKEND", "numpy")
+    monkeypatch.setattr(embedder, "EMBED_SERVER_SOCKET", None)
+    monkeypatch.setattr(embedder, "_client", None)
+    monkeypatch.setattr(embedder, "_model", None)
+    monkeypatch.setattr(embedder, "get_client", no_chroma)
+
+    def load_model(texts):
+        embedder._model = object()  # restored by monkeypatch
+
+    monkeypatch.setattr(embedder, "encode", load_model)
+    assert not embedder.is_ready()
+    embedder.warm_up(background=False)
+    assert embedder.is_ready()
+
+    monkeypatch.setattr(embedder, "VECTOR_BACKEND", "chroma")
+    assert not embedder.is_ready()
+
+
+def _numbers(texts):
+    """Batch fn for MicroBatcher tests: row i is [int(texts[i]), len(texts)]."""
+    if "bad" in texts:
+        raise ValueError("cannot encode 'bad'")
+    return np.array([[int(t), len(texts)] for t in texts], dtype=np.float32)
+
+
+def test_micro_batcher_splits_rows_back_to_each_caller():
+    from backend.services.batching import MicroBatcher
+
+    batcher = MicroBatcher(_numbers, max_batch_size=100, max_wait=0.2)
+    requests_ = [[str(i) for i in range(start, start + n)] for start, n in ((0, 3), (10, 1), (20, 4))]
+    futures = [batcher.submit(texts) for texts in requests_]
+    for texts, fut in zip(requests_, futures):
+        out = fut.result(5)
+        assert out[:, 0].tolist() == [int(t) for t in texts]
+        assert set(out[:, 1]) == {8}  # all three requests ran as one batch of 8 texts
+    assert batcher.encode([]).shape == (0, 0)
+
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def caller(i):
+        barrier.wait()
+        results[i] = batcher.encode([str(i), str(100 + i)])[:, 0].tolist()
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: [i, 100 + i] for i in range(8)}
+    assert batcher.stats()["batches"] < 1 + 8
+
+
+def test_micro_batcher_fails_every_waiter_of_a_failed_batch_and_keeps_going():
+    from backend.services.batching import MicroBatcher
+
+    batcher = MicroBatcher(_numbers, max_batch_size=100, max_wait=0.2)
+    futures = [batcher.submit(["1"]), batcher.submit(["bad"]), batcher.submit(["2", "3"])]
+    errors = [fut.exception(5) for fut in futures]
+    assert all(isinstance(e, ValueError) for e in errors) and len({id(e) for e in errors}) == 1
+    assert batcher.encode(["7"])[:, 0].tolist() == [7]
+    assert batcher.stats()["batches"] == 2
+
+
+def test_micro_batcher_stats():
+    from backend.services.batching import MicroBatcher
+
+    batcher = MicroBatcher(_numbers, max_batch_size=4, max_wait=0.2)
+    assert batcher.stats()["queue_wait_ms"] is None and batcher.stats()["mean_batch_size"] is None
+    first = [batcher.submit(["1"]), batcher.submit(["2", "3"])]  # 3 texts -> bucket <=4
+    for fut in first:
+        fut.result(5)
+    batcher.encode([str(i) for i in range(5)])  # one oversized request still runs whole -> <=8
+    stats = batcher.stats()
+    assert (stats["batches"], stats["requests"], stats["items"]) == (2, 3, 8)
+    assert stats["mean_batch_size"] == 4.0
+    assert stats["batch_size_histogram"] == {"<=4": 1, "<=8": 1}
+    waits = stats["queue_wait_ms"]
+    assert set(waits) == {"p50", "p95", "p99", "mean"} and waits["p50"] <= waits["p99"]
+    assert waits["p99"] >= 150  # the first request sat out the 200 ms collection window
+    assert stats["queue_depth"] == 0 and stats["batch_run_ms"]["mean"] >= 0
+
+
+_EMBED_SERVER_SCRIPT = """
+import sys
+import numpy as np
+from backend.services.embed_server import EmbedServer
+
+marker = float(sys.argv[2])
+
+def encode(texts):
+    if "bad" in texts:
+        raise ValueError("cannot encode 'bad'")
+    return np.array([[len(t), marker] for t in texts], dtype=np.float32)
+
+EmbedServer(sys.argv[1], encode, max_batch_size=16, max_wait_ms=1).serve_forever()
+"""
+
+
+def _start_embed_server(path, marker):
+    import os
+    import subprocess
+    from pathlib import Path
+
+    root = Path(__file__).resolve().parents[1]
+    if path.exists():
+        path.unlink()
+    proc = subprocess.Popen([sys.executable, "-c", _EMBED_SERVER_SCRIPT, str(path), str(marker)], cwd=root,
+                            env={**os.environ, "PYTHONPATH": str(root)})
+    deadline = time.monotonic() + 30
+    while not path.exists():
+        assert proc.poll() is None and time.monotonic() < deadline, "embedding server did not start"
+        time.sleep(0.05)
+    return proc
+
+
+def test_embed_server_protocol_and_client_reconnect(tmp_path):
+    import socket
+    from backend.services import embed_server
+
+    path = tmp_path / "embed.sock"
+    server = _start_embed_server(path, 1)
+    try:
+        client = embed_server.EmbedClient(str(path), timeout=10)
+        assert client.ping()["ok"] is True
+        out = client.encode(["a", "bcd", ""])
+        assert out.dtype == np.float32 and out.tolist() == [[1, 1], [3, 1], [0, 1]]
+        with pytest.raises(embed_server.EmbedServerError, match="cannot encode"):
+            client.encode(["bad"])
+        stats = client.stats()
+        assert stats["requests"] == 2 and stats["items"] == 4 and stats["max_batch_size"] == 16
+
+        # the framing on the wire: length-prefixed JSON header, then the raw float32 matrix
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as raw:
+            raw.settimeout(10)
+            raw.connect(str(path))
+            embed_server.send_msg(raw, json.dumps({"op": "encode", "texts": ["xy"]}).encode())
+            header = json.loads(embed_server.recv_msg(raw))
+            assert header == {"ok": True, "shape": [1, 2], "dtype": "float32"}
+            assert np.frombuffer(embed_server.recv_msg(raw), dtype=np.float32).tolist() == [2, 1]
+
+        server.kill()
+        server.wait()
+        server = _start_embed_server(path, 2)
+        # the client's pooled connection went away with the old process; one call reconnects
+        assert client.encode(["ab"]).tolist() == [[2, 2]]
+        assert client.ping()["ok"] is True
+    finally:
+        server.kill()
+        server.wait()
+
+
+def test_embed_client_and_query_batcher_do_not_wait_for_the_model_lock(monkeypatch):
+    monkeypatch.setattr(embedder, "_embed_client", None)
+    monkeypatch.setattr(embedder, "_query_batcher", None)
+    monkeypatch.setattr(embedder, "EMBED_SERVER_SOCKET", "/tmp/unused.sock")
+    got = []
+    with embedder._model_lock:  # as if the model were loading
+        t = threading.Thread(target=lambda: got.extend([embedder.get_embed_client(), embedder.get_query_batcher()]),
+                             daemon=True)
+        t.start()
+        t.join(5)
+    assert len(got) == 2 and all(got)
+
+
+@pytest.fixture
+def api():
+    """Test client for the HTTP routes, without create_app()'s model warm-up."""
+    from flask import Flask
+    from backend.routes.query_routes import query_bp
+    from backend.routes.report_routes import report_bp
+    from backend.routes.upload_routes import upload_bp
+
+    app = Flask(__name__)
+    for bp in (upload_bp, query_bp, report_bp):
+        app.register_blueprint(bp)
+    return app.test_client()
+
+
+@pytest.mark.parametrize("threshold", ["high", None, [0.5], 1.5, -2, "nan"])
+def test_compare_rejects_bad_threshold(api, threshold):
+    r = api.post("/compare", json={"old_doc_id": "a.txt", "new_doc_id": "b.txt", "threshold": threshold})
+    assert r.status_code == 400 and "threshold" in r.get_json()["error"]
+
+
+@pytest.mark.parametrize("top_k", [0, -1, "5x", 2.5, None, True, [3], 10_000])
+@pytest.mark.parametrize("path", ["/query", "/query/stream", "/query/batch", "/search"])
+def test_query_routes_reject_bad_top_k(api, path, top_k):
+    body = {"doc_id": "a.txt", "query": "notice", "questions": ["notice"], "top_k": top_k}
+    r = api.post(path, json=body)
+    assert r.status_code == 400 and "top_k" in r.get_json()["error"]
+
+
+def test_query_batch_fans_out_doc_question_pairs_with_one_encode(api, analyze_env, monkeypatch):
+    from backend.routes import query_routes
+
+    store = vector_store.get_vector_store()
+    store.add("a.pdf", ["a1", "a2"], ["notice period", "payment"], fake_encode(["notice period", "payment"]), [{}, {}])
+    store.add("b.pdf", ["b1"], ["notice period"], fake_encode(["notice period"]), [{}])
+    encoded = []
+    cache = embedding_cache.LRUEmbeddingCache(100, 1 << 20)
+    monkeypatch.setattr(retriever, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(retriever, "encode_query", lambda texts: encoded.append(list(texts)) or fake_encode(texts))
+    monkeypatch.setattr(retriever, "encode_queries",
+                        lambda fn, model, texts: embedding_cache.encode_queries(fn, model, texts, cache))
+    monkeypatch.setattr(query_routes, "generate_answer",
+                        lambda q, hits: f"{q} -> {','.join(h['clause_id'] for h in hits)}")
+
+    r = api.post("/query/batch", json={"doc_ids": ["a.pdf", "b.pdf"], "questions": ["notice period", "payment"],
+                                       "top_k": 1, "rerank": False})
+    assert r.status_code == 200
+    results = r.get_json()["results"]
+    assert [(x["doc_id"], x["query"], x["answer"]) for x in results] == [
+        ("a.pdf", "notice period", "notice period -> a1"),
+        ("a.pdf", "payment", "payment -> a2"),
+        ("b.pdf", "notice period", "notice period -> b1"),
+        ("b.pdf", "payment", "payment -> b1"),
+    ]
+    assert encoded == [["notice period", "payment"]]  # every distinct question encoded in one pass
+
+    monkeypatch.setattr(query_routes, "QUERY_BATCH_MAX", 3)
+    r = api.post("/query/batch", json={"doc_ids": ["a.pdf", "b.pdf"], "questions": ["notice period", "payment"]})
+    assert r.status_code == 400 and "at most 3" in r.get_json()["error"]
+    assert api.post("/query/batch", json={"doc_ids": ["a.pdf"], "questions": []}).status_code == 400
+    assert len(encoded) == 1
+
+
+def test_store_and_retriever_return_nothing_for_non_positive_top_k(analyze_env):
+    store = vector_store.get_vector_store()
+    store.add("doc", ["c1", "c2"], ["one", "two"], fake_encode(["one", "two"]), [{}, {}])
+    q = fake_encode(["one"])
+    for k in (0, -1):
+        assert store.query("doc", q, k) == [[]]
+        assert store.search(q[0], k) == []
+        assert retriever.retrieve_batch([("doc", "one"), ("doc", "two")], top_k=k, rerank=False) == [[], []]
+    assert [h["clause_id"] for h in store.query("doc", q, 1)[0]] == ["c1"]
+
+
+def _best_first(sim, threshold):
+    """Reference greedy matcher: walk all pairs from most to least similar."""
+    pairs, used_r, used_c = [], set(), set()
+    for r, c in sorted(np.ndindex(*sim.shape), key=lambda rc: (-sim[rc], rc)):
+        if sim[r, c] >= threshold and r not in used_r and c not in used_c:
+            pairs.append((r, c))
+            used_r.add(r)
+            used_c.add(c)
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_greedy_alignment_matches_best_first_reference(seed, monkeypatch):
+    monkeypatch.setattr(compare, "linear_sum_assignment", None)
+    rng = np.random.default_rng(seed)
+    sim = rng.uniform(-1, 1, size=(rng.integers(1, 30), rng.integers(1, 30))).astype(np.float32)
+    assert sorted(compare.align(sim, 0.2)) == sorted(_best_first(sim, 0.2))
+
+
+def test_hungarian_alignment_maximizes_total_similarity():
+    pytest.importorskip("scipy")
+    sim = np.array([[0.9, 0.85], [0.85, 0.1]], dtype=np.float32)
+    assert sorted(compare.align(sim, 0.8)) == [(0, 1), (1, 0)]
+    rng = np.random.default_rng(1)
+    sim = rng.uniform(0, 1, size=(12, 9))
+    pairs = compare.align(sim, 0.0)
+    assert len(pairs) == 9 and len({r for r, _ in pairs}) == 9
+    assert sum(sim[r, c] for r, c in pairs) >= sum(sim[r, c] for r, c in _best_first(sim, 0.0)) - 1e-9
+
+
+def test_greedy_alignment_is_one_to_one_and_respects_threshold(monkeypatch):
+    monkeypatch.setattr(compare, "linear_sum_assignment", None)
+    sim = np.array([[0.9, 0.85], [0.85, 0.1]], dtype=np.float32)
+    assert compare.align(sim, 0.8) == [(0, 0)]
+    assert compare.align(sim, 0.95) == []
+    assert compare.align(np.zeros((0, 3), dtype=np.float32), 0.5) == []
+
+
+def test_compare_documents_reports_modified_added_removed_and_flags(tmp_path, monkeypatch):
+    store = vector_store.NumpyVectorStore(tmp_path)
+    monkeypatch.setattr(compare, "get_vector_store", lambda: store)
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(4, 8))
+    old = [{"clause_id": f"o{i}", "text": f"old {i}", "position": i + 1} for i in range(4)]
+    new = [old[0], {"clause_id": "n1", "text": "old 1 reworded", "position": 2},
+           {"clause_id": "n9", "text": "brand new", "position": 3}]
+    store.add("old", [c["clause_id"] for c in old], [c["text"] for c in old], base, [{}] * 4)
+    store.add("new", ["o0", "n1", "n9"], ["old 0", "old 1 reworded", "brand new"],
+              [base[0], base[1] + 0.05 * rng.normal(size=8), -base[2]], [{}] * 3)
+    old_m = {"clauses": old, "flags": [{"clause_id": "o1", "tag": "Auto Renewal"}]}
+    new_m = {"clauses": new, "flags": [{"clause_id": "n1", "tag": "Auto Renewal"},
+                                       {"clause_id": "n9", "tag": "Indemnity Mention"}]}
+
+    out = compare.compare_documents(old_m, new_m, "old", "new", threshold=0.8)
+    assert out["summary"] == {"unchanged": 1, "modified": 1, "added": 1, "removed": 2,
+                              "flags_added": 1, "flags_removed": 0}
+    assert (out["modified"][0]["old_clause_id"], out["modified"][0]["new_clause_id"]) == ("o1", "n1")
+    assert [f["tag"] for f in out["flags_added"]] == ["Indemnity Mention"]
+
+
+BM25_CLAUSES = [
+    ("c1", "The Supplier shall indemnify the Customer against all claims."),
+    ("c2", "Fees are payable within 30 days. Late fees accrue at 1.5% per month on unpaid fees."),
+    ("c3", "This Agreement renews automatically unless either party gives notice under Section 14.2."),
+    ("c4", "Fees, fees and more fees: " + " ".join(["the parties agree"] * 30)),
+]
+
+
+def test_bm25_scores_follow_the_formula():
+    idx = lexical_index.BM25Index.build(*zip(*BM25_CLAUSES))
+    k1, b = 1.2, 0.75
+    tokens = [lexical_index.tokenize(t) for _, t in BM25_CLAUSES]
+    avgdl = sum(map(len, tokens)) / len(tokens)
+    tfs = [toks.count("fees") for toks in tokens]
+    assert tfs == [0, 3, 0, 3]
+    n, df = len(tokens), 2
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    expected = [idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(toks) / avgdl)) for tf, toks in zip(tfs, tokens)]
+    np.testing.assert_allclose(idx.scores("fees", k1, b), expected, rtol=1e-5)
+
+
+def test_bm25_ranking_prefers_rare_terms_and_short_clauses(tmp_path, monkeypatch):
+    idx = lexical_index.BM25Index.build(*zip(*BM25_CLAUSES))
+    # c2 and c4 both mention fees; c4 says it more often but is far longer
+    assert [cid for cid, _, _ in idx.search("fees", 10)] == ["c2", "c4"]
+    assert idx.search("indemnify fees", 1)[0][0] == "c1"
+    assert idx.search("section 14.2", 5)[0][0] == "c3"
+    assert idx.search("warranty", 5) == []
+    assert idx.search("fees", 0) == [] and idx.search("fees", -3) == []
+
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIR", tmp_path)
+    monkeypatch.setattr(lexical_index, "_cache", OrderedDict())
+    lexical_index.build_lexical_index("doc", [{"clause_id": c, "text": t} for c, t in BM25_CLAUSES])
+    loaded = lexical_index.get_lexical_index("doc")
+    assert loaded.search("indemnify fees", 4) == idx.search("indemnify fees", 4)
+
+    lexical_index.build_lexical_index("doc", [{"clause_id": "z1", "text": "warranty disclaimer"}])
+    assert lexical_index.get_lexical_index("doc").search("warranty", 5)[0][0] == "z1"
+    assert [p.name for p in tmp_path.iterdir()] == ["doc"]
+
+
+def test_reciprocal_rank_fusion():
+    vector = [{"clause_id": c, "text": c, "distance": d} for c, d in (("a", 0.1), ("b", 0.2), ("c", 0.3))]
+    lexical = [{"clause_id": c, "text": c, "bm25": s} for c, s in (("c", 9.0), ("d", 5.0), ("b", 1.0))]
+    fused = retriever.fuse(vector, lexical, 4, weight=0.5, k=60)
+    # b and c appear in both rankings and beat a and d, which appear in one
+    assert [h["clause_id"] for h in fused] == ["c", "b", "a", "d"]
+    assert fused[0]["score"] == round(0.5 / 63 + 0.5 / 61, 6)
+    assert fused[0]["bm25"] == 9.0 and fused[0]["distance"] == 0.3
+    assert [h["clause_id"] for h in retriever.fuse(vector, lexical, 3, weight=0.0)] == ["a", "b", "c"]
+    assert [h["clause_id"] for h in retriever.fuse(vector, lexical, 3, weight=1.0)] == ["c", "d", "b"]
+    assert retriever.fuse(vector, lexical, 0) == [] and retriever.fuse(vector, lexical, -1) == []
+
+
+class _FakeCrossEncoder:
+    """Scores a pair by its text length; `delay` seconds per predict call."""
+
+    def __init__(self, name=None, max_length=None, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def predict(self, pairs, **kwargs):
+        self.calls.append(list(pairs))
+        time.sleep(self.delay)
+        return np.array([len(t) for _, t in pairs], dtype=np.float32)
+
+
+def _rerank_items():
+    hits = [{"clause_id": c, "text": t} for c, t in (("a", "x"), ("b", "xxx"), ("c", "xx"))]
+    return [("q1", hits), ("q2", hits[:2])]
+
+
+def test_reranker_orders_by_score_and_skips_while_loading(monkeypatch):
+    r = reranker.Reranker("fake", budget_ms=0)
+    monkeypatch.setattr(r, "warm_up", lambda background=True: None)
+    assert r.rerank_many(_rerank_items(), 2) == [[h for h in _rerank_items()[0][1][:2]], _rerank_items()[1][1]]
+    assert r.stats()["skipped_loading"] == 1 and r.stats()["reranked"] == 0
+
+    r._model = _FakeCrossEncoder()
+    out = r.rerank_many(_rerank_items(), 2)
+    assert [[h["clause_id"] for h in hits] for hits in out] == [["b", "c"], ["b", "a"]]
+    assert r.stats()["reranked"] == 1 and r.stats()["pairs"] == 5
+
+
+def test_reranker_warm_up_predict_is_not_measured(monkeypatch):
+    model = _FakeCrossEncoder(delay=0.05)
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(CrossEncoder=lambda *a, **kw: model))
+    r = reranker.Reranker("fake", budget_ms=1000)
+    r.warm_up(background=False)
+    assert len(model.calls) == 1 and r.stats()["ms_per_pair"] is None
+    model.delay = 0.0
+    r.rerank_many(_rerank_items(), 2, started=time.perf_counter())
+    assert r.stats()["reranked"] == 1 and r.stats()["ms_per_pair"] < 5
+
+
+def test_reranker_recovers_after_a_slow_batch():
+    r = reranker.Reranker("fake", budget_ms=100)
+    r._model = _FakeCrossEncoder(delay=0.5)
+    r.rerank_many(_rerank_items(), 2, started=time.perf_counter())  # one slow outlier
+    assert r.stats()["reranked"] == 1
+    r._model.delay = 0.0
+    fallback = [hits[:2] for _, hits in _rerank_items()]
+    assert r.rerank_many(_rerank_items(), 2, started=time.perf_counter()) == fallback
+    assert r.stats()["skipped_budget"] == 1
+
+    for _ in range(100):
+        r.rerank_many(_rerank_items(), 2, started=time.perf_counter())
+        if r.stats()["reranked"] == 2:
+            break
+    stats = r.stats()
+    assert stats["reranked"] == 2 and 1 < stats["skipped_budget"] < 100
+
+    # a request that already spent its budget upstream is skipped without moving the estimate
+    before = r._sec_per_pair
+    r.rerank_many(_rerank_items(), 2, started=time.perf_counter() - 1.0)
+    assert r._sec_per_pair == before
+
+
+def test_retrieve_batch_does_not_rerank_when_disabled(analyze_env, monkeypatch):
+    r = reranker.Reranker("fake", budget_ms=0)
+    r._model = _FakeCrossEncoder()
+    monkeypatch.setattr(retriever, "get_reranker", lambda: r)
+    monkeypatch.setattr(retriever, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(retriever, "encode_queries", lambda fn, model, texts: fake_encode(texts))
+    vector_store.get_vector_store().add("doc", ["c1", "c2"], ["one", "two"], fake_encode(["one", "two"]), [{}, {}])
+    plain = retriever.retrieve_batch([("doc", "one")], top_k=1, rerank=False)
+    assert [h["clause_id"] for h in plain[0]] == ["c1"] and "rerank_score" not in plain[0][0]
+    assert r._model.calls == []
+    reranked = retriever.retrieve_batch([("doc", "one")], top_k=1)
+    assert "rerank_score" in reranked[0][0] and len(r._model.calls) == 1
+
+
+@pytest.fixture
+def report_dirs(tmp_path, monkeypatch):
+    from backend.reports import report_pages
+    from backend.routes import report_routes
+    from backend.services import manifest
+
+    (tmp_path / "manifests").mkdir()
+    (tmp_path / "reports").mkdir()
+    monkeypatch.setattr(manifest, "MANIFEST_DIR", tmp_path / "manifests")
+    monkeypatch.setattr(report_routes, "REPORTS_DIR", tmp_path / "reports")
+    monkeypatch.setattr(report_pages, "_cache", OrderedDict())
+    return tmp_path
+
+
+def _save_report_manifest(doc_id, n_flags, n_clauses):
+    from backend.services.manifest import save_manifest
+    flags = [{"clause_id": f"c{i}", "tag": "Auto Renewal" if i % 2 else "Indemnity Mention"} for i in range(n_flags)]
+    clauses = [{"clause_id": f"c{i}", "text": f"clause {i}"} for i in range(n_clauses)]
+    save_manifest(doc_id, {"clauses": clauses, "flags": flags})
+
+
+def test_report_pages_are_bounded(api, report_dirs, monkeypatch):
+    from backend.routes import report_routes
+    monkeypatch.setattr(report_routes, "REPORT_PAGE_MAX", 7)
+    _save_report_manifest("doc.txt", 25, 3)
+
+    pg = api.get("/report/doc.txt/flags?offset=20&limit=7").get_json()
+    assert (pg["offset"], pg["limit"], pg["total"]) == (20, 7, 25)
+    assert [f["clause_id"] for f in pg["items"]] == ["c20", "c21", "c22", "c23", "c24"]
+    assert api.get("/report/doc.txt/flags?offset=99").get_json()["items"] == []
+    pg = api.get("/report/doc.txt/flags?offset=-5&limit=500").get_json()
+    assert (pg["offset"], pg["limit"], len(pg["items"])) == (0, 7, 7)
+    assert api.get("/report/doc.txt/clauses?limit=0").get_json()["limit"] == 1
+    assert api.get("/report/doc.txt/clauses?offset=x").status_code == 400
+    assert api.get("/report/doc.txt/risks").status_code == 404
+    assert api.get("/report/missing.txt/clauses").status_code == 404
+    assert api.get("/report/doc.txt/summary").get_json() == {
+        "doc_id": "doc.txt", "num_clauses": 3, "num_flags": 25,
+        "flags_by_tag": {"Indemnity Mention": 13, "Auto Renewal": 12}}
+
+
+def test_report_etags_revalidate_until_the_manifest_changes(api, report_dirs):
+    _save_report_manifest("doc.txt", 4, 4)
+    first = api.get("/report/doc.txt/flags?limit=2")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    again = api.get("/report/doc.txt/flags?limit=2", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    other = api.get("/report/doc.txt/flags?limit=3", headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+    _save_report_manifest("doc.txt", 5, 4)
+    changed = api.get("/report/doc.txt/flags?limit=2", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.get_json()["total"] == 5
+    shell_etag = api.get("/report/doc.txt/view").headers["ETag"]
+    assert api.get("/report/doc.txt/view", headers={"If-None-Match": shell_etag}).status_code == 304
+
+
+def test_report_serves_the_best_fresh_precompressed_variant(api, report_dirs):
+    import gzip
+    import os
+    from backend.reports import report_generator
+
+    html = report_dirs / "reports" / "doc.txt.html"
+    html.write_text("<html>" + "clause " * 500 + "</html>", encoding="utf-8")
+    report_generator.precompress(html)
+    br = html.with_name(html.name + ".br")
+    br.write_bytes(b"pretend brotli")  # brotli itself is optional
+
+    r = api.get("/report/doc.txt", headers={"Accept-Encoding": "gzip, br"})
+    assert r.headers["Content-Encoding"] == "br" and r.data == b"pretend brotli"
+    assert "Accept-Encoding" in r.headers["Vary"]
+    r = api.get("/report/doc.txt", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip" and gzip.decompress(r.data) == html.read_bytes()
+    gz_etag = r.headers["ETag"]
+    assert api.get("/report/doc.txt", headers={"Accept-Encoding": "gzip", "If-None-Match": gz_etag}).status_code == 304
+    r = api.get("/report/doc.txt", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in r.headers and r.data == html.read_bytes()
+    assert r.headers["ETag"] != gz_etag
+
+    # A variant older than the HTML (e.g. left over from a previous report) is never served
+    st = html.stat()
+    os.utime(br, ns=(st.st_atime_ns, st.st_mtime_ns - 10**9))
+    r = api.get("/report/doc.txt", headers={"Accept-Encoding": "br, gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert api.get("/report/missing.txt").status_code == 404
+
+
+def test_pipeline_fans_out_every_item_in_order_and_accounts_time():
+    p = pipeline.Pipeline("test-fanout", maxsize=2)
+    p.source("numbers", range(40))
+    p.stage("double", lambda x: 2 * x, after="numbers")
+    p.stage("slow", lambda x: time.sleep(0.005) or -x, after="numbers")
+    p.stage("label", str, after="double")
+    out = p.run()
+    assert out == {"slow": [-x for x in range(40)], "label": [str(2 * x) for x in range(40)]}
+
+    stages = p.stats()["stages"]
+    assert {name: s["items"] for name, s in stages.items()} == {"numbers": 40, "double": 40, "slow": 40, "label": 40}
+    assert stages["slow"]["busy_s"] >= 0.2 > stages["double"]["busy_s"]
+    assert stages["numbers"]["wait_output_s"] > 0.1  # held back by the slow branch's full queue
+    assert stages["label"]["wait_input_s"] > 0.1
+    assert p.stats()["wall_s"] >= stages["slow"]["busy_s"]
+    totals = pipeline.pipeline_stats()["test-fanout"]
+    assert totals["runs"] >= 1 and totals["stages"]["slow"]["items"] >= 40
+
+
+def _closing_source(log, fail_at=None):
+    try:
+        for i in range(10_000):
+            if i == fail_at:
+                raise KeyError("source broke")
+            yield i
+    finally:
+        log.append("closed")
+
+
+def _run_with_timeout(p, timeout=5):
+    result = {}
+
+    def run():
+        try:
+            result["out"] = p.run()
+        except BaseException as e:
+            result["error"] = e
+
+    th = threading.Thread(target=run, daemon=True)
+    th.start()
+    th.join(timeout)
+    assert not th.is_alive(), "pipeline did not stop"
+    return result
+
+
+def test_pipeline_stage_error_aborts_full_queues_and_closes_the_source():
+    log = []
+
+    def boom(x):
+        if x == 3:
+            raise ValueError("stage broke")
+        return x
+
+    p = pipeline.Pipeline("test-stage-error", maxsize=1)
+    p.source("numbers", _closing_source(log))
+    p.stage("check", boom, after="numbers")
+    p.stage("stalled", lambda x: time.sleep(0.05) or x, after="numbers")  # keeps its queue full
+    result = _run_with_timeout(p)
+    assert isinstance(result["error"], ValueError) and str(result["error"]) == "stage broke"
+    assert log == ["closed"]
+    assert p.stats()["stages"]["check"]["items"] == 3
+    assert pipeline.pipeline_stats()["test-stage-error"]["failed"] >= 1
+
+
+def test_pipeline_source_error_is_reraised():
+    log = []
+    p = pipeline.Pipeline("test-source-error", maxsize=1)
+    p.source("numbers", _closing_source(log, fail_at=5))
+    p.stage("copy", lambda x: x, after="numbers")
+    result = _run_with_timeout(p)
+    assert isinstance(result["error"], KeyError) and log == ["closed"]
+    assert p.stats()["stages"]["numbers"]["items"] == 5
+
+
+def fake_encode(texts):
+    """Deterministic stand-in for the embedding model: one pseudo-random unit vector per text."""
+    out = np.stack([np.random.default_rng(zlib.crc32(t.encode("utf-8"))).normal(size=16) for t in texts])
+    return (out / np.linalg.norm(out, axis=1, keepdims=True)).astype(np.float32)
+
+
+@pytest.fixture
+def analyze_env(tmp_path, monkeypatch):
+    """Real analyze pipeline on temporary data directories, a NumPy store and fake_encode."""
+    from backend.reports import report_generator
+
+    for name in ("uploads", "manifests", "lexical", "reports", "vectors"):
+        (tmp_path / name).mkdir(exist_ok=True)
+    monkeypatch.setattr(manifest, "MANIFEST_DIR", tmp_path / "manifests")
+    monkeypatch.setattr(lexical_index, "LEXICAL_INDEX_DIR", tmp_path / "lexical")
+    monkeypatch.setattr(lexical_index, "_cache", OrderedDict())
+    monkeypatch.setattr(report_generator, "REPORTS_DIR", tmp_path / "reports")
+    monkeypatch.setattr(vector_store, "_store", vector_store.NumpyVectorStore(tmp_path / "vectors"))
+    monkeypatch.setattr(retriever, "encode_cached", lambda fn, model, texts: fake_encode(texts))
+    return tmp_path
+
+
+def _contract(*clauses):
+    return "\n\n".join(clauses) + "\n"
+
+
+def test_reused_donor_parse_replaces_stale_index_with_same_clause_count(analyze_env):
+    uploads = analyze_env / "uploads"
+    content_a = _contract("Fees are payable within 30 days.", "This Agreement will automatically renew.")
+    content_b = _contract("The Supplier shall indemnify the Customer.", "Either party may terminate at will.")
+    (uploads / "draft.txt").write_text(content_b, encoding="utf-8")
+    (uploads / "final.txt").write_text(content_a, encoding="utf-8")
+    analysis.analyze_document("draft.txt", uploads / "draft.txt")
+    analysis.analyze_document("final.txt", uploads / "final.txt")
+
+    (uploads / "draft.txt").write_text(content_a, encoding="utf-8")
+    out = analysis.analyze_document("draft.txt", uploads / "draft.txt")
+    assert out["reused_from"] == "final.txt"
+    assert out["index_changes"] == {"added": 2, "removed": 2, "unchanged": 0}
+
+    expected = sorted(parser.parse_document_simple(uploads / "final.txt"), key=lambda c: c["clause_id"])
+    stored = vector_store.get_vector_store().get("draft.txt")
+    assert sorted(zip(stored["ids"], stored["texts"])) == [(c["clause_id"], c["text"]) for c in expected]
+    bm25 = lexical_index.get_lexical_index("draft.txt")
+    assert sorted(bm25.texts) == sorted(c["text"] for c in expected)
+    assert bm25.search("indemnify", 3) == []
+    assert [f["tag"] for f in out["flags"]] == ["Auto Renewal"]
+
+    again = analysis.analyze_document("draft.txt", uploads / "draft.txt")
+    assert again["cached"] and again["index_changes"] is None
+
+
+def test_clause_ids_follow_content_and_reindex_only_touches_changed_clauses(analyze_env):
+    path = analyze_env / "uploads" / "msa.txt"
+    clauses = ["Fees are payable within 30 days.", "Either party may terminate at will.",
+               "This Agreement is governed by Delaware law."]
+    path.write_text(_contract(*clauses), encoding="utf-8")
+    first = analysis.analyze_document("msa.txt", path)
+    assert first["index_changes"] == {"added": 3, "removed": 0, "unchanged": 0}
+    before = {c["text"]: c["clause_id"] for c in parser.parse_document_simple(path)}
+    assert before == {t: parser.clause_id(t) for t in clauses}
+
+    # insert a clause at the top, reword one and repeat one verbatim
+    edited = ["Definitions apply throughout.", clauses[0], "Either party may terminate on 60 days notice.",
+              clauses[2], clauses[0]]
+    path.write_text(_contract(*edited), encoding="utf-8")
+    out = analysis.analyze_document("msa.txt", path)
+    assert out["index_changes"] == {"added": 3, "removed": 1, "unchanged": 2}
+    after = parser.parse_document_simple(path)
+    assert after[1]["clause_id"] == before[clauses[0]] and after[3]["clause_id"] == before[clauses[2]]
+    assert after[4]["clause_id"] == before[clauses[0]] + "-2"
+    stored = vector_store.get_vector_store().get("msa.txt")
+    assert sorted(stored["ids"]) == sorted(c["clause_id"] for c in after)
+
+
+def test_report_lists_every_clause_beyond_the_first_30(tmp_path, monkeypatch):
+    import gzip
+    from backend.reports import report_generator
+
+    monkeypatch.setattr(report_generator, "REPORTS_DIR", tmp_path)
+    clauses = [{"clause_id": f"c{i:03d}", "text": f"Clause {i} text", "position": i}
+               for i in range(75)]
+    flags = [{"clause_id": "c074", "tag": "Auto Renewal", "match": "renews", "impact": "High",
+              "likelihood": "Medium", "factors": ["term"], "mitigation": ["give notice"]}]
+    path = report_generator.build_and_save_report("big.pdf", clauses, flags)
+
+    html = open(path, encoding="utf-8").read()
+    assert re.findall(r'<li id="(c\d+)">', html) == [c["clause_id"] for c in clauses]
+    assert "c074: Clause 74 text" in html
+    assert "Auto Renewal (c074)" in html
+    assert gzip.decompress(open(path + ".gz", "rb").read()).decode("utf-8") == html
+    assert sorted(p.name for p in tmp_path.iterdir())[:2] == ["big.pdf.html", "big.pdf.html.gz"]
+
+
+@pytest.fixture
+def upload_dirs(tmp_path, monkeypatch):
+    from backend.services import upload_store
+
+    dirs = {name: tmp_path / name for name in ("uploads", "blobs", "tmp")}
+    for d in dirs.values():
+        d.mkdir(exist_ok=True)
+    monkeypatch.setattr(upload_store, "UPLOAD_DIR", dirs["uploads"])
+    monkeypatch.setattr(upload_store, "BLOB_DIR", dirs["blobs"])
+    monkeypatch.setattr(upload_store, "UPLOAD_TMP_DIR", dirs["tmp"])
+    monkeypatch.setattr(upload_store, "UPLOAD_CHUNK_SIZE", 7)  # many small reads
+    return dirs
+
+
+def test_multipart_upload_is_streamed_without_the_form_parser(api, upload_dirs, monkeypatch):
+    import io
+    from werkzeug.formparser import FormDataParser
+
+    def spooled(*args, **kwargs):
+        raise AssertionError("request.files would buffer the whole upload")
+
+    monkeypatch.setattr(FormDataParser, "parse", spooled)
+    content = b"Fees are payable within 30 days.\r\n--not-a-boundary\r\n" * 200
+    r = api.post("/upload", data={"note": "v2", "file": (io.BytesIO(content), "terms.txt")},
+                 content_type="multipart/form-data")
+    assert r.status_code == 200 and r.get_json()["filename"] == "terms.txt"
+    assert (upload_dirs["uploads"] / "terms.txt").read_bytes() == content
+    assert r.get_json()["content_hash"] == hashlib.sha256(content).hexdigest()
+
+    r = api.post("/upload?filename=raw.txt", data=content, content_type="application/octet-stream")
+    assert r.status_code == 200 and r.get_json()["deduplicated"]
+    assert list(upload_dirs["tmp"].iterdir()) == []
+
+
+def test_multipart_upload_without_a_file_or_truncated_is_rejected(api, upload_dirs):
+    r = api.post("/upload", data={"note": "no file here"}, content_type="multipart/form-data")
+    assert r.status_code == 400
+    body = (b"--xyz\r\nContent-Disposition: form-data; name=\"file\"; filename=\"cut.txt\"\r\n\r\n"
+            b"the upload stops here")
+    r = api.post("/upload", data=body, content_type="multipart/form-data; boundary=xyz")
+    assert r.status_code == 400
+    assert list(upload_dirs["uploads"].iterdir()) == [] and list(upload_dirs["tmp"].iterdir()) == []
+
+
+def test_blobs_are_read_only_and_replacing_a_name_leaves_them_intact(upload_dirs):
+    import io
+    import os
+    import stat
+    from backend.services import upload_store
+
+    first = upload_store.store_stream(io.BytesIO(b"version one"), "a.txt")
+    upload_store.store_stream(io.BytesIO(b"version one"), "b.txt")
+    blob = upload_store.blob_path(first["content_hash"])
+    assert stat.S_IMODE(blob.stat().st_mode) & 0o222 == 0
+    assert blob.stat().st_nlink == 3
+
+    upload_store.store_stream(io.BytesIO(b"version two"), "a.txt")
+    assert (upload_dirs["uploads"] / "a.txt").read_bytes() == b"version two"
+    assert (upload_dirs["uploads"] / "b.txt").read_bytes() == blob.read_bytes() == b"version one"
+    assert os.path.samefile(upload_dirs["uploads"] / "b.txt", blob)
+
+
+def test_resent_part_replaces_the_old_one_even_while_a_retry_overlaps(upload_dirs):
+    import io
+    from backend.services import upload_store
+
+    upload_id = upload_store.create_session("big.txt")["upload_id"]
+    upload_store.put_part(upload_id, 1, io.BytesIO(b"first attempt, dropped"))
+    upload_store.put_part(upload_id, 2, io.BytesIO(b" and the tail"))
+    upload_store.put_part(upload_id, 1, io.BytesIO(b"head"))
+    info = upload_store.session_info(upload_id)
+    assert info["parts"] == [{"part": 1, "size": 4}, {"part": 2, "size": 13}] and info["received_bytes"] == 17
+
+    class Stalled(io.BytesIO):
+        """Hands out one chunk, then waits until the overlapping retry has finished."""
+
+        def __init__(self, data):
+            super().__init__(data)
+            self.first = True
+
+        def read(self, n=-1):
+            chunk = super().read(n)
+            if self.first:
+                self.first = False
+                started.set()
+                assert retried.wait(5)
+            return chunk
+
+    started, retried = threading.Event(), threading.Event()
+    results = []
+    slow = threading.Thread(target=lambda: results.append(upload_store.put_part(upload_id, 1, Stalled(b"HEAD"))))
+    slow.start()
+    assert started.wait(5)
+    upload_store.put_part(upload_id, 1, io.BytesIO(b"Head, resent by a retry"))
+    retried.set()
+    slow.join()
+
+    # whichever attempt finishes last wins outright; the two are never spliced together
+    assert results and results[0]["size"] == 4
+    upload_store.complete_session(upload_id)
+    assert (upload_dirs["uploads"] / "big.txt").read_bytes() == b"HEAD and the tail"
+
+
+def test_ingest_doc_ids_keep_flattened_paths_apart(tmp_path):
+    import zipfile
+    from backend import ingest
+
+    src = tmp_path / "contracts"
+    (src / "a").mkdir(parents=True)
+    (src / "a" / "b.txt").write_text("nested", encoding="utf-8")
+    (src / "a_b.txt").write_text("top level", encoding="utf-8")
+    ids = [doc_id for doc_id, _, _ in ingest.iter_sources(src)]
+    assert len(set(ids)) == 2 and "a_b.txt" in ids
+    assert all(i.endswith(".txt") for i in ids)
+
+    archive = tmp_path / "contracts.zip"
+    with zipfile.ZipFile(archive, "w") as z:
+        z.writestr("a/b.txt", "nested")
+        z.writestr("a_b.txt", "top level")
+    assert sorted(doc_id for doc_id, _, _ in ingest.iter_sources(archive)) == sorted(ids)
+    assert ingest._doc_id("a\\b.txt") == ingest._doc_id("a/b.txt")
+
+
+def test_ingest_resume_skips_finished_files_and_retries_failed_ones(analyze_env, upload_dirs, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from backend import ingest
+
+    monkeypatch.setattr(ingest, "UPLOAD_DIR", upload_dirs["uploads"])
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", ThreadPoolExecutor)  # keeps the patches above in effect
+    monkeypatch.setattr(ingest, "encode_cached", lambda fn, model, texts: fake_encode(texts))
+    src = analyze_env / "contracts"
+    (src / "nested").mkdir(parents=True)
+    for name, text in [("a.txt", "Fees are payable within 30 days."), ("b.md", "The Supplier shall indemnify."),
+                       ("nested/c.txt", "Either party may terminate."), ("bad.txt", "This one fails first.")]:
+        (src / name).write_text(text, encoding="utf-8")
+    (src / "notes.docx").write_bytes(b"unsupported")
+
+    broken = {"bad.txt"}
+    process = ingest.process_document
+    calls = []
+
+    def flaky(doc_id, path):
+        calls.append(doc_id)
+        if doc_id in broken:
+            raise RuntimeError("parser crashed")
+        return process(doc_id, path)
+
+    monkeypatch.setattr(ingest, "process_document", flaky)
+    checkpoint = analyze_env / "ingest" / "contracts.jsonl"
+    nested = ingest._doc_id("nested/c.txt")
+    run = lambda: ingest.ingest(src, checkpoint, workers=2, embed_batch=2, log=lambda *a: None)
+
+    first = run()
+    assert (first["ok"], first["error"], first["skipped"]) == (3, 1, 0)
+    assert sorted(calls) == ["a.txt", "b.md", "bad.txt", nested]
+    assert ingest.load_checkpoint(checkpoint).keys() == {"a.txt", "b.md", nested}
+
+    broken.clear()
+    calls.clear()
+    second = run()
+    assert (second["ok"], second["error"], second["skipped"]) == (1, 0, 3)
+    assert calls == ["bad.txt"]
+    assert ingest.load_checkpoint(checkpoint).keys() == {"a.txt", "b.md", "bad.txt", nested}
+    assert vector_store.get_vector_store().get("bad.txt")["texts"] == ["This one fails first."]
+    assert manifest.load_manifest("bad.txt")["clauses"][0]["text"] == "This one fails first."
+
+    # A source that changed since its checkpoint record is processed again
+    calls.clear()
+    (src / "a.txt").write_text("Fees are payable within 60 days.", encoding="utf-8")
+    third = run()
+    assert (third["ok"], third["skipped"]) == (1, 3) and calls == ["a.txt"]
+
+
+class _Clock:
+    """Stands in for the time module so LRU order never depends on timer resolution."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1.0
+        return self.now
+
+
+def test_embedding_cache_hits_misses_and_encodes_each_text_once(tmp_path):
+    cache = embedding_cache.EmbeddingCache(tmp_path / "emb.sqlite3", max_bytes=1 << 20)
+    encoded = []
+
+    def encode(texts):
+        encoded.append(list(texts))
+        return fake_encode(texts)
+
+    first = embedding_cache.encode_cached(encode, "model-a", ["fees  due", "notice", "fees due"], cache)
+    assert encoded == [["fees  due", "notice"]]  # whitespace variants share one key
+    np.testing.assert_array_equal(first[0], first[2])
+    again = embedding_cache.encode_cached(encode, "model-a", ["notice", " fees due "], cache)
+    assert len(encoded) == 1
+    np.testing.assert_array_equal(again, first[[1, 0]])
+    embedding_cache.encode_cached(encode, "model-b", ["notice"], cache)
+    assert encoded[-1] == ["notice"]  # keys include the model
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+
+def test_embedding_cache_evicts_least_recently_used_past_byte_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "time", _Clock())
+    vec = np.ones(4, dtype=np.float32)  # 16 bytes each
+    cache = embedding_cache.EmbeddingCache(tmp_path / "emb.sqlite3", max_bytes=48)
+    for key in ("a", "b", "c"):
+        cache.put_many([(key, vec)])
+    assert cache.get_many(["a"]).keys() == {"a"}  # a is now the most recently used
+    cache.put_many([("d", vec)])
+    assert cache.get_many(["a", "b", "c", "d"]).keys() == {"a", "c", "d"}
+    assert cache.stats()["bytes"] == 48 and cache.stats()["entries"] == 3
+
+
+def test_query_cache_normalizes_and_evicts_by_entries_and_bytes():
+    cache = embedding_cache.LRUEmbeddingCache(max_entries=3, max_bytes=1 << 20)
+    encoded = []
+
+    def encode(texts):
+        encoded.append(list(texts))
+        return fake_encode(texts)
+
+    out = embedding_cache.encode_queries(encode, "m", ["notice  period", " notice period\n", "fees"], cache)
+    assert encoded == [["notice period", "fees"]] and out.shape == (3, 16)
+    np.testing.assert_array_equal(out[0], out[1])
+    assert not cache._data[("m", "fees")].flags.writeable  # shared between requests
+
+    embedding_cache.encode_queries(encode, "m", ["a", "b"], cache)  # 4 entries > 3: "notice period" goes
+    embedding_cache.encode_queries(encode, "m", ["fees", "notice period"], cache)
+    assert encoded[-1] == ["notice period"]
+    stats = cache.stats()
+    assert stats["entries"] == 3 and stats["evictions"] == 2 and stats["bytes"] == 3 * 16 * 4
+    assert (stats["hits"], stats["misses"]) == (1, 5) and stats["hit_rate"] == round(1 / 6, 4)
+
+    small = embedding_cache.LRUEmbeddingCache(max_entries=100, max_bytes=2 * 16 * 4)
+    embedding_cache.encode_queries(encode, "m", ["x", "y"], small)
+    embedding_cache.encode_queries(encode, "m", ["x"], small)  # x is now the most recently used
+    embedding_cache.encode_queries(encode, "m", ["z"], small)
+    assert small.get(("m", "y")) is None and small.get(("m", "x")) is not None
+    assert small.stats()["bytes"] == 128 and small.stats()["evictions"] == 1
+
+
+def test_query_cache_stats_are_reported_in_metrics(tmp_path, monkeypatch):
+    from flask import Flask
+    from backend.routes import ops_routes
+
+    cache = embedding_cache.LRUEmbeddingCache(max_entries=10, max_bytes=1 << 20)
+    monkeypatch.setattr(ops_routes, "query_cache", cache)
+    monkeypatch.setattr(ops_routes, "get_embedding_cache",
+                        lambda: embedding_cache.EmbeddingCache(tmp_path / "emb.sqlite3", max_bytes=1 << 20))
+    monkeypatch.setattr(ops_routes, "get_answer_cache",
+                        lambda: AnswerCache(tmp_path / "answers.sqlite3", ttl=60, max_bytes=1 << 20))
+    embedding_cache.encode_queries(fake_encode, "m", ["notice", "notice ", "fees"], cache)
+    embedding_cache.encode_queries(fake_encode, "m", ["fees"], cache)
+
+    app = Flask(__name__)
+    app.register_blueprint(ops_routes.ops_bp)
+    stats = app.test_client().get("/metrics").get_json()["query_embedding_cache"]
+    assert stats == {**cache.stats(), "entries": 2, "hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_parallel_page_extraction_matches_serial(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    path = tmp_path / "long.pdf"
+    with fitz.open() as doc:
+        for i in range(9):
+            doc.new_page().insert_text((72, 72), f"Page {i}: the Supplier shall pay fees.\n\nSection {i}.1 applies.")
+        doc.save(str(path))
+    serial = list(parser.extract_pages(path, parallel=False))
+    parallel = list(parser.extract_pages(path, parallel=True, workers=2, pages_per_task=2))
+    assert len(serial) == 9 and parallel == serial
+    assert parser.available_cpus() >= 1